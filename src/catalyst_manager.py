@@ -1,14 +1,74 @@
+import atexit
 import os
+import queue
 import shutil
+import sqlite3
+import tempfile
+import threading
 import time
 import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from src.memory_cache import MemoryCache
+from src.parse import BIN_PYRAMID_BASE_RADIUS, BinPyramid, TimelineMatrix, get_file_fingerprint, get_temp_path, is_compressed_array_file
 from src.settings.settings import Settings
 
+# Locks between processes sharing the CATALYST directory, msvcrt on Windows and fcntl otherwise
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+    import fcntl
+
+# Version of the tables of the cache manifest, a manifest of another version is rebuilt from the cache directory
+_MANIFEST_VERSION = 3
+
+# Tables of the cache manifest, one row per file in the cache directory with the key parameters encoded in its name,
+# one row per data file with the content fingerprint its cache entries are stored under and the total size of the cache files,
+# kept up to date by triggers so every process sharing the manifest sees the same size
+_MANIFEST_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS cache_files (filename TEXT PRIMARY KEY, data_file_name TEXT, kind TEXT, function INTEGER, area_range REAL, m_z REAL, "
+    "start_value REAL, end_value REAL, size INTEGER NOT NULL, created REAL NOT NULL, last_access REAL NOT NULL, cost REAL)",
+    "CREATE INDEX IF NOT EXISTS cache_files_key ON cache_files (data_file_name, kind, function, area_range)",
+    "CREATE INDEX IF NOT EXISTS cache_files_last_access ON cache_files (last_access)",
+    "CREATE TABLE IF NOT EXISTS data_files (path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, fingerprint TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS cache_size (id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO cache_size (id, size) VALUES (0, 0)",
+    "CREATE TRIGGER IF NOT EXISTS cache_files_insert AFTER INSERT ON cache_files BEGIN UPDATE cache_size SET size = size + NEW.size; END",
+    "CREATE TRIGGER IF NOT EXISTS cache_files_delete AFTER DELETE ON cache_files BEGIN UPDATE cache_size SET size = size - OLD.size; END",
+    "CREATE TRIGGER IF NOT EXISTS cache_files_update AFTER UPDATE OF size ON cache_files BEGIN UPDATE cache_size SET size = size + NEW.size - OLD.size; END"
+)
+
+# Order in which the eviction policies remove cache files, "Cost" removes the files with the lowest computing time per byte first
+CACHE_EVICTION_POLICIES = {
+    "LRU": "last_access",
+    "Largest": "size DESC, last_access",
+    "Cost": "COALESCE(cost, 0.0) / MAX(size, 1), last_access"
+}
+
+# Fraction of the cache threshold the cache is reduced to once it exceeds the threshold, so not every save removes files
+CACHE_LOW_WATER_MARK = 0.8
+
+# Seconds after its last access a file counts as recently used, recently used files are only evicted if the others do not free enough space
+CACHE_RECENT_ACCESS_PERIOD = 60.0
+
+# Seconds after which the cache is checked again if files could not be evicted, e.g. because they are open in another process on Windows
+CACHE_EVICTION_RETRY_DELAY = 60.0
+
+# Maximum number of m/z values looked up with one query of the cache manifest, below the parameter limit of older SQLite versions
+MANIFEST_LOOKUP_BATCH_SIZE = 500
+
+# Maximum size in bytes of the data waiting for the cache writer thread, saving blocks while the queue is full
+CACHE_WRITE_QUEUE_BYTES = 256 * 1024**2
+
 class CATALYST_manager:
     """
         Class to manage the catalyst directory.
     """
-    def __init__(self, catalyst_path: str = "PROGRAMDATA", callback_function = None, error_function = None, cache_threshold: float = 2.0,  log_threshold: float = 0.01):
+    def __init__(self, catalyst_path: str = "PROGRAMDATA", callback_function = None, error_function = None, cache_threshold: float = 2.0,  log_threshold: float = 0.01,
+                 memory_cache_threshold: float = 1.0):
         """
             Class to manage the catalyst directory.
 
@@ -18,6 +78,7 @@ class CATALYST_manager:
                 error_function (function): Callback function to print errors to the GUI or the log. Default is None
                 cache_threshold (float): Maximum size the cache can get in GB. Default is 2.0.
                 log_threshold (float): Maximum size the log can get in GB. Default is 1.0.
+                memory_cache_threshold (float): Maximum size of the parsed scans and timelines kept in memory in GB. Default is 1.0.
 
             Returns:
                 Instance of the class.
@@ -26,6 +87,8 @@ class CATALYST_manager:
         self.CACHE_PATH = f"{self.FOLDER_PATH}\\cache"
         self.LOG_PATH = f"{self.FOLDER_PATH}\\catalyst.log"
         self.SETTINGS_PATH = f"{self.FOLDER_PATH}\\settings.txt"
+        self.MANIFEST_PATH = f"{self.FOLDER_PATH}\\cache_manifest.sqlite"
+        self.LOCK_PATH = f"{self.FOLDER_PATH}\\cache.lock"
 
         self.cache_threshold = max(cache_threshold, 0.0)
         self.log_threshold = max(log_threshold, 0.0)
@@ -35,7 +98,28 @@ class CATALYST_manager:
         self.SETTINGS_VERSION = "1.2"
 
         self.cache_size = 0.0
+        self.cache_bytes = 0
         self.cache_size_valid = False
+        self.cache_compression = False
+        self.cache_eviction_policy = "LRU"
+
+        # Parsed scans and timelines of this session in front of the cache directory, keyed like the cache files
+        self.memory_cache = MemoryCache(memory_cache_threshold)
+
+        # Cache files are written by a background thread, the lock guards the cache shared with it
+        # and holds the lock file of the cache while it is taken, see _lock_cache
+        self.cache_lock = threading.RLock()
+        self.cache_lock_file = None
+        self.cache_lock_depth = 0
+        # Connection to the cache manifest shared by the threads of this instance, opened on first use, see _connect_manifest
+        self.manifest_connection = None
+        self.write_queue = queue.Queue()
+        self.write_queue_bytes = 0
+        self.write_queue_space = threading.Condition()
+        self.writer_thread = None
+        # Timer checking the cache again if it is still larger than its threshold after an eviction
+        self.cache_check_timer = None
+        atexit.register(self.flush_cache_writes)
 
         self.messages = []
 
@@ -64,6 +148,42 @@ class CATALYST_manager:
         self.CallbackFunction(f"New cache threshold is {self.cache_threshold} GB.", "log")
         self.check_cache()
 
+    def set_memory_cache_threshold(self, memory_cache_threshold: float):
+        """
+            Set the maximum size of the memory cache, least recently used entries are removed until it meets the new threshold.
+
+            Parameters:
+                memory_cache_threshold (float): Maximum size of the parsed scans and timelines kept in memory in GB.
+        """
+        if memory_cache_threshold < 0.0:
+            self.CallbackFunction("Parameter 'memory_cache_threshold' can not be negative.", "log")
+        self.memory_cache.set_max_size(memory_cache_threshold)
+        self.CallbackFunction(f"New memory cache threshold is {self.memory_cache.max_size} GB.", "log")
+
+    def set_cache_compression(self, cache_compression: bool):
+        """
+            Set if timeline matrices are compressed with zlib when they are saved to the cache.
+
+            Parameters:
+                cache_compression (bool): Flag to compress timeline matrices.
+        """
+        self.cache_compression = cache_compression
+        self.CallbackFunction(f"Cache compression {'enabled' if cache_compression else 'disabled'}.", "log")
+
+    def set_cache_eviction_policy(self, cache_eviction_policy: str):
+        """
+            Set the policy that selects the files to remove when the cache exceeds its threshold.
+
+            Parameters:
+                cache_eviction_policy (str): "LRU" (least recently used), "Largest" (largest files) or "Cost" (lowest computing time per byte).
+        """
+        if cache_eviction_policy not in CACHE_EVICTION_POLICIES:
+            self.ErrorFunction(f"Unknown cache eviction policy '{cache_eviction_policy}'. Keeping '{self.cache_eviction_policy}'.", "log")
+            return
+
+        self.cache_eviction_policy = cache_eviction_policy
+        self.CallbackFunction(f"Cache eviction policy is {cache_eviction_policy}.", "log")
+
     def set_log_threshold(self, log_threshold: float):
         """
             Set cache threshold and check if the log file still meets the size requirement.
@@ -223,64 +343,246 @@ class CATALYST_manager:
         """
             Clears the cache directory.
         """
-        for file in os.listdir(self.CACHE_PATH):
-            file_path = os.path.join(self.CACHE_PATH, file)
-            try:
-                if os.path.isfile(file_path):
-                    os.unlink(file_path)
-                elif os.path.isdir(file_path):
-                    shutil.rmtree(file_path)
-            except Exception as e:
-                self.ErrorFunction(e, "log show")
+        self.flush_cache_writes()
 
-        self.cache_size = 0.0
-        self.cache_size_valid = True
-        self.CallbackFunction("Cache cleared. New cache size: 0.00 GB.", "log")
+        with self._lock_cache():
+            for file in os.listdir(self.CACHE_PATH):
+                file_path = os.path.join(self.CACHE_PATH, file)
+                try:
+                    if os.path.isfile(file_path):
+                        os.unlink(file_path)
+                    elif os.path.isdir(file_path):
+                        shutil.rmtree(file_path)
+                except Exception as e:
+                    self.ErrorFunction(e, "log show")
+
+            self.rebuild_cache_manifest()
+        self.memory_cache.clear()
+
+        self.CallbackFunction(f"Cache cleared. New cache size: {self.get_cache_size():.2f} GB.", "log")
 
-    def import_cache(self, zip_path: str):
+    def import_cache(self, zip_path: str, data_files: list = None, num_threads: int = None):
         """
-            Extracts a zip folder to the cache.
+            Imports the cache files of a zip file, e.g. exported by export_cache. Files the cache already has are skipped,
+            the others are extracted in parallel and published one by one, so the cache stays usable meanwhile.
+            Timeline matrices and bin pyramids are compressed or decompressed while they are extracted if they do not match the cache compression setting.
 
             Parameters:
                 zip_path (str): Path of the zip file.
+                data_files (list): Paths or cache keys (fingerprints) of the data files to import the cache files of. Default is None for all files.
+                num_threads (int): Number of threads extracting and converting files. Default is None for the number of CPUs.
+
+            Returns:
+                int: Number of imported files.
+
+            Raises:
+                FileNotFoundError: If there is no file at zip_path.
         """
         if not os.path.isfile(zip_path):
             raise FileNotFoundError(f"No file at '{zip_path}' found.")
 
+        start_time = time.time()
+        self.flush_cache_writes()
+
+        keys = None if data_files is None else set(self._get_data_file_keys(data_files))
+        with self._connect_manifest(write=False) as connection:
+            existing = {filename for (filename,) in connection.execute("SELECT filename FROM cache_files")}
+
         with zipfile.ZipFile(zip_path, 'r') as zip_file:
-            zip_file.extractall(self.CACHE_PATH)
+            members = []
+            for member in zip_file.infolist():
+                filename = member.filename
+                # Cache files are directly in the cache directory, other entries are not extracted
+                if member.is_dir() or os.path.basename(filename) != filename or filename.endswith(".tmp"):
+                    continue
+                if filename in existing or os.path.exists(os.path.join(self.CACHE_PATH, filename)):
+                    continue
+                if keys is not None and (self.parse_cache_filename(filename) or {}).get("data_file_name") not in keys:
+                    continue
+                members.append(member)
 
-        self.CallbackFunction("Cache import completed.", "log print")
+            with ThreadPoolExecutor(max_workers=num_threads or os.cpu_count()) as executor:
+                imported = sum(executor.map(lambda member: self._import_cache_file(zip_file, member), members))
+
+        self.CallbackFunction(f"Cache import completed. {imported} files imported in {time.time() - start_time:.2f} seconds.", "log print")
+
+        return imported
+
+    def _import_cache_file(self, zip_file: zipfile.ZipFile, member: zipfile.ZipInfo):
+        """
+            Extracts a file of a zip file to a temporary file and publishes it in the cache directory.
+            Timeline matrices and bin pyramids are rewritten with the cache compression setting if they were written with the other one.
 
+            Parameters:
+                zip_file (zipfile.ZipFile): Opened zip file.
+                member (zipfile.ZipInfo): Entry of the cache file in the zip file.
 
-    def export_cache(self, output_path: str):
+            Returns:
+                bool: True if the file was imported, False otherwise.
         """
-            Exports cache in a zip file to the given path.
+        temp_path = get_temp_path(os.path.join(self.CACHE_PATH, member.filename))
+        converted_path = get_temp_path(os.path.join(self.CACHE_PATH, f"{member.filename}.converted"))
+        try:
+            with zip_file.open(member) as source, open(temp_path, 'wb') as destination:
+                shutil.copyfileobj(source, destination, 1024**2)
+
+            kind = (self.parse_cache_filename(member.filename) or {}).get("kind")
+            if kind in ("matrix", "pyramid"):
+                content, header = (TimelineMatrix if kind == "matrix" else BinPyramid).read(temp_path)
+                if any("compressed_sizes" in spec for spec in header["arrays"].values()) != self.cache_compression:
+                    content.write(converted_path, header, self.cache_compression)
+                # Release the mapped arrays, so the temporary file can be replaced or removed
+                del content
+
+            self._publish_cache_file(member.filename, converted_path if os.path.exists(converted_path) else temp_path, None)
+            return True
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+            self.ErrorFunction(f"Cache file {member.filename} could not be imported. {type(e).__name__}: {e}", "log")
+            return False
+        finally:
+            for path in (temp_path, converted_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def export_cache(self, output_path: str, data_files: list = None, num_threads: int = None):
+        """
+            Exports the cache in a zip file to the given path. The cache files are deflated in parallel and written into the zip file in order.
+            Timeline matrices and bin pyramids which are already compressed with zlib are stored as they are, they are converted on import if necessary.
 
             Parameters:
                 output_path (str): Path to save the zip file to.
+                data_files (list): Paths or cache keys (fingerprints) of the data files to export the cache files of. Default is None for the whole cache.
+                num_threads (int): Number of threads compressing files. Default is None for the number of CPUs.
+
+            Returns:
+                str: Path of the zip file.
         """
+        start_time = time.time()
+        self.flush_cache_writes()
+
+        keys = None if data_files is None else self._get_data_file_keys(data_files)
+        with self._connect_manifest(write=False) as connection:
+            if keys is None:
+                rows = connection.execute("SELECT filename FROM cache_files ORDER BY filename").fetchall()
+            else:
+                rows = connection.execute(f"SELECT filename FROM cache_files WHERE data_file_name IN ({', '.join('?' * len(keys))}) ORDER BY filename", keys).fetchall()
+
         output_zip = os.path.join(output_path, f"catalyst_cache_{time.strftime("%Y-%m-%d_%H-%M-%S")}.zip")
+        num_threads = num_threads or os.cpu_count()
+        exported = 0
+
+        with ThreadPoolExecutor(max_workers=num_threads) as executor, zipfile.ZipFile(output_zip, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            pending = deque()
+            for (filename,) in rows:
+                pending.append((filename, executor.submit(self._compress_export_file, filename)))
+
+                # Write the files in order while the next ones are compressed, so only a few compressed copies wait at once
+                if len(pending) > 2 * num_threads:
+                    exported += self._write_export_file(zip_file, *pending.popleft())
+
+            while pending:
+                exported += self._write_export_file(zip_file, *pending.popleft())
+
+        self.CallbackFunction(f"Cache exported to '{output_path}'. {exported} files exported in {time.time() - start_time:.2f} seconds.", "log print")
+
+        return output_zip
+
+    def _compress_export_file(self, filename: str):
+        """
+            Deflates a cache file for its entry in the export zip file. Timeline matrices and bin pyramids which are already compressed are not deflated again.
+            Small files are compressed in memory, larger ones are spooled to a temporary file.
+
+            Parameters:
+                filename (str): Name of the cache file.
 
-        with zipfile.ZipFile(output_zip, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for root, dirs, files in os.walk(self.CACHE_PATH):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    zip_file.write(file_path, os.path.relpath(file_path, self.CACHE_PATH))
+            Returns:
+                Tuple of the zip file entry and the deflated data, the data is None if the file is stored as it is.
+
+            Raises:
+                OSError: If the file can not be read, e.g. because it was removed meanwhile.
+        """
+        file_path = os.path.join(self.CACHE_PATH, filename)
+        zip_info = zipfile.ZipInfo.from_file(file_path, filename)
+
+        if (self.parse_cache_filename(filename) or {}).get("kind") in ("matrix", "pyramid"):
+            try:
+                if is_compressed_array_file(file_path):
+                    zip_info.compress_type = zipfile.ZIP_STORED
+                    return zip_info, None
+            except ValueError:
+                # Damaged files are deflated like any other file
+                pass
+
+        data = tempfile.SpooledTemporaryFile(max_size=16 * 1024**2)
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+        crc = 0
+        with open(file_path, 'rb') as source:
+            while chunk := source.read(1024**2):
+                crc = zlib.crc32(chunk, crc)
+                data.write(compressor.compress(chunk))
+            zip_info.file_size = source.tell()
+        data.write(compressor.flush())
+
+        zip_info.compress_type = zipfile.ZIP_DEFLATED
+        zip_info.CRC = crc
+        zip_info.compress_size = data.tell()
+        data.seek(0)
+
+        return zip_info, data
+
+    def _write_export_file(self, zip_file: zipfile.ZipFile, filename: str, future):
+        """
+            Writes a cache file prepared by _compress_export_file into the export zip file.
+
+            Parameters:
+                zip_file (zipfile.ZipFile): Zip file opened for writing.
+                filename (str): Name of the cache file.
+                future (concurrent.futures.Future): Future of _compress_export_file for the file.
+
+            Returns:
+                bool: True if the file was written, False otherwise.
+        """
+        try:
+            zip_info, data = future.result()
+            if data is None:
+                zip_file.write(os.path.join(self.CACHE_PATH, filename), filename, zipfile.ZIP_STORED)
+                return True
+
+            with data:
+                # zipfile can not write deflated data, the entry is appended like ZipFile.write does after compressing
+                with zip_file._lock:
+                    zip_file._writecheck(zip_info)
+                    zip_file.fp.seek(zip_file.start_dir)
+                    zip_info.header_offset = zip_file.fp.tell()
+                    zip_file.fp.write(zip_info.FileHeader())
+                    shutil.copyfileobj(data, zip_file.fp, 1024**2)
+                    zip_file.filelist.append(zip_info)
+                    zip_file.NameToInfo[zip_info.filename] = zip_info
+                    zip_file.start_dir = zip_file.fp.tell()
+                    zip_file._didModify = True
+            return True
+        except OSError as e:
+            # File was removed meanwhile, e.g. by another process
+            self.ErrorFunction(f"Cache file {filename} could not be exported. {type(e).__name__}: {e}", "log")
+            return False
+
+    def _get_data_file_keys(self, data_files: list):
+        """
+            Returns the cache keys of data files given by path or by cache key.
 
-        self.CallbackFunction(f"Cache exported to '{output_path}'.", "log print")
+            Parameters:
+                data_files (list): Paths or cache keys (fingerprints) of data files.
+
+            Returns:
+                List of the cache keys.
+        """
+        return [self.get_data_file_key(data_file) if os.path.isfile(data_file) else data_file for data_file in data_files]
 
     def remove_oldest_file(self):
         """
             Removes the oldest file in the cache directory.
         """
-        files = [f for f in os.listdir(self.CACHE_PATH) if os.path.isfile(os.path.join(self.CACHE_PATH, f))]
-        if files:
-            oldest_file = min(files, key=lambda x: os.path.getctime(os.path.join(self.CACHE_PATH, x)))
-            os.remove(os.path.join(self.CACHE_PATH, oldest_file))
-            self.CallbackFunction(f"Oldest file '{oldest_file}' removed from cache.", "log")
-
-        self.cache_size_valid = False
+        self.remove_oldest_files(1)
 
     def remove_oldest_files(self, num_files: int):
         """
@@ -289,20 +591,14 @@ class CATALYST_manager:
             Parameters:
                 num_files (str): The number of files to remove.
         """
-        for _ in range(num_files):
-            self.remove_oldest_file()
+        for oldest_file in self._remove_cache_files("SELECT filename, size FROM cache_files ORDER BY created LIMIT ?", (num_files,)):
+            self.CallbackFunction(f"Oldest file '{oldest_file}' removed from cache.", "log")
 
     def remove_largest_file(self):
         """
             Removes the largest file in the cache directory.
         """
-        files = [f for f in os.listdir(self.CACHE_PATH) if os.path.isfile(os.path.join(self.CACHE_PATH, f))]
-        if files:
-            largest_file = max(files, key=lambda x: os.path.getsize(os.path.join(self.CACHE_PATH, x)))
-            os.remove(os.path.join(self.CACHE_PATH, largest_file))
-            self.CallbackFunction(f"Largest file '{largest_file}' removed from cache.", "log")
-
-        self.cache_size_valid = False
+        self.remove_largest_files(1)
 
     def remove_largest_files(self, num_files: int):
         """
@@ -311,39 +607,101 @@ class CATALYST_manager:
             Parameters:
                 num_files (int): The number of files to remove.
         """
-        for _ in range(num_files):
-            self.remove_oldest_file()
+        for largest_file in self._remove_cache_files("SELECT filename, size FROM cache_files ORDER BY size DESC LIMIT ?", (num_files,)):
+            self.CallbackFunction(f"Largest file '{largest_file}' removed from cache.", "log")
 
     def remove_least_recently_used_file(self):
         """
             Removes the file in the cache folder that has not been used for the longest time.
         """
-        oldest_file = None
-        oldest_access_time = float('inf')
+        self.remove_least_recently_used_files(1)
 
-        for dir_path, dir_names, filenames in os.walk(self.CACHE_PATH):
-            for f in filenames:
-                file_path = os.path.join(dir_path, f)
-                access_time = os.path.getatime(file_path)  # Get latest access
-                if access_time < oldest_access_time:
-                    oldest_access_time = access_time
-                    oldest_file = file_path
+    def remove_least_recently_used_files(self, num_files: int):
+        """
+            Removes the num_files files in the cache folder that has not been used for the longest time.
 
-        if oldest_file:
-            os.remove(oldest_file)
+            Parameters:
+                num_files (int): The number of files to remove.
+        """
+        for oldest_file in self._remove_cache_files("SELECT filename, size FROM cache_files ORDER BY last_access LIMIT ?", (num_files,)):
             self.CallbackFunction(f"Least recently used file '{oldest_file}' removed from cache.", "log")
 
-        self.cache_size_valid = False
+    def evict_cache_files(self, target_size: float):
+        """
+            Removes files chosen by the cache eviction policy in one batch until the cache is not larger than target_size.
+            Files accessed within CACHE_RECENT_ACCESS_PERIOD seconds are only removed if the other files do not free enough space.
+            A process that is reading a removed file keeps its data, files that can not be removed because they are open are skipped.
 
-    def remove_least_recently_used_files(self, num_files: int):
+            Parameters:
+                target_size (float): Size in GB the cache is reduced to.
+
+            Returns:
+                List of the names of the removed files.
         """
-            Removes the num_files files in the cache folder that has not been used for the longest time.
+        with self._connect_manifest() as connection:
+            # Current size including the files other processes saved since it was read last
+            self._update_cache_bytes(connection)
+            excess = self.cache_bytes - target_size * 1024**3
+            if excess <= 0:
+                return []
+
+            # Take files in the order of the policy until they free enough space
+            selected = []
+            freed = 0
+            cursor = connection.execute(f"SELECT filename, size FROM cache_files ORDER BY last_access >= ?, {CACHE_EVICTION_POLICIES[self.cache_eviction_policy]}",
+                                        (time.time() - CACHE_RECENT_ACCESS_PERIOD,))
+            for filename, size in cursor:
+                if freed >= excess:
+                    break
+                selected.append((filename, size))
+                freed += size
+            cursor.close()
+
+            removed = self._delete_cache_files(connection, selected)
+
+        return [filename for filename, _ in removed]
+
+    def _remove_cache_files(self, query: str, parameters: tuple = ()):
+        """
+            Removes the files selected by query from the cache directory and the cache manifest.
 
             Parameters:
-                num_files (int): The number of files to remove.
+                query (str): SELECT statement on the table cache_files returning filename and size.
+                parameters (tuple): Parameters of the query. Default is ().
+
+            Returns:
+                List of the names of the removed files.
         """
-        for _ in range(num_files):
-            self.remove_least_recently_used_file()
+        with self._connect_manifest() as connection:
+            removed = self._delete_cache_files(connection, connection.execute(query, parameters).fetchall())
+
+        return [filename for filename, _ in removed]
+
+    def _delete_cache_files(self, connection, rows: list):
+        """
+            Deletes files from the cache directory and their entries from the cache manifest. Files that are open in another
+            process on Windows can not be deleted and are kept.
+
+            Parameters:
+                connection (sqlite3.Connection): Connection to the cache manifest.
+                rows (list): Tuples of filename and size of the files.
+
+            Returns:
+                List of the tuples of the removed files.
+        """
+        removed = []
+        for filename, size in rows:
+            try:
+                os.remove(os.path.join(self.CACHE_PATH, filename))
+            except FileNotFoundError:
+                pass  # File was already removed outside this class
+            except PermissionError:
+                continue  # File is in use, a later eviction removes it
+            removed.append((filename, size))
+
+        self._unregister_cache_files(connection, [filename for filename, _ in removed])
+
+        return removed
 
     def remove_oldest_lines(self, num_lines: int):
         """
@@ -369,23 +727,38 @@ class CATALYST_manager:
             Returns:
                 float: Total size of the cache directory in GB.
         """
-        if self.cache_size_valid:
-            return self.cache_size
+        self.get_cache_bytes()
 
-        total_size = 0
-        # Walk through all files and subdirectories in the given directory
-        for dir_path, dir_names, filenames in os.walk(self.CACHE_PATH):
-            for filename in filenames:
-                file_path = os.path.join(dir_path, filename)
-                # Add file size if it exists
-                if os.path.isfile(file_path):
-                    total_size += os.path.getsize(file_path)
+        return self.cache_size
 
-        # Convert size from bytes to gigabytes
-        self.cache_size = round(total_size / (1024**3), 3)
-        self.cache_size_valid = True
+    def get_cache_bytes(self):
+        """
+            Returns the total size of the cache directory in bytes. The size is read from the cache manifest once
+            and afterward with every file this instance adds or removes, which includes the files of other processes.
 
-        return self.cache_size
+            Returns:
+                int: Total size of the cache directory in bytes.
+        """
+        with self.cache_lock:
+            if not self.cache_size_valid:
+                with self._connect_manifest(write=False) as connection:
+                    self._update_cache_bytes(connection)
+
+            return self.cache_bytes
+
+    def _update_cache_bytes(self, connection):
+        """
+            Reads the total size of the cache files from the cache manifest.
+
+            Parameters:
+                connection (sqlite3.Connection): Connection to the cache manifest.
+        """
+        with self.cache_lock:
+            self.cache_bytes = connection.execute("SELECT size FROM cache_size").fetchone()[0]
+
+            # Convert size from bytes to gigabytes
+            self.cache_size = round(self.cache_bytes / (1024**3), 3)
+            self.cache_size_valid = True
 
     def get_log_size(self):
         """
@@ -398,27 +771,46 @@ class CATALYST_manager:
 
     def check_cache(self):
         """
-            Check if the cache directory is larger than its threshold. Remove the oldest files until it has reached the threshold.
+            Check if the cache directory is larger than its threshold. Remove files chosen by the cache eviction policy in one batch
+            until the cache has reached CACHE_LOW_WATER_MARK of the threshold. If it is still larger than its threshold afterward,
+            it is checked again after CACHE_EVICTION_RETRY_DELAY seconds.
 
             Returns:
                 False if the cache was too big and files were removed, true otherwise.
         """
-        cache_size = self.get_cache_size()
-        self.CallbackFunction(f"Checking cache size. Current cache size: {cache_size} GB.", "log")
+        cache_bytes = self.get_cache_bytes()
+        self.CallbackFunction(f"Checking cache size. Current cache size: {self.cache_size} GB.", "log")
 
         # Check if cache size is smaller then threshold
-        if cache_size <= self.cache_threshold:
+        if cache_bytes <= self.cache_threshold * 1024**3:
             return True
 
-        # Remove the oldest files until the cache size is less than the threshold
-        while cache_size > self.cache_threshold:
-            self.remove_least_recently_used_file()
-            cache_size = self.get_cache_size()
+        removed_files = self.evict_cache_files(self.cache_threshold * CACHE_LOW_WATER_MARK)
 
-        self.CallbackFunction(f"Cache size exceeded threshold value. New cache size: {cache_size} GB.", "log")
+        self.CallbackFunction(f"Cache size exceeded threshold value. {len(removed_files)} files removed by policy {self.cache_eviction_policy}. "
+                              f"New cache size: {self.get_cache_size()} GB.", "log")
+
+        if self.get_cache_bytes() > self.cache_threshold * 1024**3:
+            with self.cache_lock:
+                if self.cache_check_timer is None:
+                    self.cache_check_timer = threading.Timer(CACHE_EVICTION_RETRY_DELAY, self._retry_check_cache)
+                    self.cache_check_timer.daemon = True
+                    self.cache_check_timer.start()
 
         return False
 
+    def _retry_check_cache(self):
+        """
+            Checks the cache again after files could not be evicted, called by the timer started in check_cache.
+        """
+        with self.cache_lock:
+            self.cache_check_timer = None
+
+        try:
+            self.check_cache()
+        except (OSError, sqlite3.Error) as e:
+            self.ErrorFunction(f"Cache could not be checked. {type(e).__name__}: {e}", "log")
+
     def check_log(self):
         """
             Check if the cache directory is larger than its threshold. Remove the oldest files until it has reached the new threshold.
@@ -443,12 +835,302 @@ class CATALYST_manager:
 
         return False
 
+    @contextmanager
+    def _connect_manifest(self, write: bool = True):
+        """
+            Yields the connection of this instance to the cache manifest. Changes are committed if no exception occurs.
+            The threads of this instance take turns using the connection. Writes also lock the cache against other processes, see _lock_cache,
+            reads and updates of the access times only rely on the locking of SQLite.
+
+            Parameters:
+                write (bool): Flag to lock the cache for changes of the cache files. Default is True.
+        """
+        with self._lock_cache() if write else self.cache_lock:
+            connection = self._open_manifest()
+            with connection:
+                yield connection
+
+    def _open_manifest(self):
+        """
+            Returns the connection to the cache manifest, it is opened and the tables are created once per instance.
+            The manifest is built from the cache directory if it did not exist or has tables of another version. The caller holds cache_lock.
+
+            Returns:
+                sqlite3.Connection: Connection to the cache manifest.
+        """
+        if self.manifest_connection is None:
+            # The manifest may be rebuilt, so it is locked like for writes
+            with self._lock_cache():
+                connection = sqlite3.connect(self.MANIFEST_PATH, timeout=30, check_same_thread=False)
+                with connection:
+                    # A new manifest has version 0
+                    outdated = connection.execute("PRAGMA user_version").fetchone()[0] != _MANIFEST_VERSION
+                    if outdated:
+                        connection.execute("DROP TABLE IF EXISTS cache_files")
+                        connection.execute("DROP TABLE IF EXISTS data_files")
+                        connection.execute("DROP TABLE IF EXISTS cache_size")
+                        connection.execute(f"PRAGMA user_version = {_MANIFEST_VERSION}")
+                    for statement in _MANIFEST_SCHEMA:
+                        connection.execute(statement)
+
+                self.manifest_connection = connection
+                if outdated:
+                    self.rebuild_cache_manifest()
+
+        return self.manifest_connection
+
+    @contextmanager
+    def _lock_cache(self):
+        """
+            Locks the cache against other threads and, with the lock file next to the cache manifest, against other processes
+            sharing the CATALYST directory. Files are published, registered and removed while the lock is held. The lock is reentrant.
+        """
+        with self.cache_lock:
+            if self.cache_lock_depth == 0:
+                lock_file = open(self.LOCK_PATH, "a+b")
+                try:
+                    if msvcrt is not None:
+                        lock_file.seek(0)
+                        while True:
+                            try:
+                                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                                break
+                            except OSError:
+                                pass  # LK_LOCK gives up after 10 seconds, keep waiting for the other process
+                    else:
+                        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                except BaseException:
+                    lock_file.close()
+                    raise
+                self.cache_lock_file = lock_file
+
+            self.cache_lock_depth += 1
+            try:
+                yield
+            finally:
+                self.cache_lock_depth -= 1
+                if self.cache_lock_depth == 0:
+                    # Closing the file releases the lock
+                    if msvcrt is not None:
+                        self.cache_lock_file.seek(0)
+                        msvcrt.locking(self.cache_lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+                    self.cache_lock_file.close()
+                    self.cache_lock_file = None
+
+    @staticmethod
+    def parse_cache_filename(filename: str):
+        """
+            Returns the key parameters encoded in the name of a cache file.
+
+            Parameters:
+                filename (str): Name of the cache file.
+
+            Returns:
+                Dictionary with data_file_name, kind ("single", "matrix" or "pyramid"), function, area_range, m_z, start_value and end_value.
+                None if the name does not match a cache file, e.g. the text files of multiple timelines written by older versions.
+        """
+        try:
+            parts = filename.replace(".catalyst", "").split("_")
+            if filename.endswith("_single.catalyst"):
+                return {"data_file_name": "_".join(parts[:-4]), "kind": "single", "function": int(parts[-4][1:]), "area_range": float(parts[-3][1:]),
+                        "m_z": float(parts[-2][2:]), "start_value": None, "end_value": None}
+            if filename.endswith("_matrix.catalyst"):
+                return {"data_file_name": "_".join(parts[:-5]), "kind": "matrix", "function": int(parts[-5][1:]), "area_range": float(parts[-4][1:]),
+                        "m_z": None, "start_value": float(parts[-3][2:]), "end_value": float(parts[-2][2:])}
+            if filename.endswith("_pyramid.catalyst"):
+                return {"data_file_name": "_".join(parts[:-3]), "kind": "pyramid", "function": int(parts[-3][1:]), "area_range": float(parts[-2][1:]),
+                        "m_z": None, "start_value": None, "end_value": None}
+        except (IndexError, ValueError):
+            pass  # Files that don't match the expected format
+
+        return None
+
+    def register_cache_file(self, filename: str, compute_time: float = None):
+        """
+            Adds a file in the cache directory to the cache manifest or updates its entry.
+
+            Parameters:
+                filename (str): Name of the file in the cache directory.
+                compute_time (float): Seconds it took to compute the content of the file, used by the eviction policy "Cost". Default is None for unknown.
+        """
+        self.register_cache_files([filename], compute_time)
+
+    def register_cache_files(self, filenames: list, compute_time: float = None):
+        """
+            Adds files in the cache directory to the cache manifest or updates their entries in one transaction.
+
+            Parameters:
+                filenames (list): Names of the files in the cache directory.
+                compute_time (float): Seconds it took to compute the content of each file, used by the eviction policy "Cost". Default is None for unknown.
+        """
+        now = time.time()
+        rows = []
+        for filename in filenames:
+            key = self.parse_cache_filename(filename) or {"data_file_name": None, "kind": None, "function": None, "area_range": None, "m_z": None, "start_value": None, "end_value": None}
+            rows.append({**key, "filename": filename, "size": os.path.getsize(os.path.join(self.CACHE_PATH, filename)), "created": now, "last_access": now, "cost": compute_time})
+
+        with self._connect_manifest() as connection:
+            # Upsert instead of replace, so the triggers keep the cache size right
+            connection.executemany("INSERT INTO cache_files (filename, data_file_name, kind, function, area_range, m_z, start_value, end_value, size, created, last_access, cost) "
+                                   "VALUES (:filename, :data_file_name, :kind, :function, :area_range, :m_z, :start_value, :end_value, :size, :created, :last_access, :cost) "
+                                   "ON CONFLICT (filename) DO UPDATE SET size = excluded.size, created = excluded.created, last_access = excluded.last_access, cost = excluded.cost",
+                                   rows)
+            self._update_cache_bytes(connection)
+
+    def rebuild_cache_manifest(self):
+        """
+            Recreates the cache manifest from the files in the cache directory. Only needed if files were added or removed outside this class.
+        """
+        start_time = time.time()
+
+        # The cache is locked before the files are listed, so no file registered meanwhile by another process is missing in the manifest
+        with self._connect_manifest() as connection:
+            rows = []
+            for filename in os.listdir(self.CACHE_PATH):
+                file_path = os.path.join(self.CACHE_PATH, filename)
+                # Skip files that are not in the cache yet, cache files are written to a temporary file first
+                if not os.path.isfile(file_path) or filename.endswith(".tmp"):
+                    continue
+
+                key = self.parse_cache_filename(filename) or {"data_file_name": None, "kind": None, "function": None, "area_range": None, "m_z": None, "start_value": None, "end_value": None}
+                rows.append({**key, "filename": filename, "size": os.path.getsize(file_path), "created": os.path.getctime(file_path), "last_access": os.path.getatime(file_path)})
+
+            connection.execute("DELETE FROM cache_files")
+            connection.executemany("INSERT INTO cache_files (filename, data_file_name, kind, function, area_range, m_z, start_value, end_value, size, created, last_access) "
+                                   "VALUES (:filename, :data_file_name, :kind, :function, :area_range, :m_z, :start_value, :end_value, :size, :created, :last_access)", rows)
+
+        self.cache_size_valid = False
+        self.CallbackFunction(f"Cache manifest rebuilt with {len(rows)} files in {time.time() - start_time:.2f} seconds.", "log")
+
+    def find_cache_file(self, query: str, parameters: tuple):
+        """
+            Returns the first file of the cache manifest selected by query that still exists and marks it as used.
+            Entries of files that were removed outside this class are dropped.
+
+            Parameters:
+                query (str): SELECT statement on the table cache_files returning the filename.
+                parameters (tuple): Parameters of the query.
+
+            Returns:
+                str: Name of the file or None if no file matches.
+        """
+        with self._connect_manifest(write=False) as connection:
+            for (filename,) in connection.execute(query, parameters).fetchall():
+                if os.path.isfile(os.path.join(self.CACHE_PATH, filename)):
+                    connection.execute("UPDATE cache_files SET last_access = ? WHERE filename = ?", (time.time(), filename))
+                    return filename
+
+                self._unregister_cache_files(connection, [filename])
+
+        return None
+
+    def find_cache_files(self, query: str, parameters: tuple):
+        """
+            Returns all files of the cache manifest selected by query that still exist and marks them as used in one transaction.
+            Entries of files that were removed outside this class are dropped.
+
+            Parameters:
+                query (str): SELECT statement on the table cache_files returning the filename followed by any other columns.
+                parameters (tuple): Parameters of the query.
+
+            Returns:
+                List of the rows of the existing files.
+        """
+        with self._connect_manifest(write=False) as connection:
+            rows = connection.execute(query, parameters).fetchall()
+            existing = [row for row in rows if os.path.isfile(os.path.join(self.CACHE_PATH, row[0]))]
+
+            connection.executemany("UPDATE cache_files SET last_access = ? WHERE filename = ?", [(time.time(), row[0]) for row in existing])
+            if len(existing) < len(rows):
+                existing_files = {row[0] for row in existing}
+                self._unregister_cache_files(connection, [row[0] for row in rows if row[0] not in existing_files])
+
+        return existing
+
+    def _unregister_cache_files(self, connection, filenames: list):
+        """
+            Removes the entries of files that were deleted or no longer exist in the cache directory from the cache manifest.
+
+            Parameters:
+                connection (sqlite3.Connection): Connection to the cache manifest.
+                filenames (list): Names of the files.
+        """
+        connection.executemany("DELETE FROM cache_files WHERE filename = ?", [(filename,) for filename in filenames])
+        self._update_cache_bytes(connection)
+
+    def get_data_file_key(self, file_path: str):
+        """
+            Returns the key the cache entries of the given data file are stored under, the fingerprint of its content.
+            Copies of a file share their cache entries, independent of their name and path.
+            The fingerprint is kept with size and modification time of the file in the cache manifest and only recomputed if they changed.
+            If the content of the file changed, cache entries of the old content are removed unless another existing file has that content.
+
+            Parameters:
+                file_path (str): Path to the data file.
+
+            Returns:
+                str: Cache key of the data file.
+
+            Raises:
+                OSError: If the file can not be read.
+        """
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+
+        with self._connect_manifest(write=False) as connection:
+            row = connection.execute("SELECT size, mtime_ns, fingerprint FROM data_files WHERE path = ?", (path,)).fetchone()
+            if row is not None and row[:2] == (stat.st_size, stat.st_mtime_ns):
+                return row[2]
+
+        fingerprint = get_file_fingerprint(path)
+
+        with self._connect_manifest() as connection:
+            connection.execute("INSERT OR REPLACE INTO data_files (path, size, mtime_ns, fingerprint) VALUES (?, ?, ?, ?)", (path, stat.st_size, stat.st_mtime_ns, fingerprint))
+
+            # Entries of the previous content of the file are stale
+            stale_fingerprint = row[2] if row is not None and row[2] != fingerprint else None
+            other_paths = [other_path for (other_path,) in connection.execute("SELECT path FROM data_files WHERE fingerprint = ?", (stale_fingerprint,))]
+            if stale_fingerprint and not any(os.path.isfile(other_path) for other_path in other_paths):
+                stale_files = connection.execute("SELECT filename, size FROM cache_files WHERE data_file_name = ?", (stale_fingerprint,)).fetchall()
+                self._delete_cache_files(connection, stale_files)
+
+                self.CallbackFunction(f"'{path}' changed, {len(stale_files)} stale files removed from cache.", "log")
+
+        return fingerprint
+
+    def load_scans_from_memory(self, data_file_name: str):
+        """
+            Returns the parsed scans of a data file kept in the memory cache.
+
+            Parameters:
+                data_file_name (str): Cache key of the data file, see get_data_file_key.
+
+            Returns:
+                Tuple of the scans of all functions as {function_number: ScanStore, ...}, their max and min m/z values as {function_number: (max, min), ...},
+                the creation date and the path of the scan sidecar backing the scans or None.
+                None if the scans are not in memory.
+        """
+        return self.memory_cache.get(("scans", data_file_name))
+
+    def save_scans_to_memory(self, data_file_name: str, content: dict, mz_bounds: dict, creation_date: str, sidecar_path: str = None):
+        """
+            Keeps the parsed scans of a data file in the memory cache.
+
+            Parameters:
+                data_file_name (str): Cache key of the data file, see get_data_file_key.
+                content (dict): Scans of all functions as {function_number: ScanStore, ...}.
+                mz_bounds (dict): Max and min m/z values of all functions as {function_number: (max, min), ...}.
+                creation_date (str): Creation date of the data.
+                sidecar_path (str): Path of the scan sidecar the scans are views into. Default is None for scans parsed into memory.
+        """
+        self.memory_cache.put(("scans", data_file_name), (content, mz_bounds, creation_date, sidecar_path), sum(store.nbytes for store in content.values()))
+
     def load_timeline_from_cache(self, data_file_name: str, area_range: float, function: int, m_z: float):
         """
-            Search the intensity timeline for given parameters in the cache.
+            Search the intensity timeline for given parameters in the memory cache and the cache manifest.
 
             Parameters:
-                data_file_name (str): Name of the file.
+                data_file_name (str): Cache key of the data file, see get_data_file_key.
                 area_range (float): Range of the mass/charge area.
                 function (int): Function identifier.
                 m_z (float): Mass/charge value for which to retrieve intensity over time.
@@ -457,129 +1139,343 @@ class CATALYST_manager:
                 Tuple of timeline and creation date.
                 Both None if no fitting timeline was cached.
         """
+        return self.load_timelines_of_mz_values(data_file_name, area_range, function, [m_z]).get(m_z, (None, None))
+
+    def load_timelines_of_mz_values(self, data_file_name: str, area_range: float, function: int, mz_values: list):
+        """
+            Search the intensity timelines of several mass/charge values in the memory cache and the cache manifest.
+            The files of all values that are not in memory are looked up with one query of the manifest per MANIFEST_LOOKUP_BATCH_SIZE values.
+
+            Parameters:
+                data_file_name (str): Cache key of the data file, see get_data_file_key.
+                area_range (float): Range of the mass/charge area.
+                function (int): Function identifier.
+                mz_values (list): Mass/charge values for which to retrieve intensity over time.
+
+            Returns:
+                Dictionary {m_z: (timeline, creation date), ...} of the mass/charge values with a cached timeline.
+        """
         start_time = time.time()
 
-        for filename in os.listdir(self.CACHE_PATH):
-            if filename.startswith(data_file_name):
-                try:
-                    # Check if the file matches "_single" format
-                    if filename.endswith("_single.catalyst"):
-                        # Parse "_single" file
-                        parts = filename.replace(".catalyst", "").split("_")
-                        file_function = int(parts[-4][1:])  # Extract function (e.g., f1 -> 1)
-                        file_range = float(parts[-3][1:])  # Extract range (e.g., r10 -> 10)
-                        file_m_z = float(parts[-2][2:])  # Extract m/z (e.g., mz100 -> 100)
-
-                        if file_function == function and file_range == area_range and file_m_z == m_z:
-                            # Load cached file
-                            with open(os.path.join(self.CACHE_PATH, filename), "r") as file:
-                                creation_date = file.readline().strip()
-                                for line in file:
-                                    timeline = [float(value) for value in line[1:-2].split(", ")]
-                            self.CallbackFunction(f"File {filename} loaded from cache.", "log")
-                            self.CallbackFunction(f"Time taken: {time.time() - start_time:.2f} seconds.", "log")
-                            return timeline, creation_date
-                except (IndexError, ValueError):
-                    continue  # Skip files that don't match the expected format
-
-        return None, None
+        found = {}
+        missing = []
+        for m_z in dict.fromkeys(mz_values):
+            cached = self.memory_cache.get(("single", data_file_name, function, area_range, m_z))
+            if cached is not None:
+                timeline, creation_date = cached
+                found[m_z] = (list(timeline), creation_date)
+            else:
+                missing.append(m_z)
+
+        rows = []
+        for start in range(0, len(missing), MANIFEST_LOOKUP_BATCH_SIZE):
+            batch = missing[start:start + MANIFEST_LOOKUP_BATCH_SIZE]
+            rows += self.find_cache_files(f"SELECT filename, m_z FROM cache_files WHERE data_file_name = ? AND kind = 'single' AND function = ? AND area_range = ? "
+                                          f"AND m_z IN ({', '.join('?' * len(batch))})", (data_file_name, function, area_range, *batch))
+
+        for filename, m_z in rows:
+            try:
+                # Load cached file
+                with open(os.path.join(self.CACHE_PATH, filename), "r") as file:
+                    creation_date = file.readline().strip()
+                    for line in file:
+                        timeline = [float(value) for value in line[1:-2].split(", ")]
+            except (OSError, IndexError, ValueError):
+                continue  # Skip files that don't match the expected format
+
+            self.memory_cache.put(("single", data_file_name, function, area_range, m_z), (timeline, creation_date), len(timeline) * 8)
+            found[m_z] = (list(timeline), creation_date)
+
+        if rows:
+            self.CallbackFunction(f"{len(rows)} timeline files loaded from cache.", "log")
+            self.CallbackFunction(f"Time taken: {time.time() - start_time:.2f} seconds.", "log")
+        return found
 
     def load_timelines_from_cache(self, data_file_name: str, area_range: float, function: int, start_value: float, end_value: float):
         """
-            Search the intensity timelines for given parameters in the cache.
+            Search the intensity timelines for given parameters in the memory cache and the cache manifest.
+            Timelines of a range that contains the given range are searched, smaller ranges are preferred.
+            Only the timelines of areas inside the given range are read from the file.
 
             Parameters:
-                data_file_name (str): Name of the data file.
+                data_file_name (str): Cache key of the data file, see get_data_file_key.
                 area_range (float): Range of the mass/charge area.
                 function (int): Function identifier.
                 start_value (float): Start value of the m/z range.
                 end_value (float): End value of the m/z range.
 
             Returns:
-                Tuple of timelines and creation date.
+                Tuple of timelines as TimelineMatrix and creation date.
                 Both None if no fitting timelines were cached.
         """
-        all_timelines_avg = {}
         start_time = time.time()
 
+        # Timelines in memory of a range that contains the given range
+        _, cached = self.memory_cache.find(lambda key: key[:4] == ("matrix", data_file_name, function, area_range) and key[4] <= start_value and key[5] >= end_value)
+        if cached is not None:
+            timelines, creation_date = cached
+            return timelines.get_mz_range(start_value, end_value), creation_date
 
-        for filename in os.listdir(self.CACHE_PATH):
-            if filename.startswith(data_file_name):
-                try:
-                    # Check if the file matches "_multiple" format
-                    if filename.endswith("_multiple.catalyst"):
-                        # Parse "_multiple" file
-                        parts = filename.replace(".catalyst", "").split("_")
-                        file_function = int(parts[-5][1:])  # Extract function (e.g., f1 -> 1)
-                        file_range = float(parts[-4][1:])  # Extract range (e.g., r10 -> 10)
-                        file_start_value = float(parts[-3][2:])  # Extract start value (e.g., sv20 -> 20)
-                        file_end_value = float(parts[-2][2:])  # Extract end value (e.g., ev50 -> 50)
+        filename = self.find_cache_file("SELECT filename FROM cache_files WHERE data_file_name = ? AND kind = 'matrix' AND function = ? AND area_range = ? "
+                                        "AND start_value <= ? AND end_value >= ? ORDER BY end_value - start_value",
+                                        (data_file_name, function, area_range, start_value, end_value))
+        if filename is None:
+            return None, None
+
+        try:
+            # Load cached file, memory-mapped unless the file is compressed
+            timelines, header = TimelineMatrix.read(os.path.join(self.CACHE_PATH, filename), start_value, end_value)
+            creation_date = header["creation_date"]
+        except (OSError, ValueError, KeyError):
+            return None, None  # Skip files that don't match the expected format
+
+        self.memory_cache.put(("matrix", data_file_name, function, area_range, start_value, end_value), (timelines, creation_date), timelines.nbytes)
+
+        self.CallbackFunction(f"File {filename} loaded from cache.", "log")
+        self.CallbackFunction(f"Time taken: {time.time() - start_time:.2f} seconds.", "log")
+        return timelines, creation_date
+
+    def load_bin_pyramid_from_cache(self, data_file_name: str, function: int):
+        """
+            Search the bin pyramid of the given function in the memory cache and the cache manifest.
+
+            Parameters:
+                data_file_name (str): Cache key of the data file, see get_data_file_key.
+                function (int): Function identifier.
+
+            Returns:
+                Tuple of the BinPyramid and creation date.
+                Both None if the pyramid was not cached.
+        """
+        start_time = time.time()
 
-                        if file_function == function and file_range == area_range and start_value >= file_start_value and end_value <= file_end_value:
-                            # Load cached file
-                            with open(os.path.join(self.CACHE_PATH, filename), "r") as file:
-                                creation_date = file.readline().strip()
-                                for line in file:
-                                    area, values = line.split(": ")
-                                    all_timelines_avg[area] = [float(value) for value in values[1:-2].split(", ")]
-                            self.CallbackFunction(f"File {filename} loaded from cache.", "log")
-                            self.CallbackFunction(f"Time taken: {time.time() - start_time:.2f} seconds.", "log")
-                            return all_timelines_avg, creation_date
+        memory_key = ("pyramid", data_file_name, function)
+        cached = self.memory_cache.get(memory_key)
+        if cached is not None:
+            return cached
 
-                except (IndexError, ValueError):
-                    continue  # Skip files that don't match the expected format
+        filename = self.find_cache_file("SELECT filename FROM cache_files WHERE data_file_name = ? AND kind = 'pyramid' AND function = ? AND area_range = ?",
+                                        (data_file_name, function, BIN_PYRAMID_BASE_RADIUS))
+        if filename is None:
+            return None, None
 
-        return None, None
+        try:
+            # Memory-mapped unless the file is compressed
+            pyramid, header = BinPyramid.read(os.path.join(self.CACHE_PATH, filename))
+        except (OSError, ValueError, KeyError):
+            return None, None  # Skip files that don't match the expected format
 
-    def save_timeline_cache(self, data_file_name: str, function: int, area_range: float, m_z: float, timeline_data: list, creation_date: str):
+        self.memory_cache.put(memory_key, (pyramid, header["creation_date"]), pyramid.nbytes)
+
+        self.CallbackFunction(f"File {filename} loaded from cache.", "log")
+        self.CallbackFunction(f"Time taken: {time.time() - start_time:.2f} seconds.", "log")
+        return pyramid, header["creation_date"]
+
+    def save_timeline_cache(self, data_file_name: str, function: int, area_range: float, m_z: float, timeline_data: list, creation_date: str, compute_time: float = None):
         """
-            Save a single timeline to the cache.
+            Save a single timeline to the memory cache and queue writing it to the cache directory.
 
             Parameters:
-                data_file_name (str): Name of the data file.
+                data_file_name (str): Cache key of the data file, see get_data_file_key.
                 function (int): Function identifier.
                 area_range (float): Range of the mass/charge area.
                 m_z (float): Mass/charge value.
                 timeline_data (list): Timeline data to save.
                 creation_date (str): Creation date of the data.
+                compute_time (float): Seconds it took to compute the data, used by the eviction policy "Cost". Default is None for unknown.
+        """
+        self.save_timelines_of_mz_values(data_file_name, function, area_range, {m_z: timeline_data}, creation_date, compute_time)
+
+    def save_timelines_of_mz_values(self, data_file_name: str, function: int, area_range: float, timelines: dict, creation_date: str, compute_time: float = None):
         """
-        filename = f"{data_file_name}_f{function}_r{area_range}_mz{m_z}_single.catalyst"
-        filepath = os.path.join(self.CACHE_PATH, filename)
+            Save the timelines of several mass/charge values to the memory cache and queue writing them to the cache directory as one batch,
+            which the cache writer thread publishes with one lock of the cache and registers in one transaction.
 
-        with open(filepath, "w") as file:
-            file.write(f"{creation_date}\n")
+            Parameters:
+                data_file_name (str): Cache key of the data file, see get_data_file_key.
+                function (int): Function identifier.
+                area_range (float): Range of the mass/charge areas.
+                timelines (dict): Timeline data to save as {m_z: timeline, ...}.
+                creation_date (str): Creation date of the data.
+                compute_time (float): Seconds it took to compute each timeline, used by the eviction policy "Cost". Default is None for unknown.
+        """
+        files = []
+        for m_z, timeline_data in timelines.items():
             values = [round(value, 2) for value in timeline_data]  # Round values to 2 decimal places
-            file.write(f"{values}\n")
+            self.memory_cache.put(("single", data_file_name, function, area_range, m_z), (values, creation_date), len(values) * 8)
+            files.append((f"{data_file_name}_f{function}_r{area_range}_mz{m_z}_single.catalyst", values))
 
-        self.CallbackFunction(f"File {filename} saved in cache.", "log")
+        if files:
+            self._queue_cache_write(files[0][0] if len(files) == 1 else f"{len(files)} timeline files", sum(len(values) * 8 for _, values in files),
+                                    self._write_timeline_files, files, creation_date, compute_time)
 
-        # Check the check to make sure the cache does not exceed its threshold
-        self.check_cache()
+    def _write_timeline_files(self, files: list, creation_date: str, compute_time: float):
+        """
+            Write single timelines to temporary files and publish them in the cache directory together.
 
-    def save_timelines_cache(self, data_file_name: str, function: int, area_range: float, start_value: float, end_value: float, timeline_data: dict, creation_date: str):
+            Parameters:
+                files (list): Tuples of the name of the cache file and the rounded timeline values.
+                creation_date (str): Creation date of the data.
+                compute_time (float): Seconds it took to compute each timeline.
+        """
+        temp_paths = []
+        try:
+            for filename, values in files:
+                temp_paths.append(get_temp_path(os.path.join(self.CACHE_PATH, filename)))
+                with open(temp_paths[-1], "w") as file:
+                    file.write(f"{creation_date}\n")
+                    file.write(f"{values}\n")
+            self._publish_cache_files([(filename, temp_path) for (filename, _), temp_path in zip(files, temp_paths)], compute_time)
+        finally:
+            for temp_path in temp_paths:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+    def save_timelines_cache(self, data_file_name: str, function: int, area_range: float, start_value: float, end_value: float, timeline_data: TimelineMatrix, creation_date: str,
+                             compute_time: float = None):
         """
-            Save multiple timelines to the cache.
+            Keep multiple timelines in the memory cache and queue writing them to the cache directory as binary timeline matrix
+            with float32 values. The matrix is compressed with zlib if cache compression is enabled.
 
             Parameters:
-                data_file_name (str): Name of the data file.
+                data_file_name (str): Cache key of the data file, see get_data_file_key.
                 function (int): Function identifier.
                 area_range (float): Range of the mass/charge area.
                 start_value (float): Start of the mass/charge range.
                 end_value (float): End of the mass/charge range.
-                timeline_data (dict): Timeline data to save.
+                timeline_data (TimelineMatrix): Timeline data to save.
                 creation_date (str): Creation date of the data.
+                compute_time (float): Seconds it took to compute the data, used by the eviction policy "Cost". Default is None for unknown.
+        """
+        self.memory_cache.put(("matrix", data_file_name, function, area_range, start_value, end_value), (timeline_data, creation_date), timeline_data.nbytes)
+
+        filename = f"{data_file_name}_f{function}_r{area_range}_sv{start_value}_ev{end_value}_matrix.catalyst"
+        self._queue_cache_write(filename, timeline_data.nbytes, self._write_array_cache_file, filename, timeline_data, {
+            "creation_date": creation_date,
+            "data_file_name": data_file_name,
+            "function": function,
+            "area_range": area_range,
+            "start_value": start_value,
+            "end_value": end_value
+        }, compute_time)
+
+    def save_bin_pyramid_cache(self, data_file_name: str, function: int, pyramid: BinPyramid, creation_date: str, compute_time: float = None):
+        """
+            Keep the bin pyramid of a function in the memory cache and queue writing it to the cache directory.
+            The pyramid is compressed with zlib if cache compression is enabled.
+
+            Parameters:
+                data_file_name (str): Cache key of the data file, see get_data_file_key.
+                function (int): Function identifier.
+                pyramid (BinPyramid): Fine cells of the function.
+                creation_date (str): Creation date of the data.
+                compute_time (float): Seconds it took to compute the data, used by the eviction policy "Cost". Default is None for unknown.
+        """
+        self.memory_cache.put(("pyramid", data_file_name, function), (pyramid, creation_date), pyramid.nbytes)
+
+        filename = f"{data_file_name}_f{function}_r{BIN_PYRAMID_BASE_RADIUS}_pyramid.catalyst"
+        self._queue_cache_write(filename, pyramid.nbytes, self._write_array_cache_file, filename, pyramid, {
+            "creation_date": creation_date,
+            "data_file_name": data_file_name,
+            "function": function
+        }, compute_time)
+
+    def _write_array_cache_file(self, filename: str, content, header: dict, compute_time: float):
         """
+            Write a timeline matrix or bin pyramid to a temporary file and publish it in the cache directory.
 
-        filename = f"{data_file_name}_f{function}_r{area_range}_sv{start_value}_ev{end_value}_multiple.catalyst"
-        filepath = os.path.join(self.CACHE_PATH, filename)
+            Parameters:
+                filename (str): Name of the cache file.
+                content (TimelineMatrix | BinPyramid): Data to write.
+                header (dict): Key parameters stored in the file header.
+                compute_time (float): Seconds it took to compute the data.
+        """
+        temp_path = get_temp_path(os.path.join(self.CACHE_PATH, filename))
+        try:
+            content.write(temp_path, header, self.cache_compression)
+            self._publish_cache_file(filename, temp_path, compute_time)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _publish_cache_file(self, filename: str, temp_path: str, compute_time: float):
+        """
+            Rename a written temporary file to its cache file and register it, see _publish_cache_files.
 
-        with open(filepath, "w") as file:
-            file.write(f"{creation_date}\n")
-            for area, values in timeline_data.items():
-                values = [round(value, 2) for value in values]  # Round values to 2 decimal places
-                file.write(f"{area}: {values}\n")
+            Parameters:
+                filename (str): Name of the cache file.
+                temp_path (str): Path of the written temporary file.
+                compute_time (float): Seconds it took to compute the data.
+        """
+        self._publish_cache_files([(filename, temp_path)], compute_time)
 
-        self.CallbackFunction(f"File {filename} saved in cache.", "log")
+    def _publish_cache_files(self, files: list, compute_time: float):
+        """
+            Rename written temporary files to their cache files and register them while the cache is locked, so neither a reader
+            nor an eviction of another process sees a partly written or unregistered file. Then check that the cache does not exceed its threshold.
+            If a rename fails, the files renamed before it are still registered and the error is raised.
+
+            Parameters:
+                files (list): Tuples of the name of the cache file and the path of its written temporary file.
+                compute_time (float): Seconds it took to compute the data of each file.
+        """
+        with self._lock_cache():
+            published = []
+            try:
+                for filename, temp_path in files:
+                    os.replace(temp_path, os.path.join(self.CACHE_PATH, filename))
+                    published.append(filename)
+            finally:
+                # Files in the cache directory have to be in the manifest, otherwise they escape the cache size and the eviction
+                if published:
+                    self.register_cache_files(published, compute_time)
+        self.CallbackFunction(f"File {files[0][0]} saved in cache." if len(files) == 1 else f"{len(files)} files saved in cache.", "log")
 
         # Check the check to make sure the cache does not exceed its threshold
         self.check_cache()
+
+    def _queue_cache_write(self, description: str, size: int, write_function, *arguments):
+        """
+            Queue a cache write for the cache writer thread, which is started with the first write.
+            Blocks while the queued writes hold CACHE_WRITE_QUEUE_BYTES, a write larger than that is only queued alone.
+
+            Parameters:
+                description (str): Name of the written files for error messages.
+                size (int): Size in bytes of the data of the write.
+                write_function (function): Function writing the cache files.
+                *arguments: Arguments of write_function.
+        """
+        with self.cache_lock:
+            if self.writer_thread is None or not self.writer_thread.is_alive():
+                self.writer_thread = threading.Thread(target=self._cache_writer, name="CATALYST cache writer", daemon=True)
+                self.writer_thread.start()
+
+        with self.write_queue_space:
+            self.write_queue_space.wait_for(lambda: self.write_queue_bytes == 0 or self.write_queue_bytes + size <= CACHE_WRITE_QUEUE_BYTES)
+            self.write_queue_bytes += size
+
+        self.write_queue.put((description, size, write_function, arguments))
+
+    def _cache_writer(self):
+        """
+            Loop of the cache writer thread, writes the queued cache files one after another.
+        """
+        while True:
+            description, size, write_function, arguments = self.write_queue.get()
+            try:
+                write_function(*arguments)
+            except Exception as e:
+                # A failed write only costs the cache entry, the data is still in the memory cache
+                self.ErrorFunction(f"Cache file {description} could not be saved. {type(e).__name__}: {e}", "log")
+            finally:
+                with self.write_queue_space:
+                    self.write_queue_bytes -= size
+                    self.write_queue_space.notify_all()
+                self.write_queue.task_done()
+
+    def flush_cache_writes(self):
+        """
+            Blocks until all queued cache files are written. Called before the program exits.
+        """
+        if self.writer_thread is not None and self.writer_thread.is_alive():
+            self.write_queue.join()
@@ -1,9 +1,9 @@
-from concurrent.futures import ProcessPoolExecutor
 from itertools import groupby
 import numpy as np
 from fastdtw import fastdtw
 from scipy.signal import savgol_filter
 from multiprocessing import cpu_count
+from src.worker_pool import use_pool
 
 def get_list_from_mz_and_charge(mz_value=0, charge_state=0, radius=3):
     """
@@ -158,10 +158,11 @@ class CurveSimilarityDetector:
         self.protein_curve = _smooth_curve(protein_curve.flatten(), self.window_length, self.polyorder)
         self.use_savgol = use_savgol
 
-    def are_curves_similar_list(self, curve_list, num_processes=4, tracked_mode=False):
+    def are_curves_similar_list(self, curve_list, num_processes=4, tracked_mode=False, worker_pool=None):
         """
         Check if a curve is similar to any curve in a list based on DTW and Pearson thresholds after smoothing.
         :param num_processes: Number of processes to use for parallel processing.
+        :param worker_pool: Long-lived WorkerPool of the application, a new pool is started if it is None.
         :param curve_list: List of curves as 1D numpy arrays.
         :param tracked_mode: Flag to indicate if the tracked mode is used.
         :return: List of tuples (Boolean indicating whether the curves are similar, DTW distance, Pearson correlation).
@@ -175,9 +176,8 @@ class CurveSimilarityDetector:
             return [self._is_curve_similar_to_protein_curve(curve_b, tracked_mode) for curve_b in curve_list]
 
         # Use parallel processing for larger lists
-        with ProcessPoolExecutor(max_workers=num_processes) as executor:
-            results = list(
-                executor.map(self._is_curve_similar_to_protein_curve, curve_list, chunksize=20))
+        with use_pool(worker_pool, num_processes) as pool:
+            results = pool.map(self._is_curve_similar_to_protein_curve, curve_list, chunksize=20)
         return results
 
     def _is_curve_similar_to_protein_curve(self, curve_b, tracked_mode=False):
@@ -4,10 +4,32 @@ import numpy as np
 from src.data_analysis.analyzer import CurveSimilarityDetector, group_and_filter_results, normalize_curve
 from src.parse import TextFileReader
 
+def get_protein_mz_values(protein_mz_value, protein_charge_state, protein_charge_state_averaging_window, targeted=False):
+    """
+        Returns the m/z values of the protein charge states the protein curve is summed from.
+
+        Args:
+            protein_mz_value (float): m/z value for the protein curve.
+            protein_charge_state (int): Charge state of the protein.
+            protein_charge_state_averaging_window (int): Window for averaging the protein charge state.
+            targeted (bool): Flag for the charge states of the targeted analysis, which does not include the highest charge state of the window.
+        Returns:
+            list: m/z values of the protein charge states.
+    """
+    # Calculate the mass of the protein
+    protein_mass = protein_mz_value * protein_charge_state
+
+    if protein_charge_state_averaging_window <= 0:
+        return [protein_mass / protein_charge_state]
+
+    # Create a lists of protein m/z values to scan
+    end = protein_charge_state_averaging_window - 1 if targeted else protein_charge_state_averaging_window
+    return [protein_mass / (protein_charge_state + i) for i in range(-protein_charge_state_averaging_window + 1, end)]
+
 def analyze_targeted(file_path, catalyst_manager, ligand_mz_values, dtw_threshold=12, pearson_threshold=0.85,
                      window_length=5, polyorder=3, protein_mz_value=0, range_ligand=0.02, range_protein=0.02,
                      function_ligand=2, function_protein=2, use_savgol=True, use_cache=True, start_x_axis=None, end_x_axis=None,
-                     protein_charge_state=0, protein_charge_state_averaging_window=0, callback_function=None, error_function = None, normalization_mode = 0):
+                     protein_charge_state=0, protein_charge_state_averaging_window=0, num_processes=1, use_mz_index=False, worker_pool=None, callback_function=None, error_function = None, normalization_mode = 0):
     #TODO: Update documentation
     """
     Analyze targeted ligand curves and return detailed results.
@@ -31,6 +53,9 @@ def analyze_targeted(file_path, catalyst_manager, ligand_mz_values, dtw_threshol
         end_x_axis (int or None): End time which to use for the analysis
         protein_charge_state (int): Charge state of the protein for averaging.
         protein_charge_state_averaging_window (int): Window for averaging the protein charge state.
+        num_processes (int): Number of processes to use for parsing the input file.
+        use_mz_index (bool): Flag to compute the curves from an index of the peaks sorted by m/z.
+        worker_pool (WorkerPool): Long-lived pool of worker processes of the application or None to start new pools.
         callback_function (function): Callback function to print text to the GUI.
         error_function (function): Callback function to print error messages to the GUI.
         normalization_mode (int): Mode for normalization. 0: No normalization, 1: All ligands are normalized individually , 2: All ligands are normalized together.
@@ -38,35 +63,29 @@ def analyze_targeted(file_path, catalyst_manager, ligand_mz_values, dtw_threshol
         list: A list of tuples containing (m/z value, ligand curve, is_similar, DTW score, Pearson score).
     """
     # Initialize the parser class
-    parser = TextFileReader(file_path=file_path, catalyst_manager=catalyst_manager, callback_function=callback_function, error_function=error_function)
+    parser = TextFileReader(file_path=file_path, catalyst_manager=catalyst_manager, callback_function=callback_function, error_function=error_function,
+                            num_processes=num_processes, use_mz_index=use_mz_index, worker_pool=worker_pool)
 
     start_time = time.time()
 
     # Initialize a dictionary to store all timelines
     all_timelines_avg = {}
 
-    for ligand_mz_value in ligand_mz_values:
-        try:
-            # Get the intensity values for the ligand curve
-            timeline = parser.get_intensity_timeline(m_z=ligand_mz_value, area_range=range_ligand, function=function_ligand, use_cache=use_cache)
-        except ValueError as e:
-            error_function(f"{str(e)} Ligand is ignored.", "log print")
-            timeline = []
+    try:
+        # Get the intensity values for all ligand curves in one pass over the file
+        timelines = parser.get_intensity_timelines(mz_list=ligand_mz_values, area_range=range_ligand, function=function_ligand, use_cache=use_cache)
+    except ValueError as e:
+        error_function(f"{str(e)} Ligands are ignored.", "log print")
+        timelines = [[] for _ in ligand_mz_values]
 
+    for ligand_mz_value, timeline in zip(ligand_mz_values, timelines):
         # Store the timeline in the dictionary with the m/z value as the key
         all_timelines_avg[str(ligand_mz_value)] = timeline
 
     callback_function(f"Time taken to get the intensity data: {time.time() - start_time:.2f} seconds.", "log")
 
-    # Calculate the mass of the protein
-    protein_mass = protein_mz_value * protein_charge_state
-
-    if protein_charge_state_averaging_window <= 0:
-        protein_mz_values = [protein_mass / protein_charge_state]
-    else:
-        # Create a lists of protein m/z values to scan
-        protein_mz_values = [protein_mass / (protein_charge_state + i) for i in range(-protein_charge_state_averaging_window + 1,
-                                                                                      protein_charge_state_averaging_window - 1)]
+    # Create a lists of protein m/z values to scan
+    protein_mz_values = get_protein_mz_values(protein_mz_value, protein_charge_state, protein_charge_state_averaging_window, targeted=True)
 
     # Get the protein curves and sum them up
     if len(protein_mz_values) <= 1:
@@ -76,15 +95,12 @@ def analyze_targeted(file_path, catalyst_manager, ligand_mz_values, dtw_threshol
             error_function(str(e), "log print")
             protein_curve = []
     else:
-        all_protein_curves = []
-        for protein_mz_value in protein_mz_values:
-            try:
-                timeline = parser.get_intensity_timeline(m_z=protein_mz_value, area_range=range_protein, function=function_protein, use_cache=use_cache)
-            except ValueError as e:
-                error_function(f"{str(e)} Protein charge state is ignored.", "log")
-                timeline = []
-
-            all_protein_curves.append(timeline)
+        try:
+            # Charge states without data have a timeline of zeros and do not change the sum
+            all_protein_curves = parser.get_intensity_timelines(mz_list=protein_mz_values, area_range=range_protein, function=function_protein, use_cache=use_cache)
+        except ValueError as e:
+            error_function(f"{str(e)} Protein charge states are ignored.", "log")
+            all_protein_curves = [[]]
 
         protein_curve = np.sum(all_protein_curves, axis=0)
 
@@ -119,7 +135,7 @@ def analyze_targeted(file_path, catalyst_manager, ligand_mz_values, dtw_threshol
 
     start_time = time.time()
     # Compare the ligand curves to the protein curve
-    similarities = comparator.are_curves_similar_list(normalized_ligand_curves, num_processes=1, tracked_mode=True)
+    similarities = comparator.are_curves_similar_list(normalized_ligand_curves, num_processes=1, tracked_mode=True, worker_pool=worker_pool)
 
     callback_function(f"Time taken to compare the ligand curves: {time.time() - start_time:.2f} seconds.", "log")
 
@@ -152,8 +168,8 @@ def analyze_untargeted(file_path, catalyst_manager, dtw_threshold=12, pearson_th
                        range_ligand=0.02, range_protein=0.02, num_processes=4, num_processes_analysis=4,
                        use_savgol=True, range_threshold=3, protein_range_threshold=4,
                        function_ligand=2, function_protein=2, use_cache=True, protein_charge_state=0, charge_state_radius=0,
-                       protein_charge_state_averaging_window=1, start_x_axis=None, end_x_axis=None, callback_function=None,
-                       error_function=None, normalization_mode=0):
+                       protein_charge_state_averaging_window=1, start_x_axis=None, end_x_axis=None, use_mz_index=False, worker_pool=None, callback_function=None,
+                       error_function=None, normalization_mode=0, use_bin_pyramid=False):
     """
         Analyze untracked ligand curves and return filtered results.
 
@@ -182,28 +198,25 @@ def analyze_untargeted(file_path, catalyst_manager, dtw_threshold=12, pearson_th
             protein_charge_state_averaging_window (int): Window for averaging the protein charge state.
             start_x_axis (int): Start time which to use for the analysis
             end_x_axis (int): End time which to use for the analysis
+            use_mz_index (bool): Flag to compute the protein curves from an index of the peaks sorted by m/z.
+            worker_pool (WorkerPool): Long-lived pool of worker processes of the application or None to start new pools.
             callback_function (function): Callback function to print text to the GUI.
             error_function (function): Callback function to print error messages to the GUI.
             normalization_mode (int): Mode for normalization. 0: No normalization, 1: All ligands are normalized individually , 2: All ligands are normalized together.
+            use_bin_pyramid (bool): Flag to derive the ligand curves from the bin pyramid of all peaks of the ligand function.
         Returns:
             list: A list of tuples containing (m/z value, ligand curve, is_similar, DTW score, Pearson score).
     """
     callback_function("Starting untargeted search.", "log print")
     ### Initialize the parser class
-    parser = TextFileReader(file_path=file_path, catalyst_manager=catalyst_manager, callback_function=callback_function, error_function=error_function)
+    parser = TextFileReader(file_path=file_path, catalyst_manager=catalyst_manager, callback_function=callback_function, error_function=error_function,
+                            num_processes=num_processes, use_mz_index=use_mz_index, worker_pool=worker_pool, use_bin_pyramid=use_bin_pyramid)
 
     all_timelines_avg = parser.get_all_intensity_timelines(area_range=range_ligand, num_processes=num_processes, function=function_ligand,
                                                            start_value=start_value, end_value=end_value, use_cache=use_cache)
 
-    # Calculate the mass of the protein
-    protein_mass = protein_mz_value * protein_charge_state
-
     # Create a lists of protein m/z values to scan
-    if protein_charge_state_averaging_window <= 0:
-        protein_mz_values = [protein_mass / protein_charge_state]
-    else:
-        protein_mz_values = [protein_mass / (protein_charge_state + i) for i in
-                            range(-protein_charge_state_averaging_window + 1, protein_charge_state_averaging_window)]
+    protein_mz_values = get_protein_mz_values(protein_mz_value, protein_charge_state, protein_charge_state_averaging_window)
 
     # Get the protein curves and sum them up
     if len(protein_mz_values) <= 1:
@@ -226,16 +239,16 @@ def analyze_untargeted(file_path, catalyst_manager, dtw_threshold=12, pearson_th
         protein_curve = np.sum(all_protein_curves, axis=0)
 
     # Assure that the length of the ligand curves is the same as the protein curve
-    if len(protein_curve) != len(all_timelines_avg[next(iter(all_timelines_avg.keys()))]):
+    if len(protein_curve) != all_timelines_avg.scans_length:
         # Append zeros to the protein curve or remove the last values until it matches
-        if len(protein_curve) < len(all_timelines_avg[next(iter(all_timelines_avg.keys()))]):
-            protein_curve = np.append(protein_curve, np.zeros(len(all_timelines_avg[next(iter(all_timelines_avg.keys()))]) - len(protein_curve)))
+        if len(protein_curve) < all_timelines_avg.scans_length:
+            protein_curve = np.append(protein_curve, np.zeros(all_timelines_avg.scans_length - len(protein_curve)))
         else:
-            protein_curve = protein_curve[:len(all_timelines_avg[next(iter(all_timelines_avg.keys()))])]
+            protein_curve = protein_curve[:all_timelines_avg.scans_length]
 
-    ### Get all values from dict between start and end value
-    filtered_keys = sorted([key for key in all_timelines_avg.keys() if start_value <= float(key) < end_value], key=float)
-    bin_curves = [np.array(all_timelines_avg[key]) for key in filtered_keys]
+    ### Get all areas between start and end value, they are sorted by m/z
+    filtered_timelines = all_timelines_avg.get_mz_range(start_value, end_value)
+    bin_curves = list(filtered_timelines.to_dense())
 
     if start_x_axis and end_x_axis:
         ### Only keep the data specified in the start and end time
@@ -257,12 +270,12 @@ def analyze_untargeted(file_path, catalyst_manager, dtw_threshold=12, pearson_th
 
     start_time = time.time()
     ### Compare the bin curves to the protein curve
-    analysis_result = comparator.are_curves_similar_list(normalized_bin_curves, num_processes=num_processes_analysis)
+    analysis_result = comparator.are_curves_similar_list(normalized_bin_curves, num_processes=num_processes_analysis, worker_pool=worker_pool)
 
     callback_function(f"Time taken to compare the bin curves: {time.time() - start_time:.2f} seconds.", "log")
 
     ### Get the mz value for the similar curves
-    all_mz_values = [float(key) for key in filtered_keys]
+    all_mz_values = filtered_timelines.mz_centers.tolist()
 
     ### Filter similar curves based on the range threshold
     results = group_and_filter_results(all_mz_values,
@@ -14,8 +14,9 @@ from src.output.csv_generator import generateGeneralCSV, generateIntensitiesCSV
 from src.output.pdf_generator import generate_PDF
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from src.parse import get_number_of_scans, get_max_and_min_mz
-from src.catalyst_manager import CATALYST_manager
+from src.parse import get_number_of_scans, get_max_and_min_mz, open_scan_sidecar
+from src.catalyst_manager import CACHE_EVICTION_POLICIES, CATALYST_manager
+from src.worker_pool import WorkerPool
 from src.settings.settings import Settings
 
 class ProteinLigandAnalyzerApp:
@@ -38,9 +39,15 @@ class ProteinLigandAnalyzerApp:
             datefmt='%Y-%m-%d %H:%M:%S'
         )
 
+        # Worker processes shared by all analyses, started on first use
+        self.worker_pool = WorkerPool()
+
         # Settings
         self.settings = self.catalyst_manager.check()
         self.catalyst_manager.set_cache_threshold(self.settings.advanced_settings.cache_size.value)
+        self.catalyst_manager.set_memory_cache_threshold(self.settings.advanced_settings.memory_cache_size.value)
+        self.catalyst_manager.set_cache_compression(self.settings.advanced_settings.compress_cache.value)
+        self.catalyst_manager.set_cache_eviction_policy(self.settings.advanced_settings.cache_eviction_policy.value)
 
         # Mode selection: 0=targeted 1=untargeted
         self.mode = tk.IntVar()
@@ -56,6 +63,10 @@ class ProteinLigandAnalyzerApp:
 
         def confirm_close():
             if messagebox.askyesno("Confirm", "Are you sure you want to close?"):
+                # Stop the worker processes of the analyses
+                self.worker_pool.shutdown()
+                # Write the cache files still waiting in the queue
+                self.catalyst_manager.flush_cache_writes()
                 self.root.quit()
 
         # Initialization of GUI elements
@@ -503,6 +514,12 @@ class ProteinLigandAnalyzerApp:
         self.entry_max_cache_size.grid(row=i, column=1)
         i += 1
 
+        label_max_memory_cache_size = tk.Label(self.adv_settings, text="Max memory cache size (GB):", font=label_font, bg="#f5f5f5", fg="#555")
+        label_max_memory_cache_size.grid(row=i, column=0)
+        self.entry_max_memory_cache_size = tk.Entry(self.adv_settings, width=same_width, name="memory_cache_size")
+        self.entry_max_memory_cache_size.grid(row=i, column=1)
+        i += 1
+
         cache_choice = ["YES", "NO"]
         self.entry_cache_use = tk.StringVar(value=cache_choice[-int(self.settings.advanced_settings.use_cache.value) - 1])
         label_cache_use = tk.Label(self.adv_settings, text="Use Cache:", font=label_font, bg="#f5f5f5", fg="#555")
@@ -513,6 +530,46 @@ class ProteinLigandAnalyzerApp:
         cache_menu.config(width=self.same_width - 8)
         i += 1
 
+        compress_choice = ["YES", "NO"]
+        self.entry_cache_compress = tk.StringVar(value=compress_choice[-int(self.settings.advanced_settings.compress_cache.value) - 1])
+        label_cache_compress = tk.Label(self.adv_settings, text="Compress Cache:", font=label_font, bg="#f5f5f5", fg="#555")
+        label_cache_compress.grid(row=i, column=0, pady=2)
+        compress_menu = ttk.OptionMenu(self.adv_settings, self.entry_cache_compress, self.entry_cache_compress.get(), *compress_choice)
+
+        compress_menu.grid(row=i, column=1, pady=2, padx=5)
+        compress_menu.config(width=self.same_width - 8)
+        i += 1
+
+        eviction_policies = list(CACHE_EVICTION_POLICIES)
+        self.entry_cache_eviction = tk.StringVar(value=self.settings.advanced_settings.cache_eviction_policy.value)
+        label_cache_eviction = tk.Label(self.adv_settings, text="Cache eviction policy:", font=label_font, bg="#f5f5f5", fg="#555")
+        label_cache_eviction.grid(row=i, column=0, pady=2)
+        eviction_menu = ttk.OptionMenu(self.adv_settings, self.entry_cache_eviction, self.entry_cache_eviction.get(), *eviction_policies)
+
+        eviction_menu.grid(row=i, column=1, pady=2, padx=5)
+        eviction_menu.config(width=self.same_width - 8)
+        i += 1
+
+        mz_index_choice = ["YES", "NO"]
+        self.entry_mz_index_use = tk.StringVar(value=mz_index_choice[-int(self.settings.advanced_settings.use_mz_index.value) - 1])
+        label_mz_index_use = tk.Label(self.adv_settings, text="Use m/z index:", font=label_font, bg="#f5f5f5", fg="#555")
+        label_mz_index_use.grid(row=i, column=0, pady=2)
+        mz_index_menu = ttk.OptionMenu(self.adv_settings, self.entry_mz_index_use, self.entry_mz_index_use.get(), *mz_index_choice)
+
+        mz_index_menu.grid(row=i, column=1, pady=2, padx=5)
+        mz_index_menu.config(width=self.same_width - 8)
+        i += 1
+
+        bin_pyramid_choice = ["YES", "NO"]
+        self.entry_bin_pyramid_use = tk.StringVar(value=bin_pyramid_choice[-int(self.settings.advanced_settings.use_bin_pyramid.value) - 1])
+        label_bin_pyramid_use = tk.Label(self.adv_settings, text="Use bin pyramid:", font=label_font, bg="#f5f5f5", fg="#555")
+        label_bin_pyramid_use.grid(row=i, column=0, pady=2)
+        bin_pyramid_menu = ttk.OptionMenu(self.adv_settings, self.entry_bin_pyramid_use, self.entry_bin_pyramid_use.get(), *bin_pyramid_choice)
+
+        bin_pyramid_menu.grid(row=i, column=1, pady=2, padx=5)
+        bin_pyramid_menu.config(width=self.same_width - 8)
+        i += 1
+
         give_me_space3 = tk.Label(self.adv_settings, text="  ", bg="#f5f5f5")
         give_me_space3.grid(row=i, column=1)
         i += 1
@@ -560,7 +617,15 @@ class ProteinLigandAnalyzerApp:
             self.settings.advanced_settings.analysis_processes.value = self.type_returning_int(self.entry_num_process_analysis, "Advanced settings: Num of analysis processes")
             self.settings.advanced_settings.cache_size.value = self.type_returning_float(self.entry_max_cache_size, "Advanced settings: Max cache size (GB)")
             self.catalyst_manager.set_cache_threshold(self.settings.advanced_settings.cache_size.value)
+            self.settings.advanced_settings.memory_cache_size.value = self.type_returning_float(self.entry_max_memory_cache_size, "Advanced settings: Max memory cache size (GB)")
+            self.catalyst_manager.set_memory_cache_threshold(self.settings.advanced_settings.memory_cache_size.value)
             self.settings.advanced_settings.use_cache.value = self.entry_cache_use.get() == "YES"
+            self.settings.advanced_settings.compress_cache.value = self.entry_cache_compress.get() == "YES"
+            self.catalyst_manager.set_cache_compression(self.settings.advanced_settings.compress_cache.value)
+            self.settings.advanced_settings.cache_eviction_policy.value = self.entry_cache_eviction.get()
+            self.catalyst_manager.set_cache_eviction_policy(self.settings.advanced_settings.cache_eviction_policy.value)
+            self.settings.advanced_settings.use_mz_index.value = self.entry_mz_index_use.get() == "YES"
+            self.settings.advanced_settings.use_bin_pyramid.value = self.entry_bin_pyramid_use.get() == "YES"
             self.adv_settings.destroy()
         except ValueError as e:
             self.error(str(e), "log show")
@@ -615,7 +680,13 @@ class ProteinLigandAnalyzerApp:
         self.del_refill_entry(self.entry_num_process_analysis, self.settings.advanced_settings.analysis_processes.value)
         self.del_refill_entry(self.entry_max_cache_size, self.settings.advanced_settings.cache_size.value)
         self.catalyst_manager.set_cache_threshold(self.settings.advanced_settings.cache_size.value)
+        self.del_refill_entry(self.entry_max_memory_cache_size, self.settings.advanced_settings.memory_cache_size.value)
+        self.catalyst_manager.set_memory_cache_threshold(self.settings.advanced_settings.memory_cache_size.value)
         self.entry_cache_use.set("YES" if self.settings.advanced_settings.use_cache.value else "NO")
+        self.entry_cache_compress.set("YES" if self.settings.advanced_settings.compress_cache.value else "NO")
+        self.entry_cache_eviction.set(self.settings.advanced_settings.cache_eviction_policy.value)
+        self.entry_mz_index_use.set("YES" if self.settings.advanced_settings.use_mz_index.value else "NO")
+        self.entry_bin_pyramid_use.set("YES" if self.settings.advanced_settings.use_bin_pyramid.value else "NO")
 
     @staticmethod
     def type_returning_float(entry, name):
@@ -649,14 +720,25 @@ class ProteinLigandAnalyzerApp:
             self.analyze_button.config(state=tk.NORMAL)  # Enable the Analyze button
 
             try:
-                # Fill in the last scan number
                 if not loading_setting:
-                    self.settings.general_settings.analysis_end.value = get_number_of_scans(file_path, self.callback)
+                    # Read the file once into its scan sidecar, which also records the number of scans and the min/max m/z values
+                    try:
+                        sidecar = open_scan_sidecar(file_path, self.callback, self.settings.advanced_settings.parse_processes.value)
+                        number_of_scans = sidecar.get_number_of_scans()
+                        max_mz, min_mz = sidecar.get_max_and_min_mz()
+                    except OSError as e:
+                        if isinstance(e, FileNotFoundError):
+                            raise
+                        self.error(f"Scan sidecar not available. {type(e).__name__}: {e}", "log")
+                        number_of_scans = get_number_of_scans(file_path, self.callback)
+                        max_mz, min_mz = get_max_and_min_mz(file_path, self.callback)
+
+                    # Fill in the last scan number
+                    self.settings.general_settings.analysis_end.value = number_of_scans
                     self.entry_end_x_analysis.delete(0, tk.END)
                     self.entry_end_x_analysis.insert(0, f"{self.settings.general_settings.analysis_end.value}")
 
-                    # Get min/max m/z values from file
-                    max_mz, min_mz = get_max_and_min_mz(file_path, self.callback)
+                    # Set min/max m/z values from file
                     self.settings.untargeted_settings.start_mz.value = float(int(min_mz))
                     self.settings.untargeted_settings.end_mz.value = float(int(max_mz + 0.9999))
             except ValueError as e:
@@ -746,8 +828,14 @@ class ProteinLigandAnalyzerApp:
         elif mode == "export cache":
             expo_cache_path = filedialog.askdirectory(title="Select a folder where the cache is export to as a zip-folder")
             if expo_cache_path:
+                # Offer to export only the cache files of the selected data file, e.g. to hand them to a colleague
+                data_path = self.settings.general_settings.data_path.value
+                data_files = None
+                if data_path and os.path.isfile(data_path) and messagebox.askyesno("Export cache", f"Export only the cache of the data file '{os.path.basename(data_path)}'?"):
+                    data_files = [data_path]
+
                 try:
-                    self.catalyst_manager.export_cache(expo_cache_path)
+                    self.catalyst_manager.export_cache(expo_cache_path, data_files)
                 except Exception as e:
                     self.export_cache.config(bg="#2196F3")
                     self.cache_export_label.forget()
@@ -950,6 +1038,9 @@ class ProteinLigandAnalyzerApp:
                 num_processes=self.settings.advanced_settings.parse_processes.value,
                 num_processes_analysis=self.settings.advanced_settings.analysis_processes.value,
                 use_cache= self.settings.advanced_settings.use_cache.value,
+                use_mz_index=self.settings.advanced_settings.use_mz_index.value,
+                use_bin_pyramid=self.settings.advanced_settings.use_bin_pyramid.value,
+                worker_pool=self.worker_pool,
                 catalyst_manager=self.catalyst_manager,
                 callback_function=self.callback,
                 error_function=self.error
@@ -982,7 +1073,10 @@ class ProteinLigandAnalyzerApp:
                 window_length=self.settings.advanced_settings.filter_window.value,
                 polyorder=self.settings.advanced_settings.filter_polyorder.value,
                 normalization_mode={"No": 1, "Individual": 2, "Together": 3}[self.settings.output_settings.normalization_mode.value],
+                num_processes=self.settings.advanced_settings.parse_processes.value,
                 use_cache=self.settings.advanced_settings.use_cache.value,
+                use_mz_index=self.settings.advanced_settings.use_mz_index.value,
+                worker_pool=self.worker_pool,
                 catalyst_manager=self.catalyst_manager,
                 callback_function=self.callback,
                 error_function=self.error
@@ -4,9 +4,13 @@ import multiprocessing
 
 def main():
     root = tk.Tk()
-    ProteinLigandAnalyzerApp(root)
+    app = ProteinLigandAnalyzerApp(root)
     root.mainloop()
 
+    # Stop the worker processes if the window was closed without the close dialog
+    app.worker_pool.shutdown()
+    app.catalyst_manager.flush_cache_writes()
+
 if __name__ == "__main__":
     multiprocessing.freeze_support()  # Necessary for PyInstaller
     multiprocessing.set_start_method("spawn")  # Ensures proper behavior on Windows
@@ -0,0 +1,113 @@
+import threading
+from collections import OrderedDict
+
+
+class MemoryCache:
+    """
+        Least recently used cache of objects in memory with a budget in GB, shared by all analyses of the process.
+        Entries are evicted in least recently used order once their size exceeds the budget.
+    """
+    def __init__(self, max_size: float = 1.0):
+        """
+            Class to keep recently used objects in memory.
+
+            Parameters:
+                max_size (float): Maximum size of the entries in GB. Default is 1.0.
+
+            Returns:
+                Instance of the class.
+        """
+        self.max_size = max(max_size, 0.0)
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        """Returns the number of entries."""
+        return len(self.entries)
+
+    def set_max_size(self, max_size: float):
+        """
+            Set the maximum size and evict entries until the cache meets it.
+
+            Parameters:
+                max_size (float): Maximum size of the entries in GB.
+        """
+        with self.lock:
+            self.max_size = max(max_size, 0.0)
+            self._evict()
+
+    def get(self, key: tuple):
+        """
+            Returns the value of an entry and marks it as most recently used.
+
+            Parameters:
+                key (tuple): Key of the entry.
+
+            Returns:
+                Value of the entry or None if there is no entry for key.
+        """
+        with self.lock:
+            if key not in self.entries:
+                return None
+
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+    def find(self, predicate):
+        """
+            Returns the most recently used entry whose key fulfills predicate and marks it as most recently used.
+
+            Parameters:
+                predicate (function): Function that takes a key and returns True for a matching entry.
+
+            Returns:
+                Tuple of key and value of the entry, both None if no entry matches.
+        """
+        with self.lock:
+            for key in reversed(self.entries):
+                if predicate(key):
+                    self.entries.move_to_end(key)
+                    return key, self.entries[key][0]
+
+        return None, None
+
+    def put(self, key: tuple, value, nbytes: int):
+        """
+            Adds or replaces an entry as most recently used and evicts least recently used entries if the cache exceeds its maximum size.
+            Values larger than the maximum size are not stored.
+
+            Parameters:
+                key (tuple): Key of the entry.
+                value: Value of the entry, it is shared with the callers of get and must not be modified.
+                nbytes (int): Size of the value in bytes.
+
+            Returns:
+                bool: True if the value was stored.
+        """
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+
+            if nbytes > self.max_size * 1024**3:
+                return False
+
+            self.entries[key] = (value, nbytes)
+            self.size += nbytes
+            self._evict()
+
+            return True
+
+    def clear(self):
+        """
+            Removes all entries.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _evict(self):
+        """Removes least recently used entries until the cache is not larger than its maximum size. The lock has to be held."""
+        while self.entries and self.size > self.max_size * 1024**3:
+            _, (_, nbytes) = self.entries.popitem(last=False)
+            self.size -= nbytes
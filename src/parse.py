@@ -1,175 +1,1880 @@
+import hashlib
+import json
+import mmap
 import re
+import struct
 import threading
 import time
 import os
+import warnings
+import zlib
+from array import array
 from collections import defaultdict
 from multiprocessing.pool import Pool
 from multiprocessing import cpu_count
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from src.worker_pool import use_pool
+
+# Binary scan sidecar written next to the input file
+SCAN_SIDECAR_EXTENSION = ".scans"
+SCAN_SIDECAR_VERSION = 4
+_SCAN_SIDECAR_MAGIC = b"CATALYST-SCANS\x00\x00"
+_SCAN_SIDECAR_ALIGNMENT = 64
+
+# Number of binning tasks per process, more tasks balance the load better but cost more scheduling
+_TASKS_PER_PROCESS = 8
+
+# Number of (scan, window) pairs ScanStore.get_average_intensities locates at once, bounds its temporary arrays for many windows
+_AVERAGE_BLOCK_CELLS = 1 << 18
+
+# Binary file of a TimelineMatrix, used by the timeline cache
+TIMELINE_MATRIX_VERSION = 1
+_TIMELINE_MATRIX_MAGIC = b"CATALYST-TLMAT\x00\x00"
+
+# Number of values per zlib chunk of compressed arrays, parts of an array can be read by decompressing only their chunks
+_COMPRESSION_CHUNK_LENGTH = 1 << 16
+
+# Binary file of a BinPyramid, fine cells of all peaks of a function that areas of any sampling range are derived from
+BIN_PYRAMID_VERSION = 1
+BIN_PYRAMID_BASE_RADIUS = 0.005
+_BIN_PYRAMID_MAGIC = b"CATALYST-BINPYR\x00"
+_MZ_TICKS = 10**6
+
+# Optional m/z index written next to the input file
+MZ_INDEX_EXTENSION = ".mzindex"
+MZ_INDEX_VERSION = 1
+_MZ_INDEX_MAGIC = b"CATALYST-MZIDX\x00\x00"
+
+# Content fingerprint of input files, used as their identity in the timeline cache
+FINGERPRINT_VERSION = 1
+_FINGERPRINT_BLOCK_SIZE = 64 * 1024
+_FINGERPRINT_BLOCKS = 16
 
 
 def get_number_of_scans(filepath: str, callback_function):
     """
-        Returns the number of scans in the file.
+        Returns the number of scans in the file.
+
+        Parameters:
+            filepath (str): Path to the file.
+            callback_function (function): Callback function to print text to the GUI or the log.
+
+        Returns:
+            int: Number of scans in the file.
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+            ValueError: If no scan number can be found in the file.
+    """
+    start_time = time.time()
+
+    if not os.path.exists(filepath):
+        raise FileNotFoundError(f"File not found: {filepath}")
+
+    # Regex to match `scan=`
+    scan_regex = re.compile(r"scan=(\d+)")
+
+
+    # Open the file in reverse order
+    with open(filepath, 'rb') as file:
+        file.seek(0, os.SEEK_END)  # Move to the end of the file
+        position = file.tell()
+        buffer_size = 8192  # Read in chunks
+
+        while position > 0:
+            # Calculate chunk size
+            read_size = min(buffer_size, position)
+            position -= read_size
+            file.seek(position)
+            chunk = file.read(read_size).decode('utf-8', errors='ignore')
+
+            # Process lines in reverse order
+            for line in reversed(chunk.splitlines()):
+                match = scan_regex.search(line)
+                if match:
+                    scan_number = int(match.group(1))
+                    callback_function(f"Number of scans in the file: {scan_number}", "log")
+                    callback_function(f"Time taken to get number of scans: {time.time() - start_time:.2f} seconds.", "log")
+                    return scan_number
+
+        # If no match is found, raise an error
+        raise ValueError("No 'scan=' information found in the file.")
+
+def get_max_and_min_mz(filepath: str, callback_function):
+    """
+        Returns the maximum and minimum m/z values in the file by processing only a percentage of lines.
+
+        Parameters:
+            filepath (str): Path to the file.
+            callback_function (function): Callback function to print text to the GUI or the log.
+
+        Returns:
+            Tuple containing the maximum and minimum m/z values.
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+            ValueError: If no usable data can be found in the file.
+    """
+    start_time = time.time()
+
+    if not os.path.exists(filepath):
+        raise FileNotFoundError(f"File not found: {filepath}")
+
+    max_mz = float('-inf')
+    min_mz = float('inf')
+
+    with open(filepath, 'r') as file:
+        previous_line = ""
+        previous_line_digit = False
+        s_present = True
+
+        for line in file:
+            # Check if the current line starts with 'S' and check for max m/z value of previous scan
+            if previous_line_digit and line.startswith('S'):
+                max_mz = max(max_mz, float(previous_line.split()[0]))
+
+                s_present = True
+                previous_line_digit = False
+                previous_line = line
+                continue
+
+            # Check if current line is first value of a scan for min m/z value
+            if s_present and previous_line.startswith('I'):
+                previous_line_digit = line[0].isdigit()
+                if previous_line_digit:
+                    min_mz = min(min_mz, float(line.split()[0]))
+                    s_present = False
+
+            # Keep track of the previous line
+            previous_line = line
+
+    if min_mz == float('inf') and max_mz == float('-inf'):
+        raise ValueError("No usable data found.")
+
+    callback_function(f"Max m/z: {max_mz}.", "log")
+    callback_function(f"Min m/z: {min_mz}.", "log")
+    callback_function(f"Time taken to get max and min m/z values: {time.time() - start_time:.2f} seconds.", "log")
+
+    return max_mz, min_mz
+
+def get_scan_sidecar_path(filepath: str):
+    """
+        Returns the path of the binary scan sidecar belonging to the given file.
+
+        Parameters:
+            filepath (str): Path to the .ms1/.txt file.
+
+        Returns:
+            str: Path of the sidecar file.
+    """
+    return f"{filepath}{SCAN_SIDECAR_EXTENSION}"
+
+def get_mz_index_path(filepath: str):
+    """
+        Returns the path of the m/z index belonging to the given file.
+
+        Parameters:
+            filepath (str): Path to the .ms1/.txt file.
+
+        Returns:
+            str: Path of the index file.
+    """
+    return f"{filepath}{MZ_INDEX_EXTENSION}"
+
+def get_temp_path(path: str):
+    """
+        Returns a temporary path next to the given path that is unique per process and thread. Files are written to it
+        and then renamed to the given path, so other processes sharing the directory never see a partly written file.
+
+        Parameters:
+            path (str): Path of the file to write.
+
+        Returns:
+            str: Temporary path ending with '.tmp'.
+    """
+    return f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+
+def get_file_fingerprint(filepath: str):
+    """
+        Returns a fingerprint of the content of the given file, built from its size, the hashes of evenly spaced sampled blocks
+        (including the first and the last block) and the creation date in its header. Path and modification time are not part of it,
+        so copies of the file on other paths or machines have the same fingerprint, while the file is only partially read.
+
+        Parameters:
+            filepath (str): Path to the .ms1/.txt file.
+
+        Returns:
+            str: Fingerprint as hexadecimal string.
+
+        Raises:
+            OSError: If the file can not be read.
+    """
+    size = os.path.getsize(filepath)
+    fingerprint = hashlib.blake2b(f"{FINGERPRINT_VERSION}:{size}".encode("utf-8"), digest_size=16)
+    creation_date = None
+
+    with open(filepath, 'rb') as file:
+        # Positions of the sampled blocks, the whole file is hashed if it is not larger than the sampled blocks
+        last_block = max(size - _FINGERPRINT_BLOCK_SIZE, 0)
+        positions = sorted({last_block * index // (_FINGERPRINT_BLOCKS - 1) for index in range(_FINGERPRINT_BLOCKS)})
+        if size <= _FINGERPRINT_BLOCK_SIZE * _FINGERPRINT_BLOCKS:
+            positions = range(0, max(size, 1), _FINGERPRINT_BLOCK_SIZE)
+
+        for position in positions:
+            file.seek(position)
+            block = file.read(_FINGERPRINT_BLOCK_SIZE)
+            fingerprint.update(hashlib.blake2b(block, digest_size=16).digest())
+
+            # The header with the creation date is at the start of the file
+            if position == 0:
+                for line in block.splitlines():
+                    if b"CreationDate" in line:
+                        creation_date = line.split(b"CreationDate", maxsplit=1)[1].strip().decode('utf-8', errors='ignore')
+                        break
+
+    fingerprint.update(f":{creation_date}".encode("utf-8"))
+
+    return fingerprint.hexdigest()
+
+def _align(position: int):
+    """Returns the next position aligned to the sidecar alignment."""
+    return -(-position // _SCAN_SIDECAR_ALIGNMENT) * _SCAN_SIDECAR_ALIGNMENT
+
+def _write_array_file(path: str, magic: bytes, header: dict, arrays: dict, compress: bool = False):
+    """
+        Writes arrays into a binary file with the layout of the scan sidecar (magic, header length, JSON header, aligned arrays).
+        The file is written to a temporary file first and then replaces path, so readers never see a partially written file.
+
+        Parameters:
+            path (str): Path of the file to write.
+            magic (bytes): Magic bytes identifying the kind of file.
+            header (dict): Header values, the layout of the arrays is added as "arrays".
+            arrays (dict): Arrays to write with their name as key.
+            compress (bool): Flag to compress the arrays with zlib in chunks of _COMPRESSION_CHUNK_LENGTH values, so parts of them can be read
+                             without decompressing the whole array. Compressed arrays can not be memory-mapped. Default is False.
+
+        Raises:
+            OSError: If the file can not be written.
+    """
+    arrays = {name: values.astype(values.dtype.newbyteorder('<'), copy=False) for name, values in arrays.items()}
+    compressed = {name: [zlib.compress(values[start:start + _COMPRESSION_CHUNK_LENGTH].tobytes(), 1) for start in range(0, len(values), _COMPRESSION_CHUNK_LENGTH)]
+                  for name, values in arrays.items()} if compress else {}
+
+    # Layout of the arrays behind the header, positions are relative to the start of the data section
+    layout = {}
+    position = 0
+    for name, values in arrays.items():
+        layout[name] = {"dtype": values.dtype.str, "length": len(values), "position": position}
+        if name in compressed:
+            layout[name]["chunk_length"] = _COMPRESSION_CHUNK_LENGTH
+            layout[name]["compressed_sizes"] = [len(chunk) for chunk in compressed[name]]
+        position = _align(position + sum(layout[name].get("compressed_sizes", [values.nbytes])))
+
+    encoded_header = json.dumps({**header, "arrays": layout}).encode("utf-8")
+
+    temp_path = get_temp_path(path)
+    try:
+        with open(temp_path, 'wb') as file:
+            file.write(magic)
+            file.write(struct.pack("<Q", len(encoded_header)))
+            file.write(encoded_header)
+            data_start = _align(file.tell())
+
+            for name, values in arrays.items():
+                file.seek(data_start + layout[name]["position"])
+                if name in compressed:
+                    for chunk in compressed[name]:
+                        file.write(chunk)
+                else:
+                    values.tofile(file)
+
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def _read_array_file_header(path: str, magic: bytes, version: int):
+    """
+        Reads the header of a binary file with the layout of the scan sidecar.
+
+        Parameters:
+            path (str): Path of the file to read.
+            magic (bytes): Magic bytes the file has to start with.
+            version (int): Version the file has to have.
+
+        Returns:
+            Tuple of the header and the position of the data section in the file.
+
+        Raises:
+            ValueError: If the file has not the given magic bytes or version.
+    """
+    with open(path, 'rb') as file:
+        if file.read(len(magic)) != magic:
+            raise ValueError(f"'{path}' has an unknown format.")
+        header_length = struct.unpack("<Q", file.read(8))[0]
+        header = json.loads(file.read(header_length).decode("utf-8"))
+
+    if header.get("version") != version:
+        raise ValueError(f"'{path}' has an unsupported version.")
+
+    return header, _align(len(magic) + 8 + header_length)
+
+def _read_array(path: str, data_start: int, spec: dict, start: int = 0, end: int = None):
+    """
+        Reads the values [start:end] of an array of a binary file with the layout of the scan sidecar.
+        Uncompressed arrays are memory-mapped, of compressed arrays only the chunks containing the values are read and decompressed.
+
+        Parameters:
+            path (str): Path of the file to read.
+            data_start (int): Position of the data section in the file.
+            spec (dict): Layout of the array from the header of the file.
+            start (int): Index of the first value to read. Default is 0.
+            end (int): Index behind the last value to read. Default is None for the end of the array.
+
+        Returns:
+            numpy.ndarray: Read-only values of the array.
+    """
+    end = spec["length"] if end is None else min(end, spec["length"])
+    if end <= start:
+        return np.empty(0, dtype=spec["dtype"])
+
+    itemsize = np.dtype(spec["dtype"]).itemsize
+
+    if "compressed_sizes" not in spec:
+        return np.memmap(path, dtype=spec["dtype"], mode='r', offset=data_start + spec["position"] + start * itemsize, shape=(end - start,)).view(np.ndarray)
+
+    chunk_length = spec["chunk_length"]
+    first_chunk, last_chunk = start // chunk_length, (end - 1) // chunk_length
+    positions = np.concatenate(([0], np.cumsum(spec["compressed_sizes"]))).tolist()
+
+    with open(path, 'rb') as file:
+        file.seek(data_start + spec["position"] + positions[first_chunk])
+        chunks = [zlib.decompress(file.read(positions[chunk + 1] - positions[chunk])) for chunk in range(first_chunk, last_chunk + 1)]
+
+    values = np.frombuffer(b"".join(chunks), dtype=spec["dtype"])
+    return values[start - first_chunk * chunk_length:end - first_chunk * chunk_length]
+
+def _read_array_file(path: str, magic: bytes, version: int):
+    """
+        Reads the header of a binary file with the layout of the scan sidecar and memory-maps its arrays. Compressed arrays are read into memory.
+
+        Parameters:
+            path (str): Path of the file to read.
+            magic (bytes): Magic bytes the file has to start with.
+            version (int): Version the file has to have.
+
+        Returns:
+            Tuple of the header and a dictionary of the read-only arrays with their name as key.
+
+        Raises:
+            ValueError: If the file has not the given magic bytes or version.
+    """
+    header, data_start = _read_array_file_header(path, magic, version)
+
+    return header, {name: _read_array(path, data_start, spec) for name, spec in header["arrays"].items()}
+
+def is_compressed_array_file(path: str):
+    """
+        Returns whether a binary file with the layout of the scan sidecar, e.g. a timeline matrix or bin pyramid, holds zlib compressed arrays.
+        Only the header of the file is read.
+
+        Parameters:
+            path (str): Path of the file to check.
+
+        Returns:
+            bool: True if at least one array of the file is compressed, False otherwise.
+
+        Raises:
+            ValueError: If the file has no valid header.
+    """
+    with open(path, 'rb') as file:
+        # All kinds of files share the length of the magic bytes
+        file.seek(len(_TIMELINE_MATRIX_MAGIC))
+        header_length = file.read(8)
+        if len(header_length) != 8:
+            raise ValueError(f"'{path}' has an unknown format.")
+        header = json.loads(file.read(struct.unpack("<Q", header_length)[0]).decode("utf-8"))
+
+    return any("compressed_sizes" in spec for spec in header.get("arrays", {}).values())
+
+def _parse_scans(lines, metadata: dict):
+    """
+        Parses the lines of an .ms1/.txt file and yields every scan of every function in file order.
+
+        Parameters:
+            lines (iterable): Lines of the file.
+            metadata (dict): Dictionary to store the creation date of the file header in (key "CreationDate").
+
+        Yields:
+            Tuple of function number, scan number, mass/charge array and intensity array of a scan.
+    """
+    # Variables to cache data while parsing a scan and yield it after finishing the scan
+    current_function = None
+    current_scan = None
+    current_mz = array('d')
+    current_intensity = array('d')
+
+    # Regex for detecting metadata efficiently
+    function_scan_regex = re.compile(r"function=(\d+)|scan=(\d+)")
+
+    for line in lines:
+        first_char = line[0]
+        if first_char.isdigit():  # Data line, most frequent case
+            if current_function is not None:
+                # Parsing of mass and intensity
+                mass, intensity = line.split(maxsplit=1)
+                current_mz.append(float(mass))
+                current_intensity.append(float(intensity))
+
+        elif first_char == 'S':  # Scan boundary
+            if current_function is not None and current_scan is not None:
+                yield current_function, current_scan, current_mz, current_intensity
+
+            # Reset scan data
+            current_function = None
+            current_scan = None
+            current_mz = array('d')
+            current_intensity = array('d')
+
+        elif first_char == 'I':  # Metadata, only after a scan boundary
+            # Extract metadata with regex
+            for match in function_scan_regex.findall(line):
+                if match[0]:  # function=
+                    current_function = int(match[0])
+                elif match[1]:  # scan=
+                    current_scan = int(match[1])
+
+        elif first_char == 'H':  # Header, only at the beginning of the file
+            # Extract creation date
+            if "CreationDate" in line:
+                metadata["CreationDate"] = line.split("CreationDate", maxsplit=1)[1].strip()
+
+    # Yield the last scan
+    if current_function is not None and current_scan is not None:
+        yield current_function, current_scan, current_mz, current_intensity
+
+def _split_at_scan_boundaries(filepath: str, num_ranges: int):
+    """
+        Splits a file into up to num_ranges byte ranges of similar size. Every range except the first starts at a scan boundary ('S' line).
+
+        Parameters:
+            filepath (str): Path to the file.
+            num_ranges (int): Number of ranges to split the file into.
+
+        Returns:
+            List of tuples with start (included) and end (excluded) byte offset of each range.
+    """
+    file_size = os.path.getsize(filepath)
+    boundaries = [0]
+
+    with open(filepath, 'rb') as file:
+        for i in range(1, max(num_ranges, 1)):
+            position = max(file_size * i // num_ranges, boundaries[-1] + 1)
+            if position >= file_size:
+                break
+
+            # Move to the start of the next line and search the next scan boundary from there
+            file.seek(position - 1)
+            file.readline()
+            while True:
+                line_start = file.tell()
+                line = file.readline()
+                if not line or line.startswith(b'S'):
+                    break
+
+            if not line:
+                break
+            if line_start > boundaries[-1]:
+                boundaries.append(line_start)
+
+    boundaries.append(file_size)
+
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+def _read_byte_range(file, start: int, end: int):
+    """
+        Yields the decoded lines of a binary file between the byte offsets start (included) and end (excluded).
+
+        Parameters:
+            file: File opened in binary mode.
+            start (int): Byte offset of the first line.
+            end (int): Byte offset behind the last line.
+    """
+    file.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        line = file.readline()
+        if not line:
+            break
+        remaining -= len(line)
+        yield line.decode('utf-8', errors='ignore')
+
+def _parse_peak_block(block: bytes):
+    """
+        Converts a block of peak lines into a mass/charge array and an intensity array with a single NumPy call.
+        Falls back to parsing line by line if the block contains anything but peak lines.
+
+        Parameters:
+            block (bytes): Peak lines of one scan.
+
+        Returns:
+            Tuple of mass/charge array and intensity array.
+    """
+    block = block.rstrip()
+    number_of_lines = block.count(b'\n') + 1 if block else 0
+
+    try:
+        with warnings.catch_warnings():
+            # Depending on the version NumPy only warns and returns the values read so far if the block contains other data
+            warnings.simplefilter("ignore", DeprecationWarning)
+            values = np.fromstring(block, dtype=np.float64, sep=' ')
+    except ValueError:
+        values = None
+
+    if values is not None and len(values) == 2 * number_of_lines:
+        values = values.reshape(-1, 2)
+        return np.ascontiguousarray(values[:, 0]), np.ascontiguousarray(values[:, 1])
+
+    # Block contains blank or metadata lines, only keep the peak lines
+    mz_values = array('d')
+    intensities = array('d')
+    for line in block.split(b'\n'):
+        if line[:1].isdigit():
+            mass, intensity = line.split(maxsplit=1)
+            mz_values.append(float(mass))
+            intensities.append(float(intensity))
+
+    return np.frombuffer(mz_values, dtype=np.float64), np.frombuffer(intensities, dtype=np.float64)
+
+def _parse_scan_blocks(filepath: str, start: int, end: int, metadata: dict):
+    """
+        Parses the scans in a byte range of a memory-mapped .ms1/.txt file and yields every scan of every function in file order.
+        Instead of converting each peak line, the block of peak lines of a scan is converted at once by _parse_peak_block.
+        Yields the same scans as _parse_scans.
+
+        Parameters:
+            filepath (str): Path to the file.
+            start (int): Byte offset of the first line, must be the start of the file or a scan boundary.
+            end (int): Byte offset behind the last line, must be the end of the file or a scan boundary.
+            metadata (dict): Dictionary to store the creation date of the file header in (key "CreationDate").
+
+        Yields:
+            Tuple of function number, scan number, mass/charge array and intensity array of a scan.
+    """
+    if end <= start:
+        return
+
+    function_scan_regex = re.compile(rb"function=(\d+)|scan=(\d+)")
+
+    with open(filepath, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        def next_scan_start(position: int):
+            """Helper function to find the start of the next scan boundary line at or after position."""
+            if buffer[position:position + 1] == b'S' and (position == 0 or buffer[position - 1:position] == b'\n'):
+                return position
+            boundary = buffer.find(b'\nS', position, end)
+            return end if boundary < 0 else boundary + 1
+
+        scan_start = next_scan_start(start)
+
+        # Header, only at the beginning of the file
+        for line in buffer[start:scan_start].split(b'\n'):
+            if line.startswith(b'H') and b"CreationDate" in line:
+                metadata["CreationDate"] = line.split(b"CreationDate", maxsplit=1)[1].strip().decode('utf-8', errors='ignore')
+
+        while scan_start < end:
+            scan_end = next_scan_start(scan_start + 1)
+
+            # Metadata lines between the scan boundary and the first peak line
+            current_function = None
+            current_scan = None
+            line_start = scan_start
+            while line_start < scan_end and not buffer[line_start:line_start + 1].isdigit():
+                line_end = buffer.find(b'\n', line_start, scan_end)
+                line_end = scan_end if line_end < 0 else line_end
+                if buffer[line_start:line_start + 1] == b'I':
+                    for match in function_scan_regex.findall(buffer[line_start:line_end]):
+                        if match[0]:  # function=
+                            current_function = int(match[0])
+                        elif match[1]:  # scan=
+                            current_scan = int(match[1])
+                line_start = line_end + 1
+
+            if current_function is not None and current_scan is not None:
+                mz_values, intensities = _parse_peak_block(buffer[line_start:scan_end])
+                yield current_function, current_scan, mz_values, intensities
+
+            scan_start = scan_end
+
+def _iter_byte_range_scans(filepath: str, start: int, end: int, metadata: dict, vectorized: bool):
+    """
+        Yields every scan in a byte range of a file with the line based or the vectorized parser.
+
+        Parameters:
+            filepath (str): Path to the file.
+            start (int): Byte offset of the first line, must be the start of the file or a scan boundary.
+            end (int): Byte offset behind the last line, must be the end of the file or a scan boundary.
+            metadata (dict): Dictionary to store the creation date of the file header in (key "CreationDate").
+            vectorized (bool): Flag to convert whole peak blocks with NumPy instead of line by line.
+
+        Yields:
+            Tuple of function number, scan number, mass/charge array and intensity array of a scan.
+    """
+    if vectorized:
+        yield from _parse_scan_blocks(filepath, start, end, metadata)
+    else:
+        with open(filepath, 'rb') as file:
+            yield from _parse_scans(_read_byte_range(file, start, end), metadata)
+
+def _merge_function_summaries(summaries: dict, other_summaries: dict):
+    """
+        Merges the function summaries of a later part of a file into summaries.
+
+        Parameters:
+            summaries (dict): Summaries {function_number: {"scans": int, "last_scan": int, "min_mz": float, "max_mz": float}, ...} to update.
+            other_summaries (dict): Summaries of the later part of the file.
+    """
+    for function, other in other_summaries.items():
+        summary = summaries.setdefault(function, {"scans": 0, "last_scan": 0, "min_mz": None, "max_mz": None})
+        summary["scans"] += other["scans"]
+        summary["last_scan"] = max(summary["last_scan"], other["last_scan"])
+        for key, select in (("min_mz", min), ("max_mz", max)):
+            if other[key] is not None:
+                summary[key] = other[key] if summary[key] is None else select(summary[key], other[key])
+
+def _convert_byte_range(filepath: str, start: int, end: int, mz_path: str, intensity_path: str, vectorized: bool = True):
+    """
+        Parses the scans in a byte range of a file and writes their peaks to two temporary files. Runs in a worker process.
+
+        Parameters:
+            filepath (str): Path to the file.
+            start (int): Byte offset of the first line, must be the start of the file or a scan boundary.
+            end (int): Byte offset behind the last line, must be the end of the file or a scan boundary.
+            mz_path (str): Path of the temporary file for the m/z values.
+            intensity_path (str): Path of the temporary file for the intensities.
+            vectorized (bool): Flag to convert whole peak blocks with NumPy instead of line by line. Default is True.
+
+        Returns:
+            Tuple of the number of peaks, function numbers and scan numbers of each scan, the function summaries and the creation date.
+    """
+    metadata = {"CreationDate": None}
+    function_summaries = {}
+    lengths = array('q')
+    functions = array('q')
+    scans = array('q')
+
+    with open(mz_path, 'wb') as mz_file, open(intensity_path, 'wb') as intensity_file:
+        for function, scan, mz_values, intensities in _iter_byte_range_scans(filepath, start, end, metadata, vectorized):
+            mz_values.tofile(mz_file)
+            intensities.tofile(intensity_file)
+            lengths.append(len(mz_values))
+            functions.append(function)
+            scans.append(scan)
+
+            # Record scan count and m/z bounds of the function, peaks of a scan are sorted by m/z
+            _merge_function_summaries(function_summaries, {function: {"scans": 1, "last_scan": scan,
+                                                                      "min_mz": float(mz_values[0]) if len(mz_values) else None,
+                                                                      "max_mz": float(mz_values[-1]) if len(mz_values) else None}})
+
+    return lengths, functions, scans, function_summaries, metadata["CreationDate"]
+
+def _parse_byte_range(filepath: str, start: int, end: int, vectorized: bool = True):
+    """
+        Parses the scans in a byte range of a file. Runs in a worker process.
+
+        Parameters:
+            filepath (str): Path to the file.
+            start (int): Byte offset of the first line, must be the start of the file or a scan boundary.
+            end (int): Byte offset behind the last line, must be the end of the file or a scan boundary.
+            vectorized (bool): Flag to convert whole peak blocks with NumPy instead of line by line. Default is True.
+
+        Returns:
+            Tuple of a list of scans (function number, scan number, mass/charge array, intensity array) in file order and the creation date.
+    """
+    metadata = {"CreationDate": None}
+
+    parsed_scans = list(_iter_byte_range_scans(filepath, start, end, metadata, vectorized))
+
+    return parsed_scans, metadata["CreationDate"]
+
+def _map_byte_ranges(worker, filepath: str, num_processes: int, extra_arguments=None):
+    """
+        Splits a file at scan boundaries and applies worker to every byte range, in parallel if num_processes is larger than one.
+
+        Parameters:
+            worker (function): Module level function called with filepath, start and end of a range and the extra arguments of the range.
+            filepath (str): Path to the file.
+            num_processes (int): Number of processes to use.
+            extra_arguments (function): Function returning a tuple of additional arguments for the range with the given index. Default is None.
+
+        Returns:
+            List of the worker results in file order.
+    """
+    # Assure not to many processes are started
+    num_processes = max(1, min(num_processes, cpu_count() - 2))
+
+    ranges = _split_at_scan_boundaries(filepath, num_processes)
+    arguments = [(filepath, start, end, *(extra_arguments(i) if extra_arguments else ())) for i, (start, end) in enumerate(ranges)]
+
+    if len(arguments) > 1:
+        with Pool(processes=len(arguments)) as pool:
+            return pool.starmap(worker, arguments)
+
+    return [worker(*argument) for argument in arguments]
+
+def write_scan_sidecar(filepath: str, callback_function, sidecar_path: str = None, num_processes: int = 1, vectorized: bool = True):
+    """
+        Converts an .ms1/.txt file once into a binary sidecar with flat arrays of all m/z values, all intensities,
+        per-scan offsets, function numbers and scan numbers of every scan in the file.
+        The same pass records the creation date and the scan count and min/max m/z value of every function in the sidecar header.
+        Scans are stored ordered by function and scan number, so the peaks of each function form one contiguous block that can be
+        opened as a ScanStore, and windows of scans can be found by binary search.
+        Peaks are streamed to temporary files while parsing, so the conversion does not hold the file content in memory.
+        The file is split at scan boundaries into byte ranges which are parsed by separate processes and merged in file order.
+
+        Parameters:
+            filepath (str): Path to the file.
+            callback_function (function): Callback function to print text to the GUI or the log.
+            sidecar_path (str): Path of the sidecar to write. Default is the path given by get_scan_sidecar_path.
+            num_processes (int): Number of processes to parse the file with. Default is 1.
+            vectorized (bool): Flag to convert whole peak blocks with NumPy instead of line by line. Default is True.
+
+        Returns:
+            str: Path of the written sidecar.
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+            OSError: If the sidecar can not be written.
+    """
+    start_time = time.time()
+
+    if not os.path.exists(filepath):
+        raise FileNotFoundError(f"File not found: {filepath}")
+
+    sidecar_path = sidecar_path or get_scan_sidecar_path(filepath)
+    source_stat = os.stat(filepath)
+    callback_function(f"Converting '{filepath}' into scan sidecar '{sidecar_path}'.", "log print")
+
+    creation_date = None
+    function_summaries = {}
+    lengths = array('q')
+    functions = array('q')
+    scans = array('q')
+
+    # Position of the peaks of each scan in the temporary files
+    temp_files = array('q')
+    temp_starts = array('q')
+
+    temp_paths = []
+    temp_path = get_temp_path(sidecar_path)
+
+    def range_paths(index: int):
+        """Helper function to create the paths of the temporary files of a byte range."""
+        paths = (get_temp_path(f"{sidecar_path}.{index}.mz"), get_temp_path(f"{sidecar_path}.{index}.intensity"))
+        temp_paths.append(paths)
+        return *paths, vectorized
+
+    try:
+        results = _map_byte_ranges(_convert_byte_range, filepath, num_processes, range_paths)
+
+        # Merge the scans of all ranges in file order
+        for range_id, (range_lengths, range_functions, range_scans, range_summaries, range_creation_date) in enumerate(results):
+            position = 0
+            for length in range_lengths:
+                temp_files.append(range_id)
+                temp_starts.append(position)
+                position += length
+            lengths.extend(range_lengths)
+            functions.extend(range_functions)
+            scans.extend(range_scans)
+            _merge_function_summaries(function_summaries, range_summaries)
+            creation_date = creation_date or range_creation_date
+
+        # Order the scans by function and scan number, the scans of each function form a contiguous part of the sidecar
+        order = np.lexsort((np.array(scans, dtype=np.int64), np.array(functions, dtype=np.int64)))
+        functions = np.array(functions, dtype=np.int64)[order]
+        scans = np.array(scans, dtype=np.int64)[order]
+        offsets = np.zeros(len(order) + 1, dtype=np.int64)
+        np.cumsum(np.array(lengths, dtype=np.int64)[order], out=offsets[1:])
+
+        for function, summary in function_summaries.items():
+            summary["index_start"] = int(np.searchsorted(functions, function, side='left'))
+            summary["index_end"] = int(np.searchsorted(functions, function, side='right'))
+
+        # Layout of the arrays behind the header, positions are relative to the start of the data section
+        layout = {}
+        position = 0
+        for name, dtype, length in (("mz", "<f8", int(offsets[-1])), ("intensity", "<f8", int(offsets[-1])), ("offsets", "<i8", len(offsets)),
+                                    ("functions", "<i8", len(functions)), ("scans", "<i8", len(scans))):
+            layout[name] = {"dtype": dtype, "length": length, "position": position}
+            position = _align(position + length * np.dtype(dtype).itemsize)
+
+        header = json.dumps({
+            "version": SCAN_SIDECAR_VERSION,
+            "source_size": source_stat.st_size,
+            "source_mtime_ns": source_stat.st_mtime_ns,
+            "creation_date": creation_date,
+            "functions": {str(function): summary for function, summary in function_summaries.items()},
+            "arrays": layout
+        }).encode("utf-8")
+
+        with open(temp_path, 'wb') as sidecar:
+            sidecar.write(_SCAN_SIDECAR_MAGIC)
+            sidecar.write(struct.pack("<Q", len(header)))
+            sidecar.write(header)
+            data_start = _align(sidecar.tell())
+
+            mz_paths, intensity_paths = zip(*temp_paths)
+            for name, source in (("mz", mz_paths), ("intensity", intensity_paths), ("offsets", offsets), ("functions", functions), ("scans", scans)):
+                sidecar.seek(data_start + layout[name]["position"])
+                if isinstance(source, tuple):
+                    # Copy the peaks of each scan from the temporary files of the ranges in the order of the sidecar
+                    range_files = [open(path, 'rb') for path in source]
+                    try:
+                        for index in order.tolist():
+                            range_file = range_files[temp_files[index]]
+                            range_file.seek(temp_starts[index] * 8)
+                            sidecar.write(range_file.read(lengths[index] * 8))
+                    finally:
+                        for range_file in range_files:
+                            range_file.close()
+                else:
+                    source.astype(dtype=layout[name]["dtype"], copy=False).tofile(sidecar)
+
+        os.replace(temp_path, sidecar_path)
+    finally:
+        for path in [path for paths in temp_paths for path in paths] + [temp_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    callback_function(f"Scan sidecar with {len(scans)} scans and {offsets[-1]} peaks written in {time.time() - start_time:.2f} seconds.", "log print")
+
+    return sidecar_path
+
+def open_scan_sidecar(filepath: str, callback_function, num_processes: int = 1):
+    """
+        Returns the scan sidecar of the given file. The sidecar is (re)built if it does not exist or belongs to an older version of the file,
+        so the file is read at most once for its data, scan count, m/z bounds and creation date.
+
+        Parameters:
+            filepath (str): Path to the file.
+            callback_function (function): Callback function to print text to the GUI or the log.
+            num_processes (int): Number of processes to parse the file with if the sidecar has to be built. Default is 1.
+
+        Returns:
+            ScanSidecar: Memory-mapped scan sidecar of the file.
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+            OSError: If the sidecar can not be written.
+    """
+    if not os.path.exists(filepath):
+        raise FileNotFoundError(f"File not found: {filepath}")
+
+    sidecar_path = get_scan_sidecar_path(filepath)
+
+    if os.path.exists(sidecar_path):
+        try:
+            sidecar = ScanSidecar(sidecar_path)
+            if sidecar.matches(filepath):
+                callback_function(f"Scan sidecar '{sidecar_path}' opened.", "log")
+                return sidecar
+            callback_function(f"Scan sidecar '{sidecar_path}' is outdated.", "log")
+
+            # Release the mapped arrays, so the outdated sidecar can be replaced
+            del sidecar
+        except (ValueError, KeyError) as e:
+            callback_function(f"Scan sidecar '{sidecar_path}' is unreadable. {type(e).__name__}: {e}", "log")
+
+    write_scan_sidecar(filepath, callback_function, sidecar_path, num_processes)
+
+    return ScanSidecar(sidecar_path)
+
+class ScanStore:
+    """
+        Array-backed store of the scans of one function.
+        The peaks of all scans are kept in one contiguous m/z buffer and one contiguous intensity buffer. The peaks of the scan
+        at position i are mz[offsets[i]:offsets[i + 1]] (CSR layout), sorted by m/z. Scans are sorted by scan number.
+    """
+    def __init__(self, scan_numbers, offsets, mz, intensity):
+        """
+            Class to hold the scans of one function.
+
+            Parameters:
+                scan_numbers (numpy.ndarray): Ascending scan numbers of the scans.
+                offsets (numpy.ndarray): Offsets of the scans into the peak buffers. Starts with 0 and has one entry more than scan_numbers.
+                mz (numpy.ndarray): Mass/charge values of all peaks (float64).
+                intensity (numpy.ndarray): Intensities of all peaks (float64 or float32).
+
+            Returns:
+                Instance of the class.
+        """
+        self.scan_numbers = scan_numbers
+        self.offsets = offsets
+        self.mz = mz
+        self.intensity = intensity
+
+    @classmethod
+    def from_scans(cls, scans, intensity_dtype=np.float64):
+        """
+            Creates a store by copying scans into contiguous buffers.
+
+            Parameters:
+                scans (iterable): Tuples of scan number, mass/charge array and intensity array.
+                intensity_dtype (numpy.dtype): Data type of the intensity buffer, float32 halves its size. Default is float64.
+
+            Returns:
+                ScanStore: Store with the given scans.
+        """
+        scans = sorted(scans, key=lambda scan: scan[0])
+
+        offsets = np.zeros(len(scans) + 1, dtype=np.int64)
+        np.cumsum([len(mz_values) for _, mz_values, _ in scans], out=offsets[1:])
+
+        if not scans:
+            return cls(np.empty(0, dtype=np.int64), offsets, np.empty(0, dtype=np.float64), np.empty(0, dtype=intensity_dtype))
+
+        return cls(np.array([scan for scan, _, _ in scans], dtype=np.int64), offsets,
+                   np.concatenate([np.asarray(mz_values, dtype=np.float64) for _, mz_values, _ in scans]),
+                   np.concatenate([np.asarray(intensities, dtype=np.float64) for _, _, intensities in scans]).astype(intensity_dtype, copy=False))
+
+    def __len__(self):
+        """Returns the number of scans."""
+        return len(self.scan_numbers)
+
+    @property
+    def number_of_peaks(self):
+        """Returns the number of peaks of all scans."""
+        return int(self.offsets[-1])
+
+    @property
+    def nbytes(self):
+        """Returns the number of bytes of the arrays of the store."""
+        return self.scan_numbers.nbytes + self.offsets.nbytes + self.mz.nbytes + self.intensity.nbytes
+
+    def get_scan(self, index: int):
+        """
+            Returns the peaks of the scan at the given position as views into the buffers.
+
+            Parameters:
+                index (int): Position of the scan (not its scan number).
+
+            Returns:
+                Tuple of mass/charge array and intensity array.
+        """
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.mz[start:end], self.intensity[start:end]
+
+    def get_scan_range(self, start: int, end: int):
+        """
+            Returns the scans at the positions start (included) to end (excluded).
+            The buffers of the returned store are views that only cover its own peaks, so it can be sent to other processes cheaply.
+
+            Parameters:
+                start (int): Position of the first scan.
+                end (int): Position behind the last scan.
+
+            Returns:
+                ScanStore: Store with the scans in the range.
+        """
+        start, end, _ = slice(start, end).indices(len(self))
+        end = max(start, end)
+        peak_start, peak_end = self.offsets[start], self.offsets[end]
+
+        return ScanStore(self.scan_numbers[start:end], self.offsets[start:end + 1] - peak_start, self.mz[peak_start:peak_end], self.intensity[peak_start:peak_end])
+
+    def items(self):
+        """
+            Yields the scans in order of their scan numbers.
+
+            Yields:
+                Tuple of scan number and a tuple of mass/charge array and intensity array.
+        """
+        for index, scan in enumerate(self.scan_numbers.tolist()):
+            yield scan, self.get_scan(index)
+
+    def get_max_and_min_mz(self):
+        """
+            Returns the maximum and minimum m/z values of all scans.
+
+            Returns:
+                Tuple containing the maximum and minimum m/z values.
+
+            Raises:
+                ValueError: If the store has no peaks.
+        """
+        not_empty = self.offsets[1:] > self.offsets[:-1]
+        if not not_empty.any():
+            raise ValueError("No usable data found.")
+
+        # Peaks of a scan are sorted by m/z, so only the first and last peak of each scan have to be compared
+        return float(self.mz[self.offsets[1:][not_empty] - 1].max()), float(self.mz[self.offsets[:-1][not_empty]].min())
+
+    def get_window(self, first_scan: int = None, last_scan: int = None, min_mz: float = None, max_mz: float = None):
+        """
+            Returns the scans inside a scan window with their peaks restricted to a m/z window.
+            The scan window is found by binary search in the scan numbers and returned as views into the buffers.
+            Peaks are only copied if the m/z window actually removes peaks, and then only the peaks inside the window.
+
+            Parameters:
+                first_scan (int): First scan number of the window (included). Default is None for the first scan.
+                last_scan (int): Last scan number of the window (included). Default is None for the last scan.
+                min_mz (float): Lower limit of the m/z window (included). Default is None for no lower limit.
+                max_mz (float): Upper limit of the m/z window (excluded). Default is None for no upper limit.
+
+            Returns:
+                ScanStore: Store with the scans and peaks inside the windows.
+        """
+        start = 0 if first_scan is None else int(np.searchsorted(self.scan_numbers, first_scan, side='left'))
+        end = len(self) if last_scan is None else int(np.searchsorted(self.scan_numbers, last_scan, side='right'))
+        store = self.get_scan_range(start, end)
+
+        if min_mz is None and max_mz is None:
+            return store
+
+        # Peaks of a scan are sorted by m/z, so the m/z window is a contiguous part of each scan
+        offsets = store.offsets.tolist()
+        starts = np.empty(len(store), dtype=np.int64)
+        ends = np.empty(len(store), dtype=np.int64)
+        for index in range(len(store)):
+            peak_start, peak_end = offsets[index], offsets[index + 1]
+            mz_values = store.mz[peak_start:peak_end]
+            starts[index] = peak_start + (0 if min_mz is None else np.searchsorted(mz_values, min_mz, side='left'))
+            ends[index] = peak_end if max_mz is None else peak_start + np.searchsorted(mz_values, max_mz, side='left')
+
+        if np.array_equal(starts, store.offsets[:-1]) and np.array_equal(ends, store.offsets[1:]):
+            return store
+
+        lengths = ends - starts
+        window_offsets = np.zeros(len(store) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=window_offsets[1:])
+        indices = np.repeat(starts - window_offsets[:-1], lengths) + np.arange(window_offsets[-1])
+
+        return ScanStore(store.scan_numbers, window_offsets, store.mz[indices], store.intensity[indices])
+
+    def get_average_intensities(self, lower_bounds, upper_bounds):
+        """
+            Returns the average intensity of the peaks inside each m/z window for every scan.
+            The windows of a scan are found by binary search for all windows at once. Scans are processed in blocks of _AVERAGE_BLOCK_CELLS
+            (scan, window) pairs, the peaks inside the windows of a block are summed in one pass, so the temporary arrays do not grow with the number of scans.
+
+            Parameters:
+                lower_bounds (numpy.ndarray): Lower limits of the m/z windows (included).
+                upper_bounds (numpy.ndarray): Upper limits of the m/z windows (excluded).
+
+            Returns:
+                numpy.ndarray: Matrix (windows x scans) of the average intensities rounded to 5 decimals, 0 if a window has no peaks in a scan.
+        """
+        lower_bounds = np.asarray(lower_bounds, dtype=np.float64)
+        upper_bounds = np.asarray(upper_bounds, dtype=np.float64)
+
+        averages = np.zeros((len(lower_bounds), len(self)), dtype=np.float64)
+        if len(lower_bounds) == 0 or self.number_of_peaks == 0:
+            return averages
+
+        offsets = self.offsets.tolist()
+        block_length = max(1, _AVERAGE_BLOCK_CELLS // len(lower_bounds))
+        starts = np.empty((min(block_length, len(self)), len(lower_bounds)), dtype=np.int64)
+        ends = np.empty_like(starts)
+
+        for block_start in range(0, len(self), block_length):
+            block_end = min(block_start + block_length, len(self))
+
+            # Find the peaks inside the windows of each scan of the block, peaks of a scan are sorted by m/z
+            for row, index in enumerate(range(block_start, block_end)):
+                mz_values = self.mz[offsets[index]:offsets[index + 1]]
+                starts[row] = np.searchsorted(mz_values, lower_bounds, side='left') + offsets[index]
+                ends[row] = np.searchsorted(mz_values, upper_bounds, side='left') + offsets[index]
+
+            block_starts = starts[:block_end - block_start]
+            counts = np.maximum(ends[:block_end - block_start] - block_starts, 0)
+            not_empty = counts > 0
+            if not not_empty.any():
+                continue
+
+            # Gather the peaks of all non-empty windows of the block into one array and sum each window with a single reduction
+            window_starts = block_starts[not_empty]
+            window_counts = counts[not_empty]
+            window_offsets = np.zeros(len(window_counts) + 1, dtype=np.int64)
+            np.cumsum(window_counts, out=window_offsets[1:])
+            indices = np.repeat(window_starts - window_offsets[:-1], window_counts) + np.arange(window_offsets[-1])
+            sums = np.add.reduceat(self.intensity[indices].astype(np.float64, copy=False), window_offsets[:-1])
+
+            scan_indices, window_indices = np.nonzero(not_empty)
+            averages[window_indices, scan_indices + block_start] = np.round(sums / window_counts, 5)
+
+        return averages
+
+class MzIndex:
+    """
+        Index of the peaks of one function sorted by m/z, every peak records the position of its scan.
+        A m/z window is a binary search and a contiguous slice, so queries cost time proportional to the peaks inside the window instead of all peaks of the file.
+    """
+    def __init__(self, scans_length: int, mz, intensity, scan_positions):
+        """
+            Class to query m/z windows of one function.
+
+            Parameters:
+                scans_length (int): Number of scans of the function.
+                mz (numpy.ndarray): Ascending mass/charge values of all peaks.
+                intensity (numpy.ndarray): Intensities of the peaks.
+                scan_positions (numpy.ndarray): Position of the scan of each peak in the ScanStore of the function.
+
+            Returns:
+                Instance of the class.
+        """
+        self.scans_length = scans_length
+        self.mz = mz
+        self.intensity = intensity
+        self.scan_positions = scan_positions
+
+    @classmethod
+    def from_store(cls, store: ScanStore):
+        """
+            Creates the index of the peaks of a ScanStore.
+
+            Parameters:
+                store (ScanStore): Scans of the function.
+
+            Returns:
+                MzIndex: Index of the peaks of the store.
+        """
+        # Stable sort keeps peaks with the same m/z in scan order
+        order = np.argsort(store.mz, kind='stable')
+        scan_positions = np.repeat(np.arange(len(store), dtype=np.int32), np.diff(store.offsets))
+
+        return cls(len(store), store.mz[order], store.intensity[order], scan_positions[order])
+
+    def get_window(self, min_mz: float, max_mz: float):
+        """
+            Returns the peaks inside a m/z window as views into the index.
+
+            Parameters:
+                min_mz (float): Lower limit of the m/z window (included).
+                max_mz (float): Upper limit of the m/z window (excluded).
+
+            Returns:
+                Tuple of mass/charge array, intensity array and scan position array.
+        """
+        start, end = np.searchsorted(self.mz, (min_mz, max_mz), side='left')
+        return self.mz[start:end], self.intensity[start:end], self.scan_positions[start:end]
+
+    def get_average_intensities(self, lower_bounds, upper_bounds):
+        """
+            Returns the average intensity of the peaks inside each m/z window for every scan, like ScanStore.get_average_intensities.
+
+            Parameters:
+                lower_bounds (numpy.ndarray): Lower limits of the m/z windows (included).
+                upper_bounds (numpy.ndarray): Upper limits of the m/z windows (excluded).
+
+            Returns:
+                numpy.ndarray: Matrix (windows x scans) of the average intensities rounded to 5 decimals, 0 if a window has no peaks in a scan.
+        """
+        averages = np.zeros((len(lower_bounds), self.scans_length), dtype=np.float64)
+
+        for index, (min_mz, max_mz) in enumerate(zip(lower_bounds, upper_bounds)):
+            _, intensities, scan_positions = self.get_window(min_mz, max_mz)
+            if len(scan_positions) == 0:
+                continue
+
+            # Sum the peaks of the window per scan, peaks of a scan keep their m/z order
+            counts = np.bincount(scan_positions, minlength=self.scans_length)
+            sums = np.bincount(scan_positions, weights=intensities, minlength=self.scans_length)
+            not_empty = counts > 0
+            averages[index, not_empty] = np.round(sums[not_empty] / counts[not_empty], 5)
+
+        return averages
+
+class ScanSidecar:
+    """
+        Read-only view of a binary scan sidecar.
+        All arrays are memory-mapped, so opening a sidecar is cheap and its data is shared through the page cache instead of private memory.
+    """
+    def __init__(self, sidecar_path: str):
+        """
+            Opens the sidecar at sidecar_path.
+
+            Parameters:
+                sidecar_path (str): Path of the sidecar file.
+
+            Returns:
+                Instance of the class.
+
+            Raises:
+                ValueError: If the file is not a scan sidecar of the current version.
+        """
+        self.SIDECAR_PATH = sidecar_path
+
+        header, arrays = _read_array_file(sidecar_path, _SCAN_SIDECAR_MAGIC, SCAN_SIDECAR_VERSION)
+
+        self.source_size = header["source_size"]
+        self.source_mtime_ns = header["source_mtime_ns"]
+        self.creation_date = header["creation_date"]
+        self.function_summaries = {int(function): summary for function, summary in header["functions"].items()}
+
+        self.mz = arrays["mz"]
+        self.intensity = arrays["intensity"]
+        self.offsets = arrays["offsets"]
+        self.functions = arrays["functions"]
+        self.scans = arrays["scans"]
+
+    def matches(self, filepath: str):
+        """
+            Returns True if the sidecar was written for the current version of the file at filepath.
+
+            Parameters:
+                filepath (str): Path to the .ms1/.txt file.
+        """
+        source_stat = os.stat(filepath)
+        return source_stat.st_size == self.source_size and source_stat.st_mtime_ns == self.source_mtime_ns
+
+    def get_number_of_scans(self, function: int = None):
+        """
+            Returns the number of scans in the file.
+
+            Parameters:
+                function (int): Number of the function. Default is None for the highest scan number of all functions.
+
+            Returns:
+                int: Number of scans.
+
+            Raises:
+                ValueError: If the file contains no scans for the function.
+        """
+        summaries = list(self.function_summaries.values()) if function is None else [self.function_summaries.get(function)]
+        if not summaries or None in summaries:
+            raise ValueError(f"No scans for function {function} found in the file." if function is not None else "No 'scan=' information found in the file.")
+
+        return max(summary["last_scan"] for summary in summaries)
+
+    def get_max_and_min_mz(self, function: int = None):
+        """
+            Returns the maximum and minimum m/z values in the file.
+
+            Parameters:
+                function (int): Number of the function. Default is None for the bounds of all functions.
+
+            Returns:
+                Tuple containing the maximum and minimum m/z values.
+
+            Raises:
+                ValueError: If no usable data can be found in the file.
+        """
+        summaries = self.function_summaries.values() if function is None else [self.function_summaries.get(function)]
+        summaries = [summary for summary in summaries if summary and summary["min_mz"] is not None]
+        if not summaries:
+            raise ValueError("No usable data found." if function is None else f"No usable data for function {function} found.")
+
+        return max(summary["max_mz"] for summary in summaries), min(summary["min_mz"] for summary in summaries)
+
+    def get_store(self, function: int):
+        """
+            Returns the scans of the given function as a ScanStore whose buffers are views into the sidecar.
+
+            Parameters:
+                function (int): Number of the function.
+
+            Returns:
+                ScanStore: Scans of the function, empty if the file has no scans for the function.
+        """
+        summary = self.function_summaries.get(function)
+        if summary is None:
+            return ScanStore.from_scans([])
+
+        start, end = summary["index_start"], summary["index_end"]
+        peak_start, peak_end = int(self.offsets[start]), int(self.offsets[end])
+
+        return ScanStore(self.scans[start:end], self.offsets[start:end + 1] - peak_start, self.mz[peak_start:peak_end], self.intensity[peak_start:peak_end])
+
+    def get_content(self):
+        """
+            Returns the scans of all functions as views into the sidecar.
+
+            Returns:
+                Dictionary of ScanStores: {function_number: ScanStore, ...}.
+        """
+        return {function: self.get_store(function) for function in self.function_summaries}
+
+def write_mz_index(filepath: str, content: dict, callback_function, index_path: str = None):
+    """
+        Builds the m/z index of every function of the file and writes it next to the file.
+
+        Parameters:
+            filepath (str): Path to the .ms1/.txt file the content belongs to.
+            content (dict): Scans of the file as {function_number: ScanStore, ...}.
+            callback_function (function): Callback function to print text to the GUI or the log.
+            index_path (str): Path of the index to write. Default is the path given by get_mz_index_path.
+
+        Returns:
+            Dictionary of MzIndex: {function_number: MzIndex, ...}.
+
+        Raises:
+            OSError: If the index can not be written.
+    """
+    start_time = time.time()
+
+    index_path = index_path or get_mz_index_path(filepath)
+    source_stat = os.stat(filepath)
+
+    mz_indexes = {function: MzIndex.from_store(store) for function, store in content.items()}
+
+    arrays = {}
+    for function, mz_index in mz_indexes.items():
+        arrays[f"{function}.mz"] = mz_index.mz
+        arrays[f"{function}.intensity"] = mz_index.intensity
+        arrays[f"{function}.scan_positions"] = mz_index.scan_positions
+
+    _write_array_file(index_path, _MZ_INDEX_MAGIC, {
+        "version": MZ_INDEX_VERSION,
+        "source_size": source_stat.st_size,
+        "source_mtime_ns": source_stat.st_mtime_ns,
+        "functions": {str(function): mz_index.scans_length for function, mz_index in mz_indexes.items()}
+    }, arrays)
+
+    callback_function(f"m/z index '{index_path}' written in {time.time() - start_time:.2f} seconds.", "log print")
+
+    return mz_indexes
+
+def open_mz_index(filepath: str, content: dict, callback_function):
+    """
+        Returns the m/z index of every function of the file. The index is (re)built from content if it does not exist
+        or belongs to an older version of the file. If it can not be written, the built index is only kept in memory.
+
+        Parameters:
+            filepath (str): Path to the .ms1/.txt file.
+            content (dict): Scans of the file as {function_number: ScanStore, ...}.
+            callback_function (function): Callback function to print text to the GUI or the log.
+
+        Returns:
+            Dictionary of MzIndex: {function_number: MzIndex, ...}.
+    """
+    index_path = get_mz_index_path(filepath)
+
+    if os.path.exists(index_path):
+        try:
+            header, arrays = _read_array_file(index_path, _MZ_INDEX_MAGIC, MZ_INDEX_VERSION)
+            source_stat = os.stat(filepath)
+            if source_stat.st_size == header["source_size"] and source_stat.st_mtime_ns == header["source_mtime_ns"]:
+                callback_function(f"m/z index '{index_path}' opened.", "log")
+                return {int(function): MzIndex(scans_length, arrays[f"{function}.mz"], arrays[f"{function}.intensity"], arrays[f"{function}.scan_positions"])
+                        for function, scans_length in header["functions"].items()}
+            callback_function(f"m/z index '{index_path}' is outdated.", "log")
+
+            # Release the mapped arrays, so the outdated index can be replaced
+            del arrays
+        except (ValueError, KeyError) as e:
+            callback_function(f"m/z index '{index_path}' is unreadable. {type(e).__name__}: {e}", "log")
+
+    try:
+        return write_mz_index(filepath, content, callback_function, index_path)
+    except OSError as e:
+        callback_function(f"m/z index '{index_path}' can not be written, keeping it in memory. {type(e).__name__}: {e}", "log")
+        return {function: MzIndex.from_store(store) for function, store in content.items()}
+
+class TimelineMatrix:
+    """
+        Sparse matrix of intensity timelines, one row per mass/charge area and one column per scan.
+        Rows are addressed by an integer index and sorted by their m/z center. Only cells with peaks are stored, row i holds the scans
+        scan_positions[offsets[i]:offsets[i + 1]] with the average intensities values[offsets[i]:offsets[i + 1]] (CSR layout).
+    """
+    def __init__(self, mz_centers, scans_length: int, offsets, scan_positions, values):
+        """
+            Class to hold intensity timelines of mass/charge areas.
+
+            Parameters:
+                mz_centers (numpy.ndarray): Ascending m/z centers of the areas.
+                scans_length (int): Number of scans of each timeline.
+                offsets (numpy.ndarray): Offsets of the rows into scan_positions and values. Starts with 0 and has one entry more than mz_centers.
+                scan_positions (numpy.ndarray): Ascending scan positions of the stored cells of each row.
+                values (numpy.ndarray): Average intensities of the stored cells.
+
+            Returns:
+                Instance of the class.
+        """
+        self.mz_centers = mz_centers
+        self.scans_length = scans_length
+        self.offsets = offsets
+        self.scan_positions = scan_positions
+        self.values = values
+
+    @classmethod
+    def from_cells(cls, mz_centers, scans_length: int, rows, scan_positions, values):
+        """
+            Creates a matrix from cells in any order. Every combination of row and scan position may only appear once.
+
+            Parameters:
+                mz_centers (numpy.ndarray): Ascending m/z centers of the areas.
+                scans_length (int): Number of scans of each timeline.
+                rows (numpy.ndarray): Row of each cell.
+                scan_positions (numpy.ndarray): Scan position of each cell.
+                values (numpy.ndarray): Value of each cell.
+
+            Returns:
+                TimelineMatrix: Matrix with the given cells.
+        """
+        order = np.lexsort((scan_positions, rows))
+
+        offsets = np.zeros(len(mz_centers) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(mz_centers)), out=offsets[1:])
+
+        return cls(np.asarray(mz_centers, dtype=np.float64), scans_length, offsets,
+                   np.asarray(scan_positions, dtype=np.int64)[order], np.asarray(values, dtype=np.float64)[order])
+
+    def __len__(self):
+        """Returns the number of mass/charge areas."""
+        return len(self.mz_centers)
+
+    @property
+    def nbytes(self):
+        """Returns the number of bytes of the arrays of the matrix."""
+        return self.mz_centers.nbytes + self.offsets.nbytes + self.scan_positions.nbytes + self.values.nbytes
+
+    def get_mz_range(self, min_mz: float = None, max_mz: float = None):
+        """
+            Returns the areas with a m/z center inside a m/z window. The arrays of the returned matrix are views into this matrix.
+
+            Parameters:
+                min_mz (float): Lower limit of the m/z window (included). Default is None for no lower limit.
+                max_mz (float): Upper limit of the m/z window (excluded). Default is None for no upper limit.
+
+            Returns:
+                TimelineMatrix: Matrix with the areas inside the window.
+        """
+        start = 0 if min_mz is None else int(np.searchsorted(self.mz_centers, min_mz, side='left'))
+        end = len(self) if max_mz is None else max(start, int(np.searchsorted(self.mz_centers, max_mz, side='left')))
+        cell_start, cell_end = self.offsets[start], self.offsets[end]
+
+        return TimelineMatrix(self.mz_centers[start:end], self.scans_length, self.offsets[start:end + 1] - cell_start,
+                              self.scan_positions[cell_start:cell_end], self.values[cell_start:cell_end])
+
+    def to_dense(self):
+        """
+            Returns all timelines as dense matrix.
+
+            Returns:
+                numpy.ndarray: Matrix (areas x scans) of intensities.
+        """
+        dense = np.zeros((len(self), self.scans_length), dtype=np.float64)
+        dense[np.repeat(np.arange(len(self)), np.diff(self.offsets)), self.scan_positions] = self.values
+        return dense
+
+    def write(self, path: str, header: dict, compress: bool = False):
+        """
+            Writes the matrix into a binary file. Values are stored as float32 and scan positions as int32.
+
+            Parameters:
+                path (str): Path of the file to write.
+                header (dict): Additional values to store in the header of the file, e.g. the creation date and parameters of the timelines.
+                compress (bool): Flag to compress the arrays with zlib. Compressed files are read into memory instead of being memory-mapped, in chunks,
+                                 so m/z ranges can be read without decompressing the whole file. Default is False.
+
+            Raises:
+                OSError: If the file can not be written.
+        """
+        _write_array_file(path, _TIMELINE_MATRIX_MAGIC, {**header, "version": TIMELINE_MATRIX_VERSION, "scans_length": self.scans_length}, {
+            "mz_centers": self.mz_centers.astype(np.float64, copy=False),
+            "offsets": self.offsets.astype(np.int64, copy=False),
+            "scan_positions": self.scan_positions.astype(np.int32, copy=False),
+            "values": self.values.astype(np.float32, copy=False)
+        }, compress)
+
+    @classmethod
+    def read(cls, path: str, min_mz: float = None, max_mz: float = None):
+        """
+            Reads a matrix from a binary file written by write. Uncompressed arrays are memory-mapped.
+            Only the areas with a m/z center inside the m/z window are read, the rows are located with the stored m/z centers and offsets,
+            so of compressed files only the chunks holding their cells are decompressed.
+
+            Parameters:
+                path (str): Path of the file to read.
+                min_mz (float): Lower limit of the m/z window (included). Default is None for no lower limit.
+                max_mz (float): Upper limit of the m/z window (excluded). Default is None for no upper limit.
+
+            Returns:
+                Tuple of the TimelineMatrix and the header of the file.
+
+            Raises:
+                ValueError: If the file is not a timeline matrix of the current version.
+        """
+        header, data_start = _read_array_file_header(path, _TIMELINE_MATRIX_MAGIC, TIMELINE_MATRIX_VERSION)
+        arrays = header["arrays"]
+
+        mz_centers = _read_array(path, data_start, arrays["mz_centers"])
+        start = 0 if min_mz is None else int(np.searchsorted(mz_centers, min_mz, side='left'))
+        end = len(mz_centers) if max_mz is None else max(start, int(np.searchsorted(mz_centers, max_mz, side='left')))
+
+        offsets = _read_array(path, data_start, arrays["offsets"], start, end + 1)
+        cell_start, cell_end = int(offsets[0]), int(offsets[-1])
+
+        return cls(mz_centers[start:end], header["scans_length"], offsets - cell_start, _read_array(path, data_start, arrays["scan_positions"], cell_start, cell_end),
+                   _read_array(path, data_start, arrays["values"], cell_start, cell_end)), header
+
+class BinPyramid:
+    """
+        Summed intensities and peak counts per scan in fine m/z cells, the base level to derive the areas of all sampling ranges from.
+        M/z values are placed on an integer grid of _MZ_TICKS ticks per m/z unit, cells are BIN_PYRAMID_BASE_RADIUS wide.
+        Peaks on a cell boundary get an own cell (id 2*i for boundary i) and peaks inside a cell the id 2*i + 1, so areas with a radius
+        that is an integer multiple of BIN_PYRAMID_BASE_RADIUS are unions of cells and peaks on their edges are assigned like np.rint does.
+        Cells are sorted by id and scan position.
+    """
+    def __init__(self, cell_ids, scans_length: int, scan_positions, sums, counts, mz_bounds: tuple):
+        """
+            Class to hold the fine cells of the scans of a function.
+
+            Parameters:
+                cell_ids (numpy.ndarray): Ascending ids of the cells.
+                scans_length (int): Number of scans of the function.
+                scan_positions (numpy.ndarray): Scan position of each cell.
+                sums (numpy.ndarray): Summed intensity of the peaks of each cell.
+                counts (numpy.ndarray): Number of peaks of each cell.
+                mz_bounds (tuple): Max and min m/z value of the function.
+
+            Returns:
+                Instance of the class.
+        """
+        self.cell_ids = cell_ids
+        self.scans_length = scans_length
+        self.scan_positions = scan_positions
+        self.sums = sums
+        self.counts = counts
+        self.mz_bounds = mz_bounds
+
+    @classmethod
+    def from_cells(cls, cell_ids, scans_length: int, scan_positions, sums, counts, mz_bounds: tuple):
+        """
+            Creates a pyramid from cells in any order. Every combination of cell id and scan position may only appear once.
+
+            Parameters:
+                cell_ids (numpy.ndarray): Id of each cell.
+                scans_length (int): Number of scans of the function.
+                scan_positions (numpy.ndarray): Scan position of each cell.
+                sums (numpy.ndarray): Summed intensity of the peaks of each cell.
+                counts (numpy.ndarray): Number of peaks of each cell.
+                mz_bounds (tuple): Max and min m/z value of the function.
+
+            Returns:
+                BinPyramid: Pyramid with the given cells.
+        """
+        order = np.lexsort((scan_positions, cell_ids))
+
+        return cls(np.asarray(cell_ids, dtype=np.int64)[order], scans_length, np.asarray(scan_positions, dtype=np.int64)[order],
+                   np.asarray(sums, dtype=np.float64)[order], np.asarray(counts, dtype=np.int64)[order], mz_bounds)
+
+    def __len__(self):
+        """Returns the number of cells."""
+        return len(self.cell_ids)
+
+    @property
+    def nbytes(self):
+        """Returns the number of bytes of the arrays of the pyramid."""
+        return self.cell_ids.nbytes + self.scan_positions.nbytes + self.sums.nbytes + self.counts.nbytes
+
+    @staticmethod
+    def supports(radius: float, start_value: float):
+        """
+            Returns if the areas of the given radius and start value can be derived from the cells, which is the case if both are integer multiples
+            of BIN_PYRAMID_BASE_RADIUS.
+
+            Parameters:
+                radius (float): 2*radius is width of mass/charge areas.
+                start_value (float): Lower limit for the center of the first mass/charge area.
+
+            Returns:
+                bool: True if the areas can be derived from the cells.
+        """
+        base_ticks = round(BIN_PYRAMID_BASE_RADIUS * _MZ_TICKS)
+        return all(abs(value * _MZ_TICKS - round(value * _MZ_TICKS)) < 1e-3 and round(value * _MZ_TICKS) % base_ticks == 0 for value in (radius, start_value)) and radius > 0
+
+    def get_timelines(self, radius: float, start_value: float, end_value: float):
+        """
+            Returns the intensity over time for mass/charge areas with a width of 2*radius from start_value to end_value by aggregating adjacent cells.
+            The areas are the same process_chunk computes from the peaks, see supports for the possible values of radius and start_value.
+
+            Parameters:
+                radius (float): 2*radius is width of mass/charge areas. Minimal value is 0.01.
+                start_value (float): Lower limit for the center of the first mass/charge area (included).
+                end_value (float): Upper limit for the center of the last mass/charge area (excluded).
+
+            Returns:
+                TimelineMatrix: Intensity over time for each mass/charge area with peaks, sorted by m/z center.
+        """
+        radius = max(radius, 0.01)
+        base_ticks = round(BIN_PYRAMID_BASE_RADIUS * _MZ_TICKS)
+        cells_per_radius = round(radius * _MZ_TICKS) // base_ticks
+        start_boundary = round(start_value * _MZ_TICKS) // base_ticks
+
+        first_area, end_area = get_area_range(radius, start_value, end_value)
+
+        # Area i spans the cell boundaries from start_boundary + (2i - 1) * cells_per_radius to start_boundary + (2i + 1) * cells_per_radius,
+        # cells are sorted by id, so the cells of the areas are a contiguous part of the arrays
+        first_id = 2 * (start_boundary + (2 * first_area - 1) * cells_per_radius)
+        end_id = 2 * (start_boundary + (2 * end_area - 1) * cells_per_radius) + 1
+        start, end = np.searchsorted(self.cell_ids, [first_id, end_id], side='left').tolist()
+
+        cell_ids = self.cell_ids[start:end]
+        boundaries = (cell_ids >> 1) - start_boundary + cells_per_radius
+        areas = boundaries // (2 * cells_per_radius)
+
+        # Peaks on the edge between two areas go to the even area, like np.rint rounds halves to even
+        on_edge = ((cell_ids & 1) == 0) & (boundaries % (2 * cells_per_radius) == 0) & (areas % 2 == 1)
+        areas[on_edge] -= 1
+
+        inside = (areas >= first_area) & (areas < end_area)
+        areas = areas[inside]
+        scan_positions = self.scan_positions[start:end][inside]
+
+        # Sum intensities and count peaks of the cells per area and scan
+        area_cells, area_cell_ids = np.unique((areas - first_area) * self.scans_length + scan_positions, return_inverse=True)
+        sums = np.bincount(area_cell_ids, weights=self.sums[start:end][inside], minlength=len(area_cells))
+        counts = np.bincount(area_cell_ids, weights=self.counts[start:end][inside], minlength=len(area_cells))
+
+        scans_length = max(self.scans_length, 1)
+        area_ids, area_rows = np.unique(area_cells // scans_length + first_area, return_inverse=True)
+
+        return TimelineMatrix.from_cells([round(start_value + area_id * 2 * radius, 2) for area_id in area_ids.tolist()], self.scans_length, area_rows,
+                                         area_cells % scans_length, sums / counts)
+
+    def write(self, path: str, header: dict, compress: bool = False):
+        """
+            Writes the pyramid into a binary file. Sums are stored as float64, so timelines derived from the file equal those of the pyramid.
+
+            Parameters:
+                path (str): Path of the file to write.
+                header (dict): Additional values to store in the header of the file, e.g. the creation date.
+                compress (bool): Flag to compress the arrays with zlib. Default is False.
+
+            Raises:
+                OSError: If the file can not be written.
+        """
+        _write_array_file(path, _BIN_PYRAMID_MAGIC, {**header, "version": BIN_PYRAMID_VERSION, "scans_length": self.scans_length, "mz_bounds": list(self.mz_bounds),
+                                                     "base_radius": BIN_PYRAMID_BASE_RADIUS, "ticks": _MZ_TICKS}, {
+            "cell_ids": self.cell_ids.astype(np.int64, copy=False),
+            "scan_positions": self.scan_positions.astype(np.int32, copy=False),
+            "sums": self.sums.astype(np.float64, copy=False),
+            "counts": self.counts.astype(np.int32, copy=False)
+        }, compress)
+
+    @classmethod
+    def read(cls, path: str):
+        """
+            Reads a pyramid from a binary file written by write. Uncompressed arrays are memory-mapped.
+
+            Parameters:
+                path (str): Path of the file to read.
+
+            Returns:
+                Tuple of the BinPyramid and the header of the file.
+
+            Raises:
+                ValueError: If the file is not a pyramid of the current version and cell size.
+        """
+        header, arrays = _read_array_file(path, _BIN_PYRAMID_MAGIC, BIN_PYRAMID_VERSION)
+        if header["base_radius"] != BIN_PYRAMID_BASE_RADIUS or header["ticks"] != _MZ_TICKS:
+            raise ValueError(f"'{path}' has an unsupported cell size.")
+
+        return cls(arrays["cell_ids"], header["scans_length"], arrays["scan_positions"], arrays["sums"], arrays["counts"], tuple(header["mz_bounds"])), header
+
+def get_area_range(radius: float, start_value: float, end_value: float):
+    """
+        Returns the indices of the first and behind the last mass/charge area with a width of 2*radius from start_value to end_value.
+        The center of area i is round(start_value + 2 * i * radius, 2).
 
         Parameters:
-            filepath (str): Path to the file.
-            callback_function (function): Callback function to print text to the GUI or the log.
+            radius (float): 2*radius is width of mass/charge areas.
+            start_value (float): Lower limit for the center of the first mass/charge area (included).
+            end_value (float): Upper limit for the center of the last mass/charge area (excluded).
 
         Returns:
-            int: Number of scans in the file.
+            Tuple of the index of the first area and the index behind the last area.
+    """
+    def area_center(i):
+        """Helper function to compute the rounded center of area i."""
+        return round(start_value + 2 * i * radius, 2)
 
-        Raises:
-            FileNotFoundError: If the file does not exist.
-            ValueError: If no scan number can be found in the file.
+    # Centers grow with i, so only indices close to the exact bounds have to be checked
+    first = next(i for i in range(-2, 3) if area_center(i) >= start_value)
+
+    last = int((end_value - start_value) / (2 * radius)) + 2
+    while last >= first and area_center(last) >= end_value:
+        last -= 1
+
+    return first, max(first, last + 1)
+
+def process_chunk(scan_chunk: ScanStore, radius: float, start_value: float, end_value: float):
+    """
+        Returns the summed intensity and number of peaks for mass/charge areas with a width of 2*radius from start_value to end_value for given scans.
+        Area indices are assigned to all peaks at once and summed per area and scan with np.bincount, only cells with peaks are returned.
+
+        Parameters:
+            scan_chunk (ScanStore): Scans for which to compute the area timelines.
+            radius (float): 2*radius is width of mass/charge areas. Minimal value is 0.01.
+            start_value (float): Lower limit for the starting point of the first mass/charge area (included).
+            end_value (float): Upper limit for the starting point of the last mass/charge area (excluded).
+        Returns:
+            Tuple of arrays (area index, scan position in the chunk, intensity sum, peak count) with one entry per area and scan that has peaks.
+            The center of area i is round(start_value + 2 * i * radius, 2).
+
+        Example output:
+            (array([12, 12, 40]), array([0, 1, 1]), array([2000.0, 2100.0, 1900.0]), array([1, 1, 2]))
     """
     start_time = time.time()
 
-    if not os.path.exists(filepath):
-        raise FileNotFoundError(f"File not found: {filepath}")
+    # Assure radius is not bigger than 0.01
+    radius = max(radius, 0.01)
 
-    # Regex to match `scan=`
-    scan_regex = re.compile(r"scan=(\d+)")
+    first_area, end_area = get_area_range(radius, start_value, end_value)
 
+    # Compute mass/charge area of all peaks on the integer grid of BinPyramid, so peaks on the edge between two areas are detected exactly
+    # and go to the even area like np.rint rounds halves, this gives the same areas as deriving them from a BinPyramid
+    radius_ticks = round(radius * _MZ_TICKS)
+    areas, remainders = np.divmod(np.rint(scan_chunk.mz * _MZ_TICKS).astype(np.int64) - round(start_value * _MZ_TICKS) + radius_ticks, 2 * radius_ticks)
+    areas[(remainders == 0) & (areas % 2 == 1)] -= 1
+    scan_positions = np.repeat(np.arange(len(scan_chunk), dtype=np.int64), np.diff(scan_chunk.offsets))
 
-    # Open the file in reverse order
-    with open(filepath, 'rb') as file:
-        file.seek(0, os.SEEK_END)  # Move to the end of the file
-        position = file.tell()
-        buffer_size = 8192  # Read in chunks
+    inside = (areas >= first_area) & (areas < end_area)
+    areas = areas[inside]
+    scan_positions = scan_positions[inside]
+    intensities = scan_chunk.intensity[inside]
 
-        while position > 0:
-            # Calculate chunk size
-            read_size = min(buffer_size, position)
-            position -= read_size
-            file.seek(position)
-            chunk = file.read(read_size).decode('utf-8', errors='ignore')
+    # Sum intensities and count peaks per area and scan, peaks are summed in file order
+    cells, cell_ids = np.unique((areas - first_area) * len(scan_chunk) + scan_positions, return_inverse=True)
+    sums = np.bincount(cell_ids, weights=intensities, minlength=len(cells))
+    counts = np.bincount(cell_ids, minlength=len(cells))
 
-            # Process lines in reverse order
-            for line in reversed(chunk.splitlines()):
-                match = scan_regex.search(line)
-                if match:
-                    scan_number = int(match.group(1))
-                    callback_function(f"Number of scans in the file: {scan_number}", "log")
-                    callback_function(f"Time taken to get number of scans: {time.time() - start_time:.2f} seconds.", "log")
-                    return scan_number
+    message = f"Process {threading.get_ident()}: Finished processing a chunk with {len(scan_chunk)} scans in {time.time() - start_time:.2f} seconds."
 
-        # If no match is found, raise an error
-        raise ValueError("No 'scan=' information found in the file.")
+    return (cells // max(len(scan_chunk), 1) + first_area, cells % max(len(scan_chunk), 1), sums, counts), message
 
-def get_max_and_min_mz(filepath: str, callback_function):
+def process_base_chunk(scan_chunk: ScanStore):
     """
-        Returns the maximum and minimum m/z values in the file by processing only a percentage of lines.
+        Returns the summed intensity and number of peaks in the cells of a BinPyramid for given scans, only cells with peaks are returned.
 
         Parameters:
-            filepath (str): Path to the file.
-            callback_function (function): Callback function to print text to the GUI or the log.
+            scan_chunk (ScanStore): Scans for which to compute the cells.
 
         Returns:
-            Tuple containing the maximum and minimum m/z values.
-
-        Raises:
-            FileNotFoundError: If the file does not exist.
-            ValueError: If no usable data can be found in the file.
+            Tuple of arrays (cell id, scan position in the chunk, intensity sum, peak count) with one entry per cell and scan that has peaks.
     """
     start_time = time.time()
 
-    if not os.path.exists(filepath):
-        raise FileNotFoundError(f"File not found: {filepath}")
+    # Position of the peaks on the integer grid, the remainder tells if a peak is on a cell boundary
+    boundaries, remainders = np.divmod(np.rint(scan_chunk.mz * _MZ_TICKS).astype(np.int64), round(BIN_PYRAMID_BASE_RADIUS * _MZ_TICKS))
+    cell_ids = 2 * boundaries + (remainders != 0)
+    scan_positions = np.repeat(np.arange(len(scan_chunk), dtype=np.int64), np.diff(scan_chunk.offsets))
 
-    max_mz = float('-inf')
-    min_mz = float('inf')
+    # Sum intensities and count peaks per cell and scan
+    cells, inverse = np.unique(cell_ids * len(scan_chunk) + scan_positions, return_inverse=True)
+    sums = np.bincount(inverse, weights=scan_chunk.intensity, minlength=len(cells))
+    counts = np.bincount(inverse, minlength=len(cells))
 
-    with open(filepath, 'r') as file:
-        previous_line = ""
-        previous_line_digit = False
-        s_present = True
+    message = f"Process {threading.get_ident()}: Finished processing a chunk with {len(scan_chunk)} scans in {time.time() - start_time:.2f} seconds."
 
-        for line in file:
-            # Check if the current line starts with 'S' and check for max m/z value of previous scan
-            if previous_line_digit and line.startswith('S'):
-                max_mz = max(max_mz, float(previous_line.split()[0]))
+    return (cells // max(len(scan_chunk), 1), cells % max(len(scan_chunk), 1), sums, counts), message
 
-                s_present = True
-                previous_line_digit = False
-                previous_line = line
-                continue
+def _create_shared_arrays(arrays: dict):
+    """
+        Copies arrays into one block of shared memory that other processes can attach to by its name.
 
-            # Check if current line is first value of a scan for min m/z value
-            if s_present and previous_line.startswith('I'):
-                previous_line_digit = line[0].isdigit()
-                if previous_line_digit:
-                    min_mz = min(min_mz, float(line.split()[0]))
-                    s_present = False
+        Parameters:
+            arrays (dict): Arrays to share with their name as key.
 
-            # Keep track of the previous line
-            previous_line = line
+        Returns:
+            Tuple of the SharedMemory block and the layout {name: (dtype, length, position), ...} of the arrays in it.
+    """
+    layout = {}
+    position = 0
+    for name, values in arrays.items():
+        layout[name] = (values.dtype.str, len(values), position)
+        position = _align(position + values.nbytes)
 
-    if min_mz == float('inf') and max_mz == float('-inf'):
-        raise ValueError("No usable data found.")
+    shared_block = SharedMemory(create=True, size=max(position, 1))
+    for name, values in arrays.items():
+        dtype, length, position = layout[name]
+        np.ndarray((length,), dtype=dtype, buffer=shared_block.buf, offset=position)[:] = values
 
-    callback_function(f"Max m/z: {max_mz}.", "log")
-    callback_function(f"Min m/z: {min_mz}.", "log")
-    callback_function(f"Time taken to get max and min m/z values: {time.time() - start_time:.2f} seconds.", "log")
+    return shared_block, layout
 
-    return max_mz, min_mz
+def _attach_shared_arrays(shared_block, layout: dict):
+    """Returns the arrays of a block of shared memory created by _create_shared_arrays as views into the block."""
+    return {name: np.ndarray((length,), dtype=dtype, buffer=shared_block.buf, offset=position) for name, (dtype, length, position) in layout.items()}
 
-def process_chunk(scan_chunk: list, radius: float, start_value: float, end_value: float):
+def _split_by_peaks(offsets, number_of_chunks: int):
     """
-        Returns the intensity over time for mass/charge areas with a width of 2*radius from start_value to end_value for given scans.
+        Splits scans into chunks with about the same number of peaks. A single scan is never split, so chunks may be larger than the average.
 
         Parameters:
-            scan_chunk (list): List of scans (tuple of scan number and list of tuples with mass/charge and intensity) for which to compute the area timelines.
-            radius (float): 2*radius is width of mass/charge areas. Minimal value is 0.01.
-            start_value (float): Lower limit for the starting point of the first mass/charge area (included).
-            end_value (float): Upper limit for the starting point of the last mass/charge area (excluded).
+            offsets (numpy.ndarray): Offsets of the scans into the peak buffers of a ScanStore.
+            number_of_chunks (int): Number of chunks to aim for.
+
         Returns:
-            Dictionary of List with sum  of intensity over time for each mass/charge area for given scans.
+            List of tuples with the position of the first scan and the position behind the last scan of each chunk.
+    """
+    scans_length = len(offsets) - 1
 
-        Example output:
-            {
-                mass/charge_area1:  [[scan number, sumIntensityScan1, measurementCountScan1], [scan number, sumIntensityScan2, measurementCountScan2], ...],
-                mass/charge_area2:  [[scan number, sumIntensityScan1, measurementCountScan1], [scan number, sumIntensityScan2, measurementCountScan2], ...],
-                ...
-            }
+    # Scan positions closest to equally spaced peak positions
+    bounds = np.searchsorted(offsets, np.linspace(0, offsets[-1], max(1, number_of_chunks) + 1), side='left')
+    bounds = np.unique(np.clip(np.concatenate(([0], bounds, [scans_length])), 0, scans_length)).tolist()
+
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:])] or [(0, scans_length)]
+
+def _process_chunk_task(arguments: tuple):
     """
-    start_time = time.time()
+        Computes the cells of the scans from scan_start to scan_end with kernel (process_chunk or process_base_chunk), as used by Pool.imap_unordered.
+        The scans are read from the source given by TextFileReader._process_chunks_in_processes:
+        ("sidecar", sidecar path, (size, mtime_ns) of the sidecar, function, min m/z, max m/z) to map the scan sidecar and restrict the chunk to the m/z window,
+        or ("shared", name, layout) to attach to a ScanStore in shared memory created by _create_shared_arrays.
 
-    # Assure radius is not bigger than 0.01
-    radius = max(radius, 0.01)
+        Parameters:
+            arguments (tuple): Source of the scans, position of the first scan of the chunk, position behind the last scan of the chunk,
+                               the kernel and the arguments passed to kernel after the scans.
+
+        Returns:
+            Tuple of the position of the first scan of the chunk, the arrays (area or cell index, scan position, intensity sum, peak count) of its cells,
+            the id of the process and the time the process was busy.
 
-    # Dictionary to save timelines of all mass/charge areas
-    local_timelines = defaultdict(list)
+        Raises:
+            ValueError: If the scan sidecar changed since the task was created.
+    """
+    source, scan_start, scan_end, kernel, kernel_arguments = arguments
+    start_time = time.perf_counter()
 
-    # Compute timelines for given scans
+    if source[0] == "sidecar":
+        _, sidecar_path, sidecar_identity, function, min_mz, max_mz = source
 
-    for scan_id, values in scan_chunk:
-        for mass, intensity in values:
-            # Compute mass/charge area center
-            i = round((mass - start_value) / (2 * radius))
-            area_center = round(start_value + 2 * i * radius, 2)
+        # The sidecar is mapped for this task only, so the process does not keep the file open after the run
+        sidecar = ScanSidecar(sidecar_path)
+        sidecar_stat = os.stat(sidecar_path)
+        if (sidecar_stat.st_size, sidecar_stat.st_mtime_ns) != tuple(sidecar_identity):
+            raise ValueError(f"Scan sidecar '{sidecar_path}' changed while binning.")
 
-            if start_value <= area_center < end_value:
-                if len(local_timelines[area_center]) < scan_id:
-                    local_timelines[area_center].append([scan_id, intensity, 1])
-                else:
-                    local_timelines[area_center][-1][1] += intensity
-                    local_timelines[area_center][-1][2] += 1
+        store = sidecar.get_store(function).get_scan_range(scan_start, scan_end).get_window(min_mz=min_mz, max_mz=max_mz)
+        (areas, scan_positions, sums, counts), _ = kernel(store, *kernel_arguments)
 
-        # Add zero values to areas without values in this scan
-        for area in local_timelines:
-            if len(local_timelines[area]) < scan_id:
-                local_timelines[area].append([scan_id, 0, 0])
+        del store, sidecar
+    else:
+        _, shared_name, layout = source
 
-    message = f"Process {threading.get_ident()}: Finished processing a chunk with {len(scan_chunk)} scans in {time.time() - start_time:.2f} seconds."
+        shared_block = SharedMemory(name=shared_name)
+        try:
+            arrays = _attach_shared_arrays(shared_block, layout)
+            store = ScanStore(arrays["scan_numbers"], arrays["offsets"], arrays["mz"], arrays["intensity"])
 
-    return dict(local_timelines), message
+            # The kernels return new arrays, so the cells stay valid after the shared memory is closed
+            (areas, scan_positions, sums, counts), _ = kernel(store.get_scan_range(scan_start, scan_end), *kernel_arguments)
+
+            del store, arrays
+        finally:
+            shared_block.close()
+
+    return scan_start, areas, scan_positions + scan_start, sums, counts, os.getpid(), time.perf_counter() - start_time
 
 class TextFileReader:
     """
         Class to read and process data from a text file.
         If you want to process a new file, you must create a new instance of this class.
     """
-    def __init__(self, file_path: str, catalyst_manager, callback_function, error_function):
+    def __init__(self, file_path: str, catalyst_manager, callback_function, error_function, num_processes: int = 1, use_mz_index: bool = False, worker_pool=None,
+                 use_bin_pyramid: bool = False):
         """
             Class to analyse the file given by file_path.
 
@@ -178,6 +1883,11 @@ class TextFileReader:
                 catalyst_manager (CATALYST_manager): DASM_dir object that manages the CATALYST directory.
                 callback_function (function): Callback function to print text to the GUI or the log.
                 error_function (function): Callback function to print errors to the GUI or the log.
+                num_processes (int): Number of processes to parse the file with. Default is 1.
+                use_mz_index (bool): Flag to answer m/z queries from an index of the peaks sorted by m/z, which is built once per file. Default is False.
+                worker_pool (WorkerPool): Long-lived pool of the application to bin timelines with. Default is None to start a new pool for each run.
+                use_bin_pyramid (bool): Flag to derive all timelines of a function from its bin pyramid, which is built from all peaks of the function once
+                                        and then serves other sampling ranges and m/z ranges. Default is False to bin only the requested range.
 
             Returns:
                 Instance of the class.
@@ -188,34 +1898,80 @@ class TextFileReader:
 
         # Remove the file extension
         self.filename_without_extension = os.path.splitext(os.path.basename(self.FILE_PATH))[0]
+        # Key of the cache entries of the file, the fingerprint of its content (set on first use)
+        self.cache_key = None
 
         # File data
         self.FILE_CONTENT = None
+        # Path of the scan sidecar backing self.FILE_CONTENT, None if the file was parsed into memory
+        self.sidecar_path = None
         self.CreationDate = None
-        self.function = None
-        self.min_mz = None
-        self.max_mz = None
+        self.mz_bounds = {}
+        self.mz_indexes = None
+        # Fine cells of the functions that untargeted timelines are derived from {function_number: BinPyramid, ...}
+        self.bin_pyramids = {}
 
         self.CallbackFunction = callback_function
         self.ErrorFunction = error_function
+        self.num_processes = num_processes
+        self.use_mz_index = use_mz_index
+        self.use_bin_pyramid = use_bin_pyramid
+        self.worker_pool = worker_pool
 
-    def _read_content(self, function: int):
+    def _get_cache_key(self):
         """
-            Returns the content of the file given by self.FILE_PATH for a given function and sets the min/max m_z value for this file.
-
-            Parameters:
-                function (int): Number of the function to read from file.
+            Returns the key of the cache entries of the file, the fingerprint of its content.
+            The file name is used instead if the file can not be read, e.g. to still look up cached timelines of a moved file.
 
             Returns:
-                Dictionaries of Lists: {scan_number: [(mass/charge, intensity),(mass/charge, intensity), ...], ...} for given function number.
+                str: Cache key of the file.
+        """
+        if self.cache_key is None:
+            try:
+                self.cache_key = self.CATALYST_MANAGER.get_data_file_key(self.FILE_PATH)
+            except OSError as e:
+                self.ErrorFunction(f"Fingerprint of '{self.FILE_PATH}' not available, using the file name as cache key.\n{type(e).__name__}: {e}", "log")
+                self.cache_key = self.filename_without_extension
+
+        return self.cache_key
+
+    def _read_content(self):
+        """
+            Reads the content of all functions of the file given by self.FILE_PATH in one pass and sets the min/max m_z values for each function.
+            Afterward self.FILE_CONTENT has the format {function_number: ScanStore, ...}.
+            Scans read before in this session are taken from the memory cache of the CATALYST manager.
         """
+        cached = self.CATALYST_MANAGER.load_scans_from_memory(self._get_cache_key())
+        if cached is not None:
+            self.FILE_CONTENT, self.mz_bounds, self.CreationDate, self.sidecar_path = cached
+            self.CallbackFunction(f"Scans of '{self.FILE_PATH}' taken from memory.", "log")
+            return
+
         try:
-            # Read file from self.FILE_PATH
-            self.FILE_CONTENT = self._parse(function=function)
-            self.function = function
+            try:
+                # Open the scan sidecar of self.FILE_PATH, it is created by parsing the file once if necessary
+                sidecar = open_scan_sidecar(self.FILE_PATH, self.CallbackFunction, self.num_processes)
+            except FileNotFoundError:
+                raise
+            except (OSError, ValueError) as e:
+                # Sidecar can not be written or read, e.g. in a read-only directory
+                self.ErrorFunction(f"Scan sidecar not available, parsing '{self.FILE_PATH}' instead.\n{type(e).__name__}: {e}", "log")
+                sidecar = None
+
+            if sidecar is not None:
+                self.FILE_CONTENT = sidecar.get_content()
+                self.sidecar_path = sidecar.SIDECAR_PATH
+                self.CreationDate = sidecar.creation_date
+
+                # Store min and max m_z values appearing in the file for each function, both are recorded while converting the file
+                self.mz_bounds = {function: (summary["max_mz"], summary["min_mz"]) for function, summary in sidecar.function_summaries.items() if summary["min_mz"] is not None}
+            else:
+                self.FILE_CONTENT = self._parse()
 
-            # Store min and max m_z value appearing in the file for the given function
-            self.max_mz, self.min_mz = get_max_and_min_mz(self.FILE_PATH, self.CallbackFunction)
+                # Store min and max m_z values appearing in the parsed data for each function
+                self.mz_bounds = {function: store.get_max_and_min_mz() for function, store in self.FILE_CONTENT.items() if store.number_of_peaks}
+
+            self.CATALYST_MANAGER.save_scans_to_memory(self._get_cache_key(), self.FILE_CONTENT, self.mz_bounds, self.CreationDate, self.sidecar_path)
         except FileNotFoundError:
             #raise FileNotFoundError(f"The file '{self.FILE_PATH}' was not found.")
             self.ErrorFunction(f"The file '{self.FILE_PATH}' was not found.", "log show")
@@ -223,6 +1979,75 @@ class TextFileReader:
             #raise IOError(f"An issue occurred while reading '{self.FILE_PATH}'.\n{type(e).__name__}: {e}")
             self.ErrorFunction(f"An issue occurred while reading '{self.FILE_PATH}'.\n{type(e).__name__}: {e}", "log show")
 
+    def _get_function_content(self, function: int):
+        """
+            Returns the content of the given function and its min/max m_z values. The file is read on first use.
+
+            Parameters:
+                function (int): Number of the function.
+
+            Returns:
+                Tuple of the function content as ScanStore and a tuple of the max and min m_z value.
+
+            Raises:
+                ValueError: If the file has no data for the function.
+        """
+        # If the file has not been processed, start the processing
+        if self.FILE_CONTENT is None:
+            self._read_content()
+
+        if not self.FILE_CONTENT or function not in self.mz_bounds:
+            raise ValueError(f"No data for function {function} in file.")
+
+        return self.FILE_CONTENT[function], self.mz_bounds[function]
+
+    def _get_timeline_source(self, function: int):
+        """
+            Returns the object to compute timelines of the given function with, the m/z index if it is enabled or else the scans of the function.
+
+            Parameters:
+                function (int): Number of the function.
+
+            Returns:
+                Tuple of the ScanStore or MzIndex of the function and a tuple of the max and min m_z value.
+
+            Raises:
+                ValueError: If the file has no data for the function.
+        """
+        content, bounds = self._get_function_content(function)
+
+        if not self.use_mz_index:
+            return content, bounds
+
+        # The index of all functions is opened or built on first use
+        if self.mz_indexes is None:
+            self.mz_indexes = open_mz_index(self.FILE_PATH, self.FILE_CONTENT, self.CallbackFunction)
+
+        return self.mz_indexes[function], bounds
+
+    def get_scan_window(self, function: int, first_scan: int = None, last_scan: int = None, min_mz: float = None, max_mz: float = None):
+        """
+            Returns the scans of a function inside a scan window with their peaks restricted to a m/z window.
+            Scans and peaks outside the windows are skipped without being read if the file is backed by a scan sidecar.
+            The scan window is a view into the scans of the function, peaks are only copied if the m/z window removes some of them.
+
+            Parameters:
+                function (int): Number of the function.
+                first_scan (int): First scan number of the window (included). Default is None for the first scan of the function.
+                last_scan (int): Last scan number of the window (included). Default is None for the last scan of the function.
+                min_mz (float): Lower limit of the m/z window (included). Default is None for no lower limit.
+                max_mz (float): Upper limit of the m/z window (excluded). Default is None for no upper limit.
+
+            Returns:
+                ScanStore: Scans and peaks inside the given windows.
+
+            Raises:
+                ValueError: If the file has no data for the function.
+        """
+        content, _ = self._get_function_content(function)
+
+        return content.get_window(first_scan, last_scan, min_mz, max_mz)
+
     def get_intensity_timeline(self, m_z: float, area_range: float, function: int,use_cache: bool):
         """
             Returns the intensity over time for a given mass/charge (m/z).
@@ -241,7 +2066,7 @@ class TextFileReader:
         self.CallbackFunction(f"Calculating intensity timeline for {m_z} m/z...", "log print")
 
         if use_cache:
-            cached_timeline, creation_date = self.CATALYST_MANAGER.load_timeline_from_cache(self.filename_without_extension, area_range, function, m_z)
+            cached_timeline, creation_date = self.CATALYST_MANAGER.load_timeline_from_cache(self._get_cache_key(), area_range, function, m_z)
 
             if cached_timeline:
                 self.CallbackFunction("Cache hit. Returning cached timeline.", "log print")
@@ -252,52 +2077,107 @@ class TextFileReader:
         else:
             self.CallbackFunction("Cache disabled. Starting processing data.", "log print")
 
-        # If the file has not been processed, start the processing
-        if not self.FILE_CONTENT or self.function != function:
-            self._read_content(function)
+        start_time = time.time()
+        content, (max_mz, min_mz) = self._get_timeline_source(function)
 
         radius = area_range / 2
 
         # Ensure that the mz value exists in the file content by checking the min and max values in the file content
-        if not (self.min_mz - radius <= m_z <= self.max_mz + radius):
+        if not (min_mz - radius <= m_z <= max_mz + radius):
             raise ValueError(f"No data for given mass/charge value {m_z} in file.")
 
-        # List to store intensity over time for the given m/z
-        timeline = []
+        # Otherwise, compute the average intensity in the radius around m/z for each scan or 0 if no values were in radius
+        timeline = [average if average else 0 for average in content.get_average_intensities([m_z - radius], [m_z + radius])[0].tolist()]
 
-        # Otherwise, process the m/z data from the file content
-        for scan_id, values in self.FILE_CONTENT.items():
-            sum_values_in_radius = 0
-            values_in_radius = 0
+        self.CallbackFunction(f"Intensity timeline for {m_z} m/z created.", "log print")
+
+        # Cache timeline if enabled
+        if use_cache:
+            self.CATALYST_MANAGER.save_timeline_cache(self._get_cache_key(), function, area_range, m_z, timeline, self.CreationDate, time.time() - start_time)
 
-            # Retrieve all values in the radius around m/z
-            # Use get_bin method if available
-            data = next(((m, intensity) for m, intensity in values if m_z - radius <= m < m_z + radius), None)
-            if data is not None:
-                index = values.index(data)
-                while values[index][0] < m_z + radius:
-                    sum_values_in_radius += values[index][1]
-                    values_in_radius += 1
-                    index += 1
+        return timeline
 
-            # Compute the average intensity for this scan or 0 if no values were in radius
-            average_intensity = round(sum_values_in_radius / values_in_radius, 5) if values_in_radius > 0 else 0
+    def get_intensity_timelines(self, mz_list: list, area_range: float, function: int, use_cache: bool):
+        """
+            Returns the intensity over time for several mass/charge (m/z) values at once.
+            Values are averaged around each m/z by a radius of area_range/2. Timelines that are not cached are extracted together in one pass over the scans,
+            so the runtime hardly grows with the number of m/z values. The file is only read if at least one timeline is not cached.
+            Mass/charge values outside the m/z range of the function have a timeline of zeros and are reported to the error function.
 
-            # Save the average intensity for this scan
-            timeline.append(average_intensity)
+            Parameters:
+                mz_list (list): Mass/charge values for which to retrieve intensity over time.
+                area_range (float): Range of the mass/charge areas to collect and average data from.
+                function (int): Function number of the data to analyze.
+                use_cache (bool): Flag to enable/disable caching.
 
-        self.CallbackFunction(f"Intensity timeline for {m_z} m/z created.", "log print")
+            Returns:
+                numpy.ndarray: Matrix (mass/charge values x scans) of intensities. Row i belongs to mz_list[i], column j corresponds to scan j+1.
 
-        # Cache timeline if enabled
+            Raises:
+                ValueError: If the file has no data for the function.
+        """
+        self.CallbackFunction(f"Calculating intensity timelines for {len(mz_list)} m/z values...", "log print")
+
+        start_time = time.time()
+        radius = area_range / 2
+
+        # Load cached timelines of all m/z values at once first, so the file is not read if all timelines are cached
+        cached_timelines = {}
         if use_cache:
-            self.CATALYST_MANAGER.save_timeline_cache(self.filename_without_extension, function, area_range, m_z, timeline, self.CreationDate)
+            found = self.CATALYST_MANAGER.load_timelines_of_mz_values(self._get_cache_key(), area_range, function, mz_list)
+            for index, m_z in enumerate(mz_list):
+                cached_timeline, creation_date = found.get(m_z, (None, None))
+                if cached_timeline:
+                    self.CreationDate = creation_date
+                    cached_timelines[index] = cached_timeline
+
+        candidates = [index for index in range(len(mz_list)) if index not in cached_timelines]
+
+        if candidates or not mz_list:
+            content, (max_mz, min_mz) = self._get_timeline_source(function)
+            scans_length = len(self.FILE_CONTENT[function])
+        else:
+            # Timelines of a function all have one value per scan of the function
+            scans_length = max(len(timeline) for timeline in cached_timelines.values())
+
+        timelines = np.zeros((len(mz_list), scans_length), dtype=np.float64)
+        for index, cached_timeline in cached_timelines.items():
+            cached_timeline = cached_timeline[:scans_length]
+            timelines[index, :len(cached_timeline)] = cached_timeline
+
+        # Collect the m/z values that have to be extracted from the file content
+        missing = []
+        for index in candidates:
+            if not (min_mz - radius <= mz_list[index] <= max_mz + radius):
+                self.ErrorFunction(f"No data for given mass/charge value {mz_list[index]} in file.", "log print")
+                continue
 
-        return timeline
+            missing.append(index)
+
+        self.CallbackFunction(f"{len(mz_list) - len(missing)} timelines loaded from cache or without data, extracting {len(missing)} timelines from file.", "log print")
+
+        if missing:
+            mz_values = np.asarray(mz_list, dtype=np.float64)[missing]
+            timelines[missing] = content.get_average_intensities(mz_values - radius, mz_values + radius)
+
+            # Cache timelines if enabled as one batch, each with its share of the computing time
+            if use_cache:
+                compute_time = (time.time() - start_time) / len(missing)
+                self.CATALYST_MANAGER.save_timelines_of_mz_values(self._get_cache_key(), function, area_range,
+                                                                  {mz_list[index]: [average if average else 0 for average in timelines[index].tolist()] for index in missing},
+                                                                  self.CreationDate, compute_time)
+
+        self.CallbackFunction(f"Intensity timelines for {len(mz_list)} m/z values created.", "log print")
+
+        return timelines
 
     def get_all_intensity_timelines(self, area_range: float, start_value: float, end_value: float, function: int, num_processes: int, use_cache: bool):
         """
             Returns the intensity over time for mass/charge areas with a width of 2*radius from start_value to end_value for given function.
             This function also caches the results in a file in the cache folder if caching is enabled.
+            If the bin pyramid is enabled and radius and start_value are multiples of BIN_PYRAMID_BASE_RADIUS, the timelines are derived from the bin pyramid
+            of the function, so other sampling ranges reuse it from memory or the cache instead of reading the file again.
+            Otherwise only the peaks of the requested range are binned.
 
             Parameters:
                 area_range (float): Range of the mass/charge areas.
@@ -308,160 +2188,242 @@ class TextFileReader:
                 use_cache (bool): Flag to enable/disable caching.
 
             Returns:
-                Dictionary of lists with intensity over time for each mass/charge area for given function.
+                TimelineMatrix: Intensity over time for each mass/charge area with peaks for given function, sorted by m/z center.
         """
         start_time = time.time()
         self.CallbackFunction(f"Calculating all intensity timelines for {self.FILE_PATH}...", "log print")
 
         # Check if the file has already been processed and load results instead of calculating
         if use_cache:
-            cached_timelines, creation_date = self.CATALYST_MANAGER.load_timelines_from_cache(self.filename_without_extension, area_range, function, start_value, end_value)
+            cached_timelines, creation_date = self.CATALYST_MANAGER.load_timelines_from_cache(self._get_cache_key(), area_range, function, start_value, end_value)
 
             if cached_timelines:
                 self.CallbackFunction("Cache hit. Returning cached timelines.", "log print")
                 self.CreationDate = creation_date
-                return cached_timelines
+                return cached_timelines.get_mz_range(start_value, end_value)
             else:
                 self.CallbackFunction("Cache miss. Starting processing data.", "log print")
         else:
             self.CallbackFunction("Cache disabled. Starting processing data.", "log print")
 
-        # If the file has not been processed, start the processing
-        if not self.FILE_CONTENT or self.function != function:
-            self._read_content(function)
-
         radius = area_range / 2
 
+        # The pyramid covers all peaks of the function, it only pays off if it is reused for other sampling ranges and m/z ranges
+        if self.use_bin_pyramid and BinPyramid.supports(max(radius, 0.01), start_value):
+            pyramid = self._get_bin_pyramid(function, num_processes, use_cache)
+            max_mz, min_mz = pyramid.mz_bounds
+
+            # Ensure that the mz value exists in the file content by checking the min and max values in the file content
+            if max_mz < start_value - radius or min_mz > end_value + radius:
+                raise ValueError("No data for given m/z region in file.")
+
+            timelines = pyramid.get_timelines(radius, start_value, end_value)
+            self.CallbackFunction(f"Timelines derived from {len(pyramid)} cells of the bin pyramid.", "log print")
+        else:
+            timelines = self._bin_timelines(radius, start_value, end_value, function, num_processes)
+
+        if use_cache:
+            self.CATALYST_MANAGER.save_timelines_cache(self._get_cache_key(), function, area_range, start_value, end_value, timelines, self.CreationDate, time.time() - start_time)
+
+        self.CallbackFunction("All intensity timelines created.", "log print")
+        self.CallbackFunction(f"Processing time: {time.time() - start_time:.2f} seconds.", "log print")
+        return timelines
+
+    def _get_bin_pyramid(self, function: int, num_processes: int, use_cache: bool):
+        """
+            Returns the bin pyramid of the given function. It is kept in memory, loaded from the cache or computed from all peaks of the function.
+
+            Parameters:
+                function (int): Function number of the data.
+                num_processes (int): Number of processes to use.
+                use_cache (bool): Flag to enable/disable caching.
+
+            Returns:
+                BinPyramid: Fine cells of the function.
+
+            Raises:
+                ValueError: If the file has no data for the function.
+        """
+        if function in self.bin_pyramids:
+            return self.bin_pyramids[function]
+
+        pyramid = None
+        if use_cache:
+            pyramid, creation_date = self.CATALYST_MANAGER.load_bin_pyramid_from_cache(self._get_cache_key(), function)
+            if pyramid is not None:
+                self.CallbackFunction("Bin pyramid loaded from cache.", "log print")
+                self.CreationDate = creation_date
+
+        if pyramid is None:
+            start_time = time.time()
+            content, mz_bounds = self._get_function_content(function)
+
+            # Assure not to many processes are started, but at least one
+            num_processes = max(1, min(num_processes, cpu_count() - 2))
+
+            self.CallbackFunction(f"Computing bin pyramid of {len(content)} scans with {num_processes} processes...", "log print")
+            if num_processes > 1:
+                cell_ids, scan_positions, sums, counts = self._process_chunks_in_processes(function, num_processes, process_base_chunk, ())
+            else:
+                (cell_ids, scan_positions, sums, counts), message = process_base_chunk(content)
+                self.CallbackFunction(message, "log print")
+
+            pyramid = BinPyramid.from_cells(cell_ids, len(content), scan_positions, sums, counts, mz_bounds)
+
+            del cell_ids, scan_positions, sums, counts
+
+            if use_cache:
+                self.CATALYST_MANAGER.save_bin_pyramid_cache(self._get_cache_key(), function, pyramid, self.CreationDate, time.time() - start_time)
+
+        self.bin_pyramids[function] = pyramid
+        return pyramid
+
+    def _bin_timelines(self, radius: float, start_value: float, end_value: float, function: int, num_processes: int):
+        """
+            Computes the intensity over time for mass/charge areas with a width of 2*radius from start_value to end_value from the peaks of the function.
+
+            Parameters:
+                radius (float): 2*radius is width of mass/charge areas.
+                start_value (float): Lower limit for the starting point of the first mass/charge area (included).
+                end_value (float): Upper limit for the starting point of the last mass/charge area (excluded).
+                function (int): Function number to analyze from data.
+                num_processes (int): Number of processes to use.
+
+            Returns:
+                TimelineMatrix: Intensity over time for each mass/charge area with peaks, sorted by m/z center.
+        """
+        content, (max_mz, min_mz) = self._get_function_content(function)
+
         # Ensure that the mz value exists in the file content by checking the min and max values in the file content
-        if self.max_mz < start_value - radius or self.min_mz > end_value + radius:
+        if max_mz < start_value - radius or min_mz > end_value + radius:
             raise ValueError("No data for given m/z region in file.")
 
-        # Assure not to many processes are started
-        num_processes = min(num_processes, cpu_count() - 2)
-
-        # Prepare values for analyses
-        scans = list(self.FILE_CONTENT.items())
-        scans_length = len(scans)
-        chunk_size = max(1, scans_length // num_processes)
+        # Only read peaks that can fall into an area between start_value and end_value
+        mz_window = (start_value - 2 * radius, end_value + 2 * radius)
 
-        # List of lists of tuples with format (scan_number, [(mass/charge, intensity),(mass/charge, intensity), ...]), forms chunks to distribute to processes
-        scan_chunks = [scans[i * chunk_size: (i + 1) * chunk_size] for i in range(num_processes - 1)]
-        scan_chunks.append(scans[(num_processes - 1) * chunk_size: scans_length])
+        # Assure not to many processes are started, but at least one
+        num_processes = max(1, min(num_processes, cpu_count() - 2))
 
-        del scans
+        # Prepare values for analyses, the m/z window keeps all scans
+        scans_length = len(content)
 
-        # Compute sum of mass/charge areas for given scan chunks
+        # Compute sum of mass/charge areas for given scans
         if num_processes > 1: # Multi-process
             self.CallbackFunction(f"Starting {num_processes} processes to calculate timelines...", "log print")
-            with Pool(processes=num_processes) as pool:
-                results = pool.starmap(process_chunk, [(chunk, radius, start_value, end_value) for chunk in scan_chunks])
+            areas, scan_positions, sums, counts = self._process_chunks_in_processes(function, num_processes, process_chunk, (radius, start_value, end_value), mz_window)
         else: # Only use this process
             self.CallbackFunction(f"Starting {num_processes} process to calculate timelines...", "log print")
-            results = (process_chunk(chunk, radius, start_value, end_value) for chunk in scan_chunks)
+            (areas, scan_positions, sums, counts), message = process_chunk(self.get_scan_window(function, min_mz=mz_window[0], max_mz=mz_window[1]), radius, start_value, end_value)
+            self.CallbackFunction(message, "log print")
 
-        del scan_chunks
+        del content
 
-        results, messages = zip(*results)
+        # Areas with peaks form the rows of the matrix, chunks cover different scans, so every cell appears only once
+        area_ids, area_rows = np.unique(areas, return_inverse=True)
+        averages = sums / counts
 
-        for message in messages:
-            self.CallbackFunction(message, "log print")
+        del sums, counts
 
-        # Dictionary for complete timeline of mass/charge areas with lambda as default value for un-initialized keys (mass/charge areas)
-        all_timelines = defaultdict(lambda: [[0, 0] for _ in range(scans_length)])
+        step = 2 * max(radius, 0.01)
+        timelines = TimelineMatrix.from_cells([round(start_value + area_id * step, 2) for area_id in area_ids.tolist()], scans_length, area_rows, scan_positions, averages)
 
-        self.CallbackFunction("Combining chunks into complete timelines...", "log print")
+        del areas, scan_positions, area_rows, averages
 
-        # Combine timelines from all scan chunks
-        # Result contains all local timelines of a chunk as a dictionary with mass/charge as key and data is a list of lists (inner lists are [sumIntensity, amountMeasurements], index in list is can number)
-        for result in results:
-            for area, intensity_list in result.items():
-                for scan_nr, intensity_sum, count in intensity_list:
-                    all_timelines[area][scan_nr - 1][0] += intensity_sum
-                    all_timelines[area][scan_nr - 1][1] += count
+        return timelines
 
-        del results
+    def _process_chunks_in_processes(self, function: int, num_processes: int, kernel, kernel_arguments: tuple, mz_window: tuple = (None, None)):
+        """
+            Computes the cells of all scans of the function with kernel (process_chunk or process_base_chunk) in num_processes processes.
+            If the scans are backed by a scan sidecar, the processes map the sidecar themselves and read only the peaks of their chunk.
+            Scans parsed into memory are copied once into shared memory that the processes attach to. Either way only names and scan positions are sent to the processes,
+            and each process returns the cells of its chunk only.
+            Scans are split into many small tasks with about the same number of peaks, which are handed out to the processes as they become idle,
+            so scans with many peaks do not keep one process busy while the others wait.
 
-        # Dictionary to save timelines of all mass/charge areas
-        cached_timelines = {}
+            Parameters:
+                function (int): Function number of the scans.
+                num_processes (int): Number of processes to use.
+                kernel (function): Function computing the cells of a ScanStore, it has to be defined at module level to be sent to the processes.
+                kernel_arguments (tuple): Arguments passed to kernel after the scans.
+                mz_window (tuple): Lower (included) and upper (excluded) limit of the m/z values of the peaks to use, None for no limit. Default is no limits.
 
-        for area in all_timelines:
-            cached_timelines[str(area)] = [0 if scan[1] <= 0 else scan[0] / scan[1] for scan in all_timelines[area]]
+            Returns:
+                Tuple of arrays (area or cell index, scan position, intensity sum, peak count) with one entry per area and scan that has peaks.
+        """
+        start_time = time.perf_counter()
 
-        del all_timelines
+        content, _ = self._get_function_content(function)
+        min_mz, max_mz = mz_window
 
-        if use_cache:
-            self.CATALYST_MANAGER.save_timelines_cache(self.filename_without_extension, function, area_range, start_value, end_value, cached_timelines, self.CreationDate)
+        shared_block = None
+        if self.sidecar_path is not None:
+            # Scan positions that form chunks to distribute to processes, the processes restrict their chunk to the m/z window
+            chunk_bounds = _split_by_peaks(content.offsets, num_processes * _TASKS_PER_PROCESS)
+            sidecar_stat = os.stat(self.sidecar_path)
+            source = ("sidecar", self.sidecar_path, (sidecar_stat.st_size, sidecar_stat.st_mtime_ns), function, min_mz, max_mz)
+        else:
+            content = content.get_window(min_mz=min_mz, max_mz=max_mz)
+            chunk_bounds = _split_by_peaks(content.offsets, num_processes * _TASKS_PER_PROCESS)
+            shared_block, layout = _create_shared_arrays({
+                "scan_numbers": content.scan_numbers,
+                "offsets": content.offsets,
+                "mz": content.mz,
+                "intensity": content.intensity
+            })
+            source = ("shared", shared_block.name, layout)
+
+        del content
 
-        self.CallbackFunction("All intensity timelines created.", "log print")
-        self.CallbackFunction(f"Processing time: {time.time() - start_time:.2f} seconds.", "log print")
-        return cached_timelines
+        try:
+            with use_pool(self.worker_pool, num_processes) as pool:
+                results = list(pool.imap_unordered(_process_chunk_task, [(source, scan_start, scan_end, kernel, kernel_arguments)
+                                                                         for scan_start, scan_end in chunk_bounds]))
+        finally:
+            if shared_block is not None:
+                shared_block.close()
+                shared_block.unlink()
+
+        wall_time = time.perf_counter() - start_time
+
+        # Busy time and number of tasks of each process
+        busy_times = defaultdict(lambda: [0.0, 0])
+        for *_, process_id, busy_time in results:
+            busy_times[process_id][0] += busy_time
+            busy_times[process_id][1] += 1
+
+        for process_id, (busy_time, tasks) in busy_times.items():
+            self.CallbackFunction(f"Process {process_id}: Busy for {busy_time:.2f} of {wall_time:.2f} seconds with {tasks} tasks.", "log print")
+
+        self.CallbackFunction(f"Binned {len(chunk_bounds)} tasks in {wall_time:.2f} seconds, processes were busy {sum(busy for busy, _ in busy_times.values()) / (num_processes * wall_time) * 100:.0f}% of the time.", "log print")
+        self.CallbackFunction("Combining chunks into complete timelines...", "log print")
+
+        # Results arrive in any order, sort the cells of the tasks by scan position
+        results.sort(key=lambda result: result[0])
 
-    def _parse(self, function: int):
+        return tuple(np.concatenate([result[position] for result in results]) for position in range(1, 5))
+
+    def _parse(self, vectorized: bool = True):
         """
-            Parse an .ms1/.txt file and return a tuple of two dictionary with the scan number as key and a list of (m/z, intensity) tuples.
+            Parse an .ms1/.txt file in one pass and return a dictionary with the function number as key and a dictionary of its scans.
+            The file is split at scan boundaries into byte ranges which are parsed by self.num_processes processes and merged in file order.
 
             Parameters:
-                function (int): Number of the function to read from file.
+                vectorized (bool): Flag to convert whole peak blocks with NumPy instead of line by line. Default is True.
 
             Returns:
-                Dictionary of Lists: {scan_number: [(mass/charge, intensity),(mass/charge, intensity), ...], ...} for the given function.
-
-            Example:
-                {1: [(100.0, 2000), (101.0, 2100), (102.0, 1900)], 2: [...], ...}
+                Dictionary of ScanStores: {function_number: ScanStore, ...} for all functions.
         """
         self.CallbackFunction(f"Start parsing file at '{self.FILE_PATH}'.", "log print")
         start_time = time.time()
 
-        selected_function_data = {}
-
-        # Variables to cache data while parsing a scan and save it after finishing the scan
-        current_function = None
-        current_scan = None
-        current_data = []
-
-        def save_scan_data():
-            """Helper function to save current scan data if it matches the specified function."""
-            if current_function == function:
-                selected_function_data[current_scan] = current_data[:]
-
-        # Regex for detecting metadata efficiently
-        function_scan_regex = re.compile(r"function=(\d+)|scan=(\d+)")
-
-        # Open file from self.FILE_PATH
-        with open(self.FILE_PATH, 'r') as file:
-            for line in file:
-                first_char = line[0]
-                if first_char.isdigit():  # Data line, most frequent case
-                    if current_function == function:
-                        # Parsing of mass and intensity
-                        mass, intensity = line.split(maxsplit=1)
-                        current_data.append((float(mass), float(intensity)))
-
-                elif first_char == 'S':  # Scan boundary
-                    if current_function == function and current_scan is not None:
-                        save_scan_data()  # Save the previous scan's data
-
-                    # Reset scan data
-                    current_function = None
-                    current_scan = None
-                    current_data.clear()
-
-                elif first_char == 'I':  # Metadata, only after a scan boundary
-                    # Extract metadata with regex
-                    for match in function_scan_regex.findall(line):
-                        if match[0]:  # function=
-                            current_function = int(match[0])
-                        elif match[1]:  # scan=
-                            current_scan = int(match[1])
-                elif first_char == 'H':  # Header, only at the beginning of the file
-                    # Extract creation date
-                    if "CreationDate" in line:
-                        self.CreationDate = line.split("CreationDate", maxsplit=1)[1].strip()
+        all_function_data = defaultdict(list)
 
-            # Save the last scan
-            if current_function and current_scan:
-                save_scan_data()
+        # Parse byte ranges of the file given by self.FILE_PATH and merge their scans in file order
+        for parsed_scans, creation_date in _map_byte_ranges(_parse_byte_range, self.FILE_PATH, self.num_processes, lambda index: (vectorized,)):
+            for function, scan, mz_values, intensities in parsed_scans:
+                all_function_data[function].append((scan, mz_values, intensities))
+            self.CreationDate = self.CreationDate or creation_date
 
         self.CallbackFunction(f"Finished parsing in {time.time() - start_time:.2f} seconds.", "log print")
 
-        return selected_function_data
+        return {function: ScanStore.from_scans(scans) for function, scans in all_function_data.items()}
\ No newline at end of file
@@ -0,0 +1,237 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from multiprocessing.pool import Pool
+from src.catalyst_manager import CATALYST_manager
+from src.data_analysis.analyzer_helper import get_protein_mz_values
+from src.parse import TextFileReader, open_scan_sidecar
+from src.worker_pool import WorkerPool
+
+# File extensions of the data files that are prewarmed, the same the GUI accepts
+DATA_FILE_EXTENSIONS = (".ms1", ".txt")
+
+# Manager of the CATALYST directory of a prewarm worker process, created by _init_worker
+_catalyst_manager = None
+
+
+def _log_callback(message: str, mtype: str, tag=None):
+    """Callback function of the prewarm runs, messages are only written to the log."""
+    if "log" in mtype:
+        logging.info(message)
+
+def _log_error(message: str, mtype: str, tag=None):
+    """Error function of the prewarm runs, errors are only written to the log."""
+    if "log" in mtype:
+        logging.error(message)
+
+def create_catalyst_manager(catalyst_path: str):
+    """
+        Creates the manager of the CATALYST directory with the cache settings of the saved settings and logs to its log file.
+
+        Parameters:
+            catalyst_path (str): Path of the CATALYST directory, 'PROGRAMDATA' for the directory of the GUI.
+
+        Returns:
+            Tuple of the CATALYST_manager and the loaded Settings.
+    """
+    catalyst_manager = CATALYST_manager(catalyst_path=catalyst_path, callback_function=_log_callback, error_function=_log_error)
+
+    logging.basicConfig(
+        filename=catalyst_manager.LOG_PATH,
+        force=True,
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    settings = catalyst_manager.check()
+    catalyst_manager.set_cache_threshold(settings.advanced_settings.cache_size.value)
+    catalyst_manager.set_memory_cache_threshold(settings.advanced_settings.memory_cache_size.value)
+    catalyst_manager.set_cache_compression(settings.advanced_settings.compress_cache.value)
+    catalyst_manager.set_cache_eviction_policy(settings.advanced_settings.cache_eviction_policy.value)
+
+    return catalyst_manager, settings
+
+def find_data_files(directory: str, recursive: bool = False):
+    """
+        Returns the paths of the data files in a directory sorted by name.
+
+        Parameters:
+            directory (str): Directory to search.
+            recursive (bool): Flag to also search the subdirectories. Default is False.
+
+        Returns:
+            List of the paths of the data files.
+    """
+    if recursive:
+        paths = [os.path.join(root, filename) for root, _, filenames in os.walk(directory) for filename in filenames]
+    else:
+        paths = [os.path.join(directory, filename) for filename in os.listdir(directory)]
+
+    return sorted(path for path in paths if os.path.isfile(path) and path.lower().endswith(DATA_FILE_EXTENSIONS))
+
+def prewarm_file(catalyst_manager: CATALYST_manager, file_path: str, ligand_function: int, ligand_range: float, mz_ranges: list, protein_mz_values: list,
+                 protein_function: int, protein_range: float, num_processes: int = 1, use_mz_index: bool = False, worker_pool: WorkerPool = None,
+                 use_bin_pyramid: bool = False):
+    """
+        Builds the scan store of a data file and caches the timelines the analyses of it load.
+
+        Parameters:
+            catalyst_manager (CATALYST_manager): Manages the CATALYST directory.
+            file_path (str): Path of the data file.
+            ligand_function (int): Function of the ligand timelines, the timelines of all m/z areas of it are cached.
+            ligand_range (float): Sampling range of the ligand timelines.
+            mz_ranges (list): Tuples of start and end m/z of the ligand areas or None for the m/z range of the file the GUI sets when it is uploaded.
+            protein_mz_values (list): Mass/charge values of the protein charge states to cache the protein timelines of.
+            protein_function (int): Function of the protein timelines.
+            protein_range (float): Sampling range of the protein timelines.
+            num_processes (int): Number of processes to bin the timelines with. Default is 1.
+            use_mz_index (bool): Flag to build the m/z index of the file like the analyses do. Default is False.
+            worker_pool (WorkerPool): Long-lived pool of worker processes or None to start new pools. Default is None.
+            use_bin_pyramid (bool): Flag to derive the timelines from the bin pyramid of the functions like the analyses do. Default is False.
+
+        Returns:
+            float: Seconds it took to prewarm the file.
+    """
+    start_time = time.time()
+
+    if mz_ranges is None:
+        # The cache key contains the start and end m/z, so they are rounded to whole numbers like the GUI does
+        max_mz, min_mz = open_scan_sidecar(file_path, _log_callback, num_processes).get_max_and_min_mz()
+        mz_ranges = [(float(int(min_mz)), float(int(max_mz + 0.9999)))]
+
+    reader = TextFileReader(file_path=file_path, catalyst_manager=catalyst_manager, callback_function=_log_callback, error_function=_log_error,
+                            num_processes=num_processes, use_mz_index=use_mz_index, worker_pool=worker_pool, use_bin_pyramid=use_bin_pyramid)
+
+    for start_value, end_value in mz_ranges:
+        reader.get_all_intensity_timelines(area_range=ligand_range, start_value=start_value, end_value=end_value, function=ligand_function,
+                                           num_processes=num_processes, use_cache=True)
+
+    if protein_mz_values:
+        reader.get_intensity_timelines(mz_list=protein_mz_values, area_range=protein_range, function=protein_function, use_cache=True)
+
+    # Wait for the cache files, the process may end before the cache writer thread wrote them
+    catalyst_manager.flush_cache_writes()
+
+    return time.time() - start_time
+
+def _init_worker(catalyst_path: str):
+    """Initializer of the prewarm worker processes, each worker manages the shared CATALYST directory with its own manager."""
+    global _catalyst_manager
+    _catalyst_manager, _ = create_catalyst_manager(catalyst_path)
+
+def _prewarm_file_task(arguments: tuple):
+    """
+        Task of the prewarm worker processes, prewarms one file with one process.
+
+        Returns:
+            Tuple of the file path, the seconds it took and the error message or None.
+    """
+    file_path, ligand_function, ligand_range, mz_ranges, protein_mz_values, protein_function, protein_range, use_mz_index, use_bin_pyramid = arguments
+    try:
+        seconds = prewarm_file(_catalyst_manager, file_path, ligand_function, ligand_range, mz_ranges, protein_mz_values, protein_function, protein_range,
+                               use_mz_index=use_mz_index, use_bin_pyramid=use_bin_pyramid)
+        return file_path, seconds, None
+    except Exception as e:
+        logging.exception(f"Prewarming '{file_path}' failed.")
+        return file_path, 0.0, f"{type(e).__name__}: {e}"
+
+def main(argv: list = None):
+    """
+        Headless entry point that fills the cache for all data files in a directory, so the interactive analyses of them are cache hits.
+        Arguments that are not given default to the saved settings of the CATALYST directory.
+
+        Parameters:
+            argv (list): Command line arguments. Default is None for sys.argv.
+
+        Returns:
+            int: Exit code, 1 if a file could not be prewarmed and 0 otherwise.
+    """
+    argument_parser = argparse.ArgumentParser(description="Builds the scan stores and timeline caches of all data files in a directory.")
+    argument_parser.add_argument("directory", help="Directory of the .ms1/.txt data files.")
+    argument_parser.add_argument("--recursive", action="store_true", help="Also prewarm the data files in subdirectories.")
+    argument_parser.add_argument("--function-protein", type=int, help="Energy function of the protein.")
+    argument_parser.add_argument("--function-ligand", type=int, help="Energy function of the ligands.")
+    argument_parser.add_argument("--range-protein", type=float, help="Protein sampling range.")
+    argument_parser.add_argument("--range-ligand", type=float, help="Ligand sampling range.")
+    argument_parser.add_argument("--mz-range", type=float, nargs=2, action="append", metavar=("START", "END"),
+                                 help="Range of m/z values to cache the timelines of, can be given several times. Default is the m/z range of each file.")
+    argument_parser.add_argument("--protein-mz", type=float, help="Protein m/z.")
+    argument_parser.add_argument("--protein-charge-state", type=int, help="Protein charge state.")
+    argument_parser.add_argument("--charge-state-sum", type=int, help="Protein charge state sum range.")
+    argument_parser.add_argument("--jobs", type=int, default=max(1, multiprocessing.cpu_count() // 2),
+                                 help="Number of files prewarmed at once, each with one process.")
+    argument_parser.add_argument("--processes", type=int, help="Number of processes to bin the timelines of a file with if --jobs is 1.")
+    argument_parser.add_argument("--catalyst-path", default="PROGRAMDATA", help="Path of the CATALYST directory.")
+    arguments = argument_parser.parse_args(argv)
+
+    catalyst_manager, settings = create_catalyst_manager(arguments.catalyst_path)
+    general_settings = settings.general_settings
+
+    function_protein = general_settings.function_protein.value if arguments.function_protein is None else arguments.function_protein
+    function_ligand = general_settings.function_ligand.value if arguments.function_ligand is None else arguments.function_ligand
+    range_protein = general_settings.protein_sampling_range.value if arguments.range_protein is None else arguments.range_protein
+    range_ligand = general_settings.ligand_sampling_range.value if arguments.range_ligand is None else arguments.range_ligand
+    mz_ranges = arguments.mz_range
+    num_processes = settings.advanced_settings.parse_processes.value if arguments.processes is None else arguments.processes
+    use_mz_index = settings.advanced_settings.use_mz_index.value
+    use_bin_pyramid = settings.advanced_settings.use_bin_pyramid.value
+    protein_mz = general_settings.protein_mz.value if arguments.protein_mz is None else arguments.protein_mz
+    protein_charge_state = general_settings.protein_charge_state.value if arguments.protein_charge_state is None else arguments.protein_charge_state
+    charge_state_sum = settings.advanced_settings.charge_state_sum.value if arguments.charge_state_sum is None else arguments.charge_state_sum
+
+    # Protein timelines are looked up by exact m/z, so the m/z values of the charge states are computed like the targeted and untargeted analyses do
+    if protein_mz and protein_charge_state:
+        protein_mz_values = list(dict.fromkeys(get_protein_mz_values(protein_mz, protein_charge_state, charge_state_sum) +
+                                               get_protein_mz_values(protein_mz, protein_charge_state, charge_state_sum, targeted=True)))
+    else:
+        protein_mz_values = []
+        print("No protein m/z and charge state set, protein timelines are not prewarmed.")
+
+    file_paths = find_data_files(arguments.directory, arguments.recursive)
+    jobs = max(1, min(arguments.jobs, len(file_paths)))
+    print(f"Prewarming {len(file_paths)} data files with {jobs} jobs.")
+
+    start_time = time.time()
+    failed = 0
+
+    def report(file_path: str, seconds: float, error: str):
+        nonlocal failed
+        if error is None:
+            print(f"'{file_path}' prewarmed in {seconds:.2f} seconds.")
+        else:
+            failed += 1
+            print(f"ERROR: '{file_path}' could not be prewarmed. {error}")
+
+    if jobs == 1:
+        # One file at a time in this process, binned with the worker processes of the settings
+        worker_pool = WorkerPool()
+        try:
+            for file_path in file_paths:
+                try:
+                    report(file_path, prewarm_file(catalyst_manager, file_path, function_ligand, range_ligand, mz_ranges, protein_mz_values, function_protein,
+                                                   range_protein, num_processes, use_mz_index, worker_pool, use_bin_pyramid), None)
+                except Exception as e:
+                    logging.exception(f"Prewarming '{file_path}' failed.")
+                    report(file_path, 0.0, f"{type(e).__name__}: {e}")
+        finally:
+            worker_pool.shutdown()
+    else:
+        # Worker processes can not start pools themselves, so each file is prewarmed with one process
+        tasks = [(file_path, function_ligand, range_ligand, mz_ranges, protein_mz_values, function_protein, range_protein, use_mz_index, use_bin_pyramid)
+                 for file_path in file_paths]
+        with Pool(processes=jobs, initializer=_init_worker, initargs=(arguments.catalyst_path,)) as pool:
+            for result in pool.imap_unordered(_prewarm_file_task, tasks):
+                report(*result)
+
+    print(f"Prewarmed {len(file_paths) - failed} of {len(file_paths)} data files in {time.time() - start_time:.2f} seconds.")
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Necessary for PyInstaller
+    multiprocessing.set_start_method("spawn")  # Ensures proper behavior on Windows
+    sys.exit(main())
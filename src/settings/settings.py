@@ -76,7 +76,12 @@ class Advanced_settings:
         self.parse_processes = Setting("parse_processes", "Num of parse processes", 1, int)
         self.analysis_processes = Setting("analysis_processes", "Num of analysis processes", 4, int)
         self.cache_size = Setting("cache_size", "Max cache size (GB)", 2.0, float)
+        self.memory_cache_size = Setting("memory_cache_size", "Max memory cache size (GB)", 1.0, float)
         self.use_cache = Setting("use_cache", "Use cache", True, bool)
+        self.compress_cache = Setting("compress_cache", "Compress cache", False, bool)
+        self.cache_eviction_policy = Setting("cache_eviction_policy", "Cache eviction policy", "LRU", str)
+        self.use_mz_index = Setting("use_mz_index", "Use m/z index", False, bool)
+        self.use_bin_pyramid = Setting("use_bin_pyramid", "Use bin pyramid", False, bool)
 
     def get_settings(self):
         """
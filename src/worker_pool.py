@@ -0,0 +1,168 @@
+import importlib
+import math
+import queue
+import threading
+from contextlib import contextmanager
+from multiprocessing.pool import Pool
+
+# Modules every worker imports when it starts, so tasks do not pay for the imports
+PRELOADED_MODULES = ("numpy", "scipy.signal", "fastdtw", "src.parse", "src.data_analysis.analyzer")
+
+
+def _preload_modules():
+    """Initializer of the worker processes, imports the modules used by the analyses."""
+    for module in PRELOADED_MODULES:
+        importlib.import_module(module)
+
+def _run_task_chunk(function, items: list):
+    """Runs function for every item of a chunk of tasks in a worker process."""
+    return [function(item) for item in items]
+
+class BoundedPool:
+    """
+        View of a shared pool that runs at most num_processes tasks of a call at a time.
+        The shared pool keeps the processes of the biggest run, so a run that asked for fewer processes still only uses as many as it asked for.
+    """
+    def __init__(self, pool: Pool, num_processes: int):
+        """
+            Class to limit the tasks of a run on a shared pool.
+
+            Parameters:
+                pool (multiprocessing.pool.Pool): Shared pool with at least num_processes processes.
+                num_processes (int): Maximal number of tasks running at once.
+
+            Returns:
+                Instance of the class.
+        """
+        self.pool = pool
+        self.num_processes = max(1, num_processes)
+
+    def _run_chunks(self, function, iterable, chunksize: int):
+        """
+            Runs function for all items in chunks of chunksize items, at most num_processes chunks are handed to the pool at once.
+
+            Yields:
+                Tuple of the position of a chunk and the list of its results, in the order the chunks finish.
+
+            Raises:
+                Exception: The first exception raised by function.
+        """
+        items = list(iterable)
+        chunks = [items[start:start + chunksize] for start in range(0, len(items), chunksize)]
+        finished = queue.SimpleQueue()
+
+        next_chunk = 0
+        running = 0
+        while next_chunk < len(chunks) or running:
+            # Hand out the next chunks as soon as processes of this run are idle
+            while running < self.num_processes and next_chunk < len(chunks):
+                self.pool.apply_async(_run_task_chunk, (function, chunks[next_chunk]),
+                                      callback=lambda results, position=next_chunk: finished.put((position, results, None)),
+                                      error_callback=lambda error, position=next_chunk: finished.put((position, None, error)))
+                next_chunk += 1
+                running += 1
+
+            position, results, error = finished.get()
+            running -= 1
+            if error is not None:
+                raise error
+
+            yield position, results
+
+    def imap_unordered(self, function, iterable, chunksize: int = 1):
+        """
+            Like multiprocessing.pool.Pool.imap_unordered with at most num_processes tasks running at once.
+
+            Yields:
+                Results of function for all items, in the order they finish.
+        """
+        for _, results in self._run_chunks(function, iterable, max(1, chunksize)):
+            yield from results
+
+    def map(self, function, iterable, chunksize: int = None):
+        """
+            Like multiprocessing.pool.Pool.map with at most num_processes tasks running at once.
+
+            Returns:
+                List of the results of function for all items, in the order of the items.
+        """
+        items = list(iterable)
+        if chunksize is None:
+            chunksize = math.ceil(len(items) / (4 * self.num_processes))
+
+        chunk_results = dict(self._run_chunks(function, items, max(1, chunksize)))
+
+        return [result for position in sorted(chunk_results) for result in chunk_results[position]]
+
+class WorkerPool:
+    """
+        Long-lived pool of worker processes owned by the application.
+        The pool is created on first use and reused by all analyses until shutdown is called, so the worker processes are only started
+        and import NumPy/SciPy/fastdtw once.
+    """
+    def __init__(self):
+        """
+            Class to share one pool of worker processes between analyses.
+
+            Returns:
+                Instance of the class.
+        """
+        self.pool = None
+        self.num_processes = 0
+
+        # Pools replaced by a bigger pool, they finish their tasks and are joined on shutdown
+        self.retired_pools = []
+        self.lock = threading.Lock()
+
+    def get_pool(self, num_processes: int):
+        """
+            Returns the pool, it is created if it does not exist yet and replaced by a bigger pool if it has less than num_processes processes.
+
+            Parameters:
+                num_processes (int): Minimal number of processes of the pool.
+
+            Returns:
+                multiprocessing.pool.Pool: Pool with at least num_processes processes.
+        """
+        with self.lock:
+            if self.pool is None or self.num_processes < num_processes:
+                if self.pool is not None:
+                    self.pool.close()
+                    self.retired_pools.append(self.pool)
+
+                self.pool = Pool(processes=num_processes, initializer=_preload_modules)
+                self.num_processes = num_processes
+
+            return self.pool
+
+    def shutdown(self):
+        """
+            Stops all worker processes after they finished their current tasks.
+        """
+        with self.lock:
+            pools = self.retired_pools + ([self.pool] if self.pool is not None else [])
+            self.pool = None
+            self.num_processes = 0
+            self.retired_pools = []
+
+        for pool in pools:
+            pool.close()
+            pool.join()
+
+@contextmanager
+def use_pool(worker_pool: WorkerPool, num_processes: int):
+    """
+        Yields the pool of worker_pool limited to num_processes tasks at a time or, if worker_pool is None, a new pool that is closed afterward.
+
+        Parameters:
+            worker_pool (WorkerPool): Long-lived pool of the application or None.
+            num_processes (int): Number of processes the pool needs.
+
+        Yields:
+            multiprocessing.pool.Pool or BoundedPool: Pool that runs num_processes tasks at once.
+    """
+    if worker_pool is None:
+        with Pool(processes=num_processes) as pool:
+            yield pool
+    else:
+        yield BoundedPool(worker_pool.get_pool(num_processes), num_processes)